@@ -0,0 +1,435 @@
+#!/usr/bin/python
+"""
+This file is part of etxd: A daemon for to measure the Exptected Transmission
+Count (ETX)
+
+This file contains the runtime based on the asyncio module of the Python
+standard library. It runs the same EtxProbeProtocol, IPC request handling and
+EtxWebServer as the Twisted runtime, but does not need Twisted, twisted.web or
+simplejson, which reduces the start-up time and the memory footprint of the
+daemon on small nodes. The classes in this file merely adapt the asyncio
+protocols and transports to the (small) subset of the Twisted interfaces the
+shared classes use.
+
+Sockets are created and bound synchronously, so errors are reported to the
+caller the same way as with the Twisted reactor, and only then handed over to
+the event loop.
+
+
+Authors:    Matthias Philipp <mphilipp@inf.fu-berlin.de>,
+            Felix Juraschek <fjuraschek@gmail.com>
+
+Copyright 2008-2013, Freie Universitaet Berlin (FUB). All rights reserved.
+
+These sources were developed at the Freie Universitaet Berlin,
+Computer Systems and Telematics / Distributed, embedded Systems (DES) group
+(http://cst.mi.fu-berlin.de, http://www.des-testbed.net)
+-------------------------------------------------------------------------------
+This program is free software: you can redistribute it and/or modify it under
+the terms of the GNU General Public License as published by the Free Software
+Foundation, either version 3 of the License, or (at your option) any later
+version.
+
+This program is distributed in the hope that it will be useful, but WITHOUT
+ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License along with
+this program. If not, see http://www.gnu.org/licenses/ .
+--------------------------------------------------------------------------------
+For further information and questions please use the web site
+       http://www.des-testbed.net
+
+"""
+
+import asyncio
+import os
+import socket
+import struct
+from concurrent.futures import ThreadPoolExecutor
+from email.utils import formatdate
+from syslog import *
+from etx_log import syslog
+
+from etx_runtime import CannotListenError, Runtime, remove_stale_socket
+from etx_ipc import (MAX_REQUEST, MESSAGE_HEADER, encode_message, handle_binary_request,
+                     handle_datagram, handle_request)
+
+
+class _Address:
+    """Equivalent of the address objects returned by getHost() in Twisted.
+
+    """
+    def __init__(self, host, port):
+        self.host = host
+        self.port = port
+
+
+class _Port:
+    """Equivalent of the IListeningPort objects returned by the Twisted
+    reactor. The transport (or server) is set as soon as the event loop has
+    taken over the socket.
+
+    """
+    def __init__(self, sock, host, port):
+        self.socket = sock
+        self.address = _Address(host, port)
+        self.transport = None
+        self.stopped = False
+
+    def getHost(self):
+        return self.address
+
+    def stopListening(self):
+        self.stopped = True
+        if self.transport is not None:
+            self.transport.close()
+        else:
+            self.socket.close()
+
+
+class _DatagramTransport:
+    """Provides the subset of the Twisted datagram transport that is used by
+    EtxProbeProtocol.
+
+    """
+    def __init__(self, transport, port):
+        self._transport = transport
+        self._port = port
+        self.socket = port.socket
+
+    def getHost(self):
+        return self._port.getHost()
+
+    def write(self, datagram, addr):
+        self._transport.sendto(datagram, addr)
+
+
+class _DatagramAdapter(asyncio.DatagramProtocol):
+    """Forwards the asyncio datagram events to an EtxProbeProtocol.
+
+    """
+    def __init__(self, protocol, port):
+        self.protocol = protocol
+        self.port = port
+
+    def connection_made(self, transport):
+        self.protocol.transport = _DatagramTransport(transport, self.port)
+        self.protocol.startProtocol()
+
+    def datagram_received(self, data, addr):
+        self.protocol.datagramReceived(data, addr)
+
+    def error_received(self, exc):
+        syslog(LOG_WARNING, "%s: error on probe socket: %s"
+                            % (self.protocol.if_name, exc))
+
+
+class _IpcProtocol(asyncio.Protocol):
+    """Line based IPC protocol, equivalent to EtxIpcProtocol. Like the Twisted
+    version, the connection is closed after the first request.
+
+    """
+    MAX_LENGTH = 16384
+
+    def __init__(self, interfaces):
+        self.interfaces = interfaces
+        self.buffer = b""
+
+    def connection_made(self, transport):
+        self.transport = transport
+        peer = transport.get_extra_info('peername')
+        syslog(LOG_INFO, "Handling IPC connection from %s:%s" % peer[:2])
+
+    def data_received(self, data):
+        self.buffer += data
+        if b"\n" not in self.buffer:
+            if len(self.buffer) > self.MAX_LENGTH:
+                self.transport.close()
+            return
+        request = self.buffer.split(b"\n", 1)[0]
+        self.transport.write(handle_request(self.interfaces,
+                                            request.decode("ascii", "replace")))
+        self.transport.close()
+
+
+class _UnixIpcProtocol(asyncio.Protocol):
+    """Binary IPC protocol of the Unix domain stream socket, equivalent to
+    EtxUnixIpcProtocol. The connection is kept open for further requests.
+
+    """
+    def __init__(self, interfaces):
+        self.interfaces = interfaces
+        self.buffer = b""
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def data_received(self, data):
+        self.buffer += data
+        header = struct.calcsize(MESSAGE_HEADER)
+        while len(self.buffer) >= header:
+            length, = struct.unpack_from(MESSAGE_HEADER, self.buffer)
+            if length > MAX_REQUEST:
+                self.transport.close()
+                return
+            if len(self.buffer) < header + length:
+                return
+            request = self.buffer[header:header + length]
+            self.buffer = self.buffer[header + length:]
+            self.transport.write(encode_message(handle_binary_request(self.interfaces,
+                                                                      request)))
+
+
+class _UnixDatagramProtocol(asyncio.DatagramProtocol):
+    """Binary IPC protocol of the Unix domain datagram socket, equivalent to
+    EtxUnixDatagramProtocol.
+
+    """
+    def __init__(self, interfaces):
+        self.interfaces = interfaces
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, addr):
+        # clients without an address cannot receive the response
+        if not addr:
+            return
+        self.transport.sendto(handle_datagram(self.interfaces, data), addr)
+
+    def error_received(self, exc):
+        # the client has gone
+        pass
+
+
+class _HttpProtocol(asyncio.Protocol):
+    """Minimal HTTP/1.1 server that answers GET requests with the JSON
+    document of an EtxWebServer. Persistent connections are supported.
+
+    """
+    MAX_LENGTH = 16384
+
+    def __init__(self, web_server):
+        self.web_server = web_server
+        self.buffer = b""
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def data_received(self, data):
+        self.buffer += data
+        while b"\r\n\r\n" in self.buffer:
+            head, self.buffer = self.buffer.split(b"\r\n\r\n", 1)
+            lines = head.decode("latin-1").split("\r\n")
+            request_line = lines[0].split()
+            if len(request_line) != 3:
+                self._respond("HTTP/1.0", "400 Bad Request", "", False)
+                return
+            method, path, version = request_line
+            headers = {}
+            for line in lines[1:]:
+                key, _, value = line.partition(":")
+                headers[key.strip().lower()] = value.strip()
+            # discard a request body, if any
+            try:
+                length = int(headers.get("content-length", 0) or 0)
+            except ValueError:
+                length = -1
+            if length < 0:
+                self._respond(version, "400 Bad Request", "", False)
+                return
+            if len(self.buffer) < length:
+                self.buffer = head + b"\r\n\r\n" + self.buffer
+                return
+            self.buffer = self.buffer[length:]
+            connection = headers.get("connection", "").lower()
+            if version == "HTTP/1.1":
+                keep_alive = connection != "close"
+            else:
+                keep_alive = connection == "keep-alive"
+            if method in ("GET", "HEAD"):
+                etag, body = self.web_server.render(path)
+                # answer conditional requests if the document is unchanged
+                tags = headers.get("if-none-match", "").split()
+                if etag in tags or "*" in tags:
+                    self._respond(version, "304 Not Modified", "", keep_alive,
+                                  True, etag)
+                else:
+                    self._respond(version, "200 OK", body, keep_alive,
+                                  method == "HEAD", etag)
+            else:
+                self._respond(version, "405 Method Not Allowed", "", keep_alive)
+            if not keep_alive:
+                return
+        if len(self.buffer) > self.MAX_LENGTH:
+            self.transport.close()
+
+    def _respond(self, version, status, body, keep_alive, head_only=False,
+                 etag=None):
+        body = body.encode("utf-8")
+        header = ["%s %s" % (version, status),
+                  "Date: %s" % formatdate(usegmt=True),
+                  "Connection: %s" % (keep_alive and "keep-alive" or "close"),
+                  "Content-Type: text/html",
+                  "Content-Length: %d" % len(body),
+                  "Server: etxd"]
+        if etag is not None:
+            header.append("ETag: %s" % etag)
+        header.extend(["", ""])
+        self.transport.write("\r\n".join(header).encode("latin-1"))
+        if not head_only:
+            self.transport.write(body)
+        if not keep_alive:
+            self.transport.close()
+
+
+class AsyncioRuntime(Runtime):
+    """Runtime based on the asyncio event loop of the standard library.
+
+    """
+    name = "asyncio"
+
+    def __init__(self):
+        Runtime.__init__(self)
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self.loop.set_exception_handler(self._handle_exception)
+        self.executor = ThreadPoolExecutor(Runtime.THREADS)
+
+    def _call_in_thread(self, func, args, finished):
+        def done(future):
+            if future.exception() is not None:
+                finished(None, future.exception())
+            else:
+                finished(future.result(), None)
+        self.loop.run_in_executor(self.executor, func, *args).add_done_callback(done)
+
+    def _handle_exception(self, loop, context):
+        syslog(LOG_ERR, "Unhandled error in event loop: %s (%s)"
+                        % (context.get("message"), context.get("exception")))
+
+    def call_later(self, delay, func, *args):
+        """Calls func with the given arguments after delay seconds.
+
+        """
+        return self.loop.call_later(delay, func, *args)
+
+    def call_when_running(self, func, *args):
+        """Calls func with the given arguments as soon as the event loop runs.
+
+        """
+        self.loop.call_soon(func, *args)
+
+    def _bind(self, sock_type, port, interface):
+        """Creates a non-blocking socket bound to the given address.
+
+        """
+        sock = socket.socket(socket.AF_INET, sock_type)
+        try:
+            if sock_type == socket.SOCK_STREAM:
+                sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            sock.bind((interface, port))
+            if sock_type == socket.SOCK_STREAM:
+                sock.listen(10)
+            sock.setblocking(False)
+        except (socket.error, OSError):
+            sock.close()
+            raise CannotListenError(interface, port)
+        return sock
+
+    def _bind_unix(self, sock_type, path):
+        """Creates a non-blocking Unix domain socket bound to path.
+
+        """
+        remove_stale_socket(path)
+        sock = socket.socket(socket.AF_UNIX, sock_type)
+        try:
+            sock.bind(path)
+            # like Twisted, allow all local users to connect
+            os.chmod(path, 0o666)
+            if sock_type == socket.SOCK_STREAM:
+                sock.listen(10)
+            sock.setblocking(False)
+        except (socket.error, OSError):
+            sock.close()
+            raise CannotListenError(path)
+        return sock
+
+    def _start(self, port, coroutine):
+        """Hands the bound socket of the port over to the event loop.
+
+        """
+        def started(task):
+            if task.exception() is not None:
+                syslog(LOG_ERR, "Unable to listen at %s:%s: %s" % (port.address.host,
+                                port.address.port, task.exception()))
+                return
+            server = task.result()
+            if isinstance(server, tuple):
+                # datagram endpoints return (transport, protocol)
+                server = server[0]
+            if port.stopped:
+                server.close()
+            else:
+                port.transport = server
+        task = self.loop.create_task(coroutine)
+        task.add_done_callback(started)
+        return port
+
+    def listen_udp(self, port, protocol, interface):
+        """Starts the datagram protocol at the given address. Returns an
+        object that provides stopListening() and getHost().
+
+        """
+        sock = self._bind(socket.SOCK_DGRAM, port, interface)
+        listening_port = _Port(sock, interface, port)
+        return self._start(listening_port, self.loop.create_datagram_endpoint(
+            lambda: _DatagramAdapter(protocol, listening_port), sock=sock))
+
+    def listen_ipc(self, port, interfaces, interface):
+        """Starts the IPC protocol at the given address. Returns an object
+        that provides stopListening().
+
+        """
+        sock = self._bind(socket.SOCK_STREAM, port, interface)
+        return self._start(_Port(sock, interface, port), self.loop.create_server(
+            lambda: _IpcProtocol(interfaces), sock=sock))
+
+    def listen_unix(self, path, interfaces, datagram=False):
+        """Starts the binary IPC protocol at the Unix domain stream socket or
+        datagram socket at path. Returns an object that provides
+        stopListening().
+
+        """
+        if datagram:
+            sock = self._bind_unix(socket.SOCK_DGRAM, path)
+            return self._start(_Port(sock, path, None), self.loop.create_datagram_endpoint(
+                lambda: _UnixDatagramProtocol(interfaces), sock=sock))
+        sock = self._bind_unix(socket.SOCK_STREAM, path)
+        return self._start(_Port(sock, path, None), self.loop.create_unix_server(
+            lambda: _UnixIpcProtocol(interfaces), sock=sock))
+
+    def listen_web(self, port, web_server, interface):
+        """Serves the given EtxWebServer at the given address. Returns an
+        object that provides stopListening().
+
+        """
+        sock = self._bind(socket.SOCK_STREAM, port, interface)
+        return self._start(_Port(sock, interface, port), self.loop.create_server(
+            lambda: _HttpProtocol(web_server), sock=sock))
+
+    def run(self):
+        """Runs the event loop until stop() is called.
+
+        """
+        try:
+            self.loop.run_forever()
+        finally:
+            self.loop.close()
+
+    def stop(self):
+        """Stops the event loop.
+
+        """
+        self.loop.stop()
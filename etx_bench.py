@@ -0,0 +1,564 @@
+#!/usr/bin/python
+"""
+This file is part of etxd: A daemon for to measure the Exptected Transmission
+Count (ETX)
+
+This file contains the benchmark harness of etxd. Each benchmark is selected
+by its name on the command line and prints its results as plain text:
+
+    python etx_bench.py runtime [-n repeats]
+
+        starts the probe protocol, the IPC server and the web server on the
+        loopback interface with each available runtime in a fresh process and
+        reports the start-up time and the peak memory usage (RSS).
+
+    python etx_bench.py ipc [-k neighbors] [-n repeats]
+
+        compares the server CPU time to answer the quality and ETX of k
+        neighbors with single QUALITY/ETX requests, with batch requests and
+        with a single DUMP request.
+
+    python etx_bench.py unix [-k neighbors] [-n requests] [-r runtime]
+
+        serves k neighbors in a fresh process and compares the latency and
+        the CPU time of the client and of the server per request over the TCP
+        text interface and over the Unix domain stream and datagram sockets
+        with the binary encoding, for QUALITY of a single neighbor and for
+        DUMP.
+
+    python etx_bench.py probe [-k neighbors] [-n seconds]
+
+        receives the probes of k/100, k/10 and k neighbors for n seconds and
+        reports the CPU time of each sent probe, of each received probe and
+        of the expiry once per interval after the first window, when the
+        buffer has been filled, and the size of the sent probes in
+        the pickle format and from the incrementally patched buffer of the
+        compact binary format (etxd -B).
+
+    python etx_bench.py replay [-k neighbors] [-n seconds]
+
+        records a synthetic trace of n seconds with k neighbors that lose
+        probes at random, a tenth of them falling silent for 30 seconds
+        every minute, in both probe formats and reports the throughput of
+        etx_replay.py and whether the replay reproduces the recorded link
+        tables.
+
+    python etx_bench.py schedule [-k nodes] [-n seconds]
+
+        simulates the probes of k nodes in a single collision domain for n
+        seconds with the random jitter and with the slot scheduler and
+        reports the share of collided probes and the mean ETX of the links,
+        which is 1.0 without collisions.
+
+
+Authors:    Matthias Philipp <mphilipp@inf.fu-berlin.de>,
+            Felix Juraschek <fjuraschek@gmail.com>
+
+Copyright 2008-2013, Freie Universitaet Berlin (FUB). All rights reserved.
+
+These sources were developed at the Freie Universitaet Berlin,
+Computer Systems and Telematics / Distributed, embedded Systems (DES) group
+(http://cst.mi.fu-berlin.de, http://www.des-testbed.net)
+-------------------------------------------------------------------------------
+This program is free software: you can redistribute it and/or modify it under
+the terms of the GNU General Public License as published by the Free Software
+Foundation, either version 3 of the License, or (at your option) any later
+version.
+
+This program is distributed in the hope that it will be useful, but WITHOUT
+ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License along with
+this program. If not, see http://www.gnu.org/licenses/ .
+--------------------------------------------------------------------------------
+For further information and questions please use the web site
+       http://www.des-testbed.net
+
+"""
+
+import getopt
+import os
+import random
+import resource
+import socket
+import subprocess
+import sys
+import time
+
+try:
+    cpu_time = time.process_time
+except AttributeError:
+    # Python 2
+    cpu_time = time.clock
+
+from etx_runtime import RUNTIMES, create_runtime
+from etx_data import EtxData
+from etx_probe import EtxProbeProtocol
+from etx_web import EtxWebServer
+
+
+class _Interface:
+    """Minimal stand-in for etxd.Interface.
+
+    """
+    def __init__(self, if_name, data):
+        self.name = if_name
+        self.data = data
+
+
+class _Transport:
+    """Discards the probes sent by the benchmarks, only the size of the last
+    one is kept.
+
+    """
+    host = "<broadcast>"
+    port = 0
+    size = 0
+
+    def getHost(self):
+        return self
+
+    def write(self, datagram, addr):
+        self.size = len(datagram)
+
+
+def _free_port():
+    """Returns a TCP/UDP port number that is currently unused on loopback.
+
+    """
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.bind(("127.0.0.1", 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    return port
+
+
+def runtime_child(name, port):
+    """Runs in the child process of the runtime benchmark: starts all
+    listeners with the given runtime, answers one IPC request and prints the
+    peak RSS in kB once the event loop is running.
+
+    """
+    runtime = create_runtime(name)
+    data = EtxData("127.0.0.1")
+    interfaces = {"lo": _Interface("lo", data)}
+    runtime.listen_udp(port, EtxProbeProtocol("lo", "127.0.0.1", data), "127.0.0.1")
+    runtime.listen_ipc(port, interfaces, "127.0.0.1")
+    runtime.listen_web(port + 1, EtxWebServer(interfaces, "bench"), "127.0.0.1")
+
+    def ready():
+        sys.stdout.write("%d\n" % resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+        sys.stdout.flush()
+        runtime.stop()
+    runtime.call_when_running(runtime.call_later, 0, ready)
+    runtime.run()
+
+
+def bench_runtime(repeats):
+    """Compares the start-up time and memory usage of the runtimes.
+
+    """
+    print("%-8s %12s %12s" % ("runtime", "startup [ms]", "max RSS [kB]"))
+    for name in RUNTIMES:
+        startup = []
+        rss = []
+        for i in range(repeats):
+            start = time.time()
+            child = subprocess.Popen([sys.executable, os.path.abspath(__file__),
+                                      "_runtime", name, str(_free_port())],
+                                     stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+            output, errors = child.communicate()
+            if child.returncode != 0:
+                break
+            startup.append(time.time() - start)
+            rss.append(int(output))
+        if not startup:
+            print("%-8s unavailable: %s" % (name, errors.decode("ascii", "replace").strip().splitlines()[-1]))
+            continue
+        startup.sort()
+        rss.sort()
+        print("%-8s %12.1f %12d" % (name, 1000 * startup[len(startup) // 2],
+                                    rss[len(rss) // 2]))
+
+
+def _fill_data(data, num_neighbors, now):
+    """Fills the EtxData object with num_neighbors neighbors that have
+    received all probes during the last window.
+
+    """
+    neighbors = ["10.%d.%d.%d" % (i // 65536, (i // 256) % 256, i % 256 + 1)
+                 for i in range(num_neighbors)]
+    expected = EtxData.WINDOW // EtxData.INTERVAL
+    for neighbor in neighbors:
+        data.set_mac(neighbor, "00:11:22:33:44:55")
+        data.set_neighbor_info(neighbor, {data.ip_address: (expected, expected)})
+        for i in range(expected):
+            data.add_timestamp(neighbor, now - i * EtxData.INTERVAL)
+    return neighbors
+
+
+def bench_ipc(num_neighbors, repeats):
+    """Compares single requests with batch requests.
+
+    """
+    from etx_ipc import handle_request
+    EtxData.WINDOW = 10
+    EtxData.INTERVAL = 1
+    data = EtxData("10.255.255.254")
+    neighbors = _fill_data(data, num_neighbors, time.time() + 3600)
+    interfaces = {"wlan0": _Interface("wlan0", data)}
+
+    def single():
+        for neighbor in neighbors:
+            handle_request(interfaces, "QUALITY %s" % neighbor)
+            handle_request(interfaces, "ETX %s" % neighbor)
+
+    def batch():
+        handle_request(interfaces, "QUALITY %s" % " ".join(neighbors))
+        handle_request(interfaces, "ETX %s" % " ".join(neighbors))
+
+    def dump():
+        handle_request(interfaces, "DUMP")
+
+    print("%-8s %9s %14s" % ("request", "requests", "CPU time [us]"))
+    for name, func, count in (("single", single, 2 * num_neighbors),
+                              ("batch", batch, 2), ("dump", dump, 1)):
+        start = cpu_time()
+        for i in range(repeats):
+            func()
+        stop = cpu_time()
+        print("%-8s %9d %14.1f" % (name, count, 1e6 * (stop - start) / repeats))
+
+
+def unix_child(name, port, path, num_neighbors):
+    """Runs in the child process of the Unix domain socket benchmark: serves
+    the IPC requests for num_neighbors neighbors over TCP and the Unix domain
+    sockets and prints a line once the event loop is running.
+
+    """
+    from etx_ipc import DATAGRAM_SUFFIX
+    runtime = create_runtime(name)
+    EtxData.WINDOW = 10
+    EtxData.INTERVAL = 1
+    data = EtxData("10.255.255.254")
+    _fill_data(data, num_neighbors, time.time() + 3600)
+    interfaces = {"wlan0": _Interface("wlan0", data)}
+    runtime.listen_ipc(port, interfaces, "127.0.0.1")
+    runtime.listen_unix(path, interfaces)
+    runtime.listen_unix(path + DATAGRAM_SUFFIX, interfaces, True)
+
+    def ready():
+        sys.stdout.write("ready\n")
+        sys.stdout.flush()
+    runtime.call_when_running(ready)
+    runtime.run()
+
+
+def _process_cpu_time(pid):
+    """Returns the CPU time of the process in seconds (Linux only).
+
+    """
+    stat_file = open("/proc/%d/stat" % pid)
+    fields = stat_file.read().rsplit(")", 1)[1].split()
+    stat_file.close()
+    return (int(fields[11]) + int(fields[12])) / float(os.sysconf("SC_CLK_TCK"))
+
+
+def bench_unix(num_neighbors, num_requests, runtime_name):
+    """Compares the TCP text interface with the Unix domain sockets.
+
+    """
+    import tempfile
+    from etx_client import EtxClient
+    from etx_ipc import BINARY_TYPES, FIELDS
+    port = _free_port()
+    path = os.path.join(tempfile.mkdtemp(), "etxd.sock")
+    devnull = open(os.devnull, "w")
+    child = subprocess.Popen([sys.executable, os.path.abspath(__file__), "_unix",
+                              runtime_name, str(port), path, str(num_neighbors)],
+                             stdout=subprocess.PIPE, stderr=devnull)
+    child.stdout.readline()
+    neighbor = "10.0.0.1"
+
+    def tcp(command, args):
+        # the server closes the connection after each request
+        sock = socket.create_connection(("127.0.0.1", port))
+        sock.sendall((" ".join([command] + args) + "\n").encode("ascii"))
+        chunks = []
+        while True:
+            chunk = sock.recv(65536)
+            if not chunk:
+                break
+            chunks.append(chunk)
+        sock.close()
+        # parse the numbers like the binary client
+        separator = ":" if command == "QUALITY" else "|"
+        types = [{"d": float, "i": int}.get(BINARY_TYPES[field], str)
+                 for field in FIELDS[command]]
+        return [tuple([field_type(value) for field_type, value in zip(types, line.split(separator))])
+                for line in b"".join(chunks).decode("ascii").splitlines()]
+
+    stream = EtxClient(path)
+    datagram = EtxClient(path, datagram=True)
+    print("%-9s %-8s %13s %16s %16s" % ("transport", "request", "latency [us]",
+                                        "client CPU [us]", "server CPU [us]"))
+    try:
+        for transport, query in (("tcp", tcp), ("stream", stream.query),
+                                 ("datagram", datagram.query)):
+            for command, args in (("QUALITY", [neighbor]), ("DUMP", [])):
+                latencies = []
+                start_client = cpu_time()
+                start_server = _process_cpu_time(child.pid)
+                for i in range(num_requests):
+                    start = time.time()
+                    query(command, args)
+                    latencies.append(time.time() - start)
+                client = cpu_time() - start_client
+                server = _process_cpu_time(child.pid) - start_server
+                latencies.sort()
+                print("%-9s %-8s %13.1f %16.1f %16.1f"
+                      % (transport, command, 1e6 * latencies[len(latencies) // 2],
+                         1e6 * client / num_requests, 1e6 * server / num_requests))
+    finally:
+        stream.close()
+        datagram.close()
+        child.terminate()
+        child.wait()
+        devnull.close()
+        for name in os.listdir(os.path.dirname(path)):
+            os.remove(os.path.join(os.path.dirname(path), name))
+        os.rmdir(os.path.dirname(path))
+
+
+def bench_probe(num_neighbors, duration):
+    """Measures the cost of sending a probe in both formats for a growing
+    number of neighbors once the first window has passed.
+
+    """
+    from etx_probe import encode_probe
+    from etx_replay import VirtualClock
+    EtxData.WINDOW = 10
+    EtxData.INTERVAL = 1
+    max_neighbors = EtxData.MAX_NEIGHBORS
+    EtxData.MAX_NEIGHBORS = 0
+    own_ip = "10.255.255.254"
+    print("%-8s %9s %9s %10s %13s %11s %12s" % ("format", "neighbors", "probes",
+                                               "send [us]", "receive [us]",
+                                               "expire [us]", "size [bytes]"))
+    counts = sorted(set([count for count in (num_neighbors // 100, num_neighbors // 10,
+                                             num_neighbors) if count > 0]))
+    for name, binary in (("pickle", False), ("buffer", True)):
+        EtxProbeProtocol.BINARY = binary
+        for count in counts:
+            neighbors = ["10.%d.%d.%d" % (i // 62500, (i // 250) % 250, i % 250 + 1)
+                         for i in range(count)]
+            probes = [(neighbor, encode_probe("00:11:22:33:44:55", neighbor,
+                                              {own_ip: (10, 10)}))
+                      for neighbor in neighbors]
+            random.seed(0)
+            clock = VirtualClock()
+            clock.now = 1.0e9
+            data = EtxData(own_ip, clock=clock.time)
+            protocol = EtxProbeProtocol("wlan0", own_ip, data, "00:11:22:33:44:55", "bench")
+            protocol.transport = _Transport()
+            sent = 0
+            received = 0
+            send_time = 0.0
+            receive_time = 0.0
+            expire_time = 0.0
+            for second in range(duration + EtxData.WINDOW):
+                # the first window is not measured
+                measured = second >= EtxData.WINDOW
+                # the neighbors lose a tenth of their probes
+                for neighbor, probe in probes:
+                    clock.now += 0.5 / count
+                    if random.random() >= 0.1:
+                        start = cpu_time()
+                        protocol.datagramReceived(probe, (neighbor, 0))
+                        if measured:
+                            receive_time += cpu_time() - start
+                            received += 1
+                clock.now = 1.0e9 + second + 0.5
+                start = cpu_time()
+                protocol.send_probe()
+                if measured:
+                    send_time += cpu_time() - start
+                    sent += 1
+                # the timer of etxd -B, a no-op in the pickle format
+                clock.now = 1.0e9 + second + 0.75
+                start = cpu_time()
+                protocol.expire_probes()
+                if measured:
+                    expire_time += cpu_time() - start
+                clock.now = 1.0e9 + second + 1
+            print("%-8s %9d %9d %10.1f %13.1f %11.1f %12d"
+                  % (name, count, sent, 1e6 * send_time / sent,
+                     1e6 * receive_time / max(received, 1), 1e6 * expire_time / sent,
+                     protocol.transport.size))
+    EtxProbeProtocol.BINARY = False
+    EtxData.MAX_NEIGHBORS = max_neighbors
+
+
+def bench_replay(num_neighbors, duration):
+    """Records a synthetic trace in both probe formats and measures the
+    replay throughput.
+
+    """
+    import tempfile
+    from etx_probe import encode_probe
+    from etx_replay import VirtualClock, replay
+    from etx_trace import EtxTraceWriter
+    EtxData.WINDOW = 10
+    EtxData.INTERVAL = 1
+    own_ip = "10.255.255.254"
+    neighbors = ["10.%d.%d.%d" % (i // 65536, (i // 256) % 256, i % 256 + 1)
+                 for i in range(num_neighbors)]
+    print("%-8s %9s %9s %12s %12s %10s" % ("format", "neighbors", "records", "trace [kB]",
+                                           "records/s", "mismatches"))
+    for name, binary in (("pickle", False), ("buffer", True)):
+        EtxProbeProtocol.BINARY = binary
+        random.seed(0)
+        path = os.path.join(tempfile.mkdtemp(), "trace")
+        trace = EtxTraceWriter(path, max_size=1 << 30)
+        clock = VirtualClock()
+        clock.now = 1.0e9
+        data = EtxData(own_ip, clock=clock.time)
+        protocol = EtxProbeProtocol("wlan0", own_ip, data, "00:11:22:33:44:55", "bench")
+        protocol.transport = _Transport()
+        protocol.trace = trace
+        trace.add_interface(clock.now, "wlan0", own_ip, protocol.mac, protocol.node_id)
+        # each neighbor has its own loss rate and probe phase
+        links = [(neighbor, random.uniform(0.0, 0.5), random.random())
+                 for neighbor in neighbors]
+        for second in range(duration):
+            # a tenth of the neighbors is silent every other 30 seconds
+            silent = set(neighbors[::10]) if (second // 30) % 2 else set()
+            events = [(phase, neighbor, loss) for neighbor, loss, phase in links
+                      if neighbor not in silent]
+            events.append((0.5, None, 0.0))
+            for phase, neighbor, loss in sorted(events, key=lambda event: event[0]):
+                clock.now = 1.0e9 + second + phase
+                if neighbor is None:
+                    protocol.send_probe()
+                elif random.random() >= loss:
+                    probe = encode_probe("00:11:22:33:44:55", neighbor,
+                                         {own_ip: (random.randint(5, 10), 10)})
+                    protocol.datagramReceived(probe, (neighbor, 0))
+            # the timer of etxd -B, a no-op in the pickle format
+            clock.now = 1.0e9 + second + 0.75
+            protocol.expire_probes()
+        trace.close()
+        stats = replay([path])
+        size = os.path.getsize(path)
+        os.remove(path)
+        os.rmdir(os.path.dirname(path))
+        print("%-8s %9d %9d %12d %12.0f %10d" % (name, num_neighbors, stats["records"],
+                                                 size // 1024,
+                                                 stats["records"] / stats["time"],
+                                                 stats["mismatches"]))
+    EtxProbeProtocol.BINARY = False
+
+
+def bench_schedule(num_nodes, duration):
+    """Simulates the probes of nodes in a single collision domain with the
+    random jitter and with the slot scheduler and compares the collisions.
+
+    """
+    import heapq
+    from etx_replay import VirtualClock
+    from etx_schedule import EtxProbeScheduler
+    EtxData.WINDOW = 10
+    EtxData.INTERVAL = 1
+    # airtime of a probe, e.g. 250 bytes at 1 Mbit/s
+    airtime = 0.002
+    warm_up = 2 * EtxData.WINDOW
+    slots = EtxProbeScheduler.SLOTS
+    print("%-9s %5s %9s %12s %8s %7s" % ("scheduler", "nodes", "probes",
+                                          "collisions", "ETX", "moves"))
+    for name, num_slots in (("jitter", 0), ("slots", slots)):
+        EtxProbeScheduler.SLOTS = num_slots
+        random.seed(0)
+        clock = VirtualClock()
+        schedulers = [EtxProbeScheduler(EtxData.INTERVAL, clock=clock.time)
+                      for node in range(num_nodes)]
+        events = [(random.uniform(0, EtxData.INTERVAL), node) for node in range(num_nodes)]
+        heapq.heapify(events)
+        # probes that are on the air as lists [start, node, collided]
+        air = []
+        sent = [0] * num_nodes
+        received = [[0] * num_nodes for node in range(num_nodes)]
+        probes = collisions = 0
+        while events:
+            start, node = heapq.heappop(events)
+            clock.now = start
+            # deliver the probes that have ended
+            for probe in [probe for probe in air if probe[0] + airtime <= start]:
+                air.remove(probe)
+                if probe[0] >= warm_up:
+                    collisions += probe[2]
+                if probe[2]:
+                    continue
+                for receiver in range(num_nodes):
+                    if receiver != probe[1]:
+                        schedulers[receiver].observe("wlan0", probe[1], probe[0] + airtime)
+                        if probe[0] >= warm_up:
+                            received[receiver][probe[1]] += 1
+            if start >= duration:
+                continue
+            probe = [start, node, False]
+            for other in air:
+                other[2] = probe[2] = True
+            air.append(probe)
+            if start >= warm_up:
+                sent[node] += 1
+                probes += 1
+            heapq.heappush(events, (start + schedulers[node].next_delay("wlan0", start), node))
+        # ETX of the links from the delivery ratios in both directions
+        etx = []
+        for a in range(num_nodes):
+            for b in range(a + 1, num_nodes):
+                delivery = float(received[b][a]) * received[a][b] / max(sent[a] * sent[b], 1)
+                etx.append(1.0 / max(delivery, 1e-3))
+        for probe in air:
+            collisions += probe[2] and probe[0] >= warm_up
+        print("%-9s %5d %9d %11.2f%% %8.3f %7d"
+              % (name, num_nodes, probes, 100.0 * collisions / max(probes, 1),
+                 sum(etx) / max(len(etx), 1),
+                 sum([scheduler.moves for scheduler in schedulers])))
+    EtxProbeScheduler.SLOTS = slots
+
+
+def main():
+    if len(sys.argv) < 2:
+        sys.stderr.write(__doc__.split("Authors:")[0])
+        sys.exit(1)
+    benchmark = sys.argv[1]
+    if benchmark == "_runtime":
+        runtime_child(sys.argv[2], int(sys.argv[3]))
+        return
+    if benchmark == "_unix":
+        unix_child(sys.argv[2], int(sys.argv[3]), sys.argv[4], int(sys.argv[5]))
+        return
+    opt_list, args = getopt.getopt(sys.argv[2:], "n:k:r:")
+    options = dict(opt_list)
+    if benchmark == "runtime":
+        bench_runtime(int(options.get("-n", 5)))
+    elif benchmark == "ipc":
+        bench_ipc(int(options.get("-k", 20)), int(options.get("-n", 100)))
+    elif benchmark == "unix":
+        bench_unix(int(options.get("-k", 20)), int(options.get("-n", 2000)),
+                   options.get("-r", RUNTIMES[0]))
+    elif benchmark == "probe":
+        bench_probe(int(options.get("-k", 1000)), int(options.get("-n", 60)))
+    elif benchmark == "replay":
+        bench_replay(int(options.get("-k", 20)), int(options.get("-n", 3600)))
+    elif benchmark == "schedule":
+        bench_schedule(int(options.get("-k", 30)), int(options.get("-n", 600)))
+    else:
+        sys.stderr.write("unknown benchmark: %s\n" % benchmark)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
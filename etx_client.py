@@ -0,0 +1,163 @@
+#!/usr/bin/python
+"""
+This file is part of etxd: A daemon for to measure the Exptected Transmission
+Count (ETX)
+
+This file contains the client library for the Unix domain sockets of the IPC
+interface (etxd -u path). Local programs that query etxd often, e.g. routing
+agents, save the connection set-up and the text formatting and parsing of the
+TCP interface:
+
+    client = EtxClient("/var/run/etxd.sock")
+    for ip, quality in client.query("QUALITY", ["172.16.21.252"]):
+        ...
+    client.close()
+
+The records are returned as tuples with the fields of etx_ipc.FIELDS. The
+client keeps its connection to the stream socket open; with datagram=True it
+uses the datagram socket instead, whose responses are limited to 64 kB. The
+file can also be run from the command line:
+
+    python etx_client.py [-d] [-w window] [-t timeout] path command [argument ...]
+
+    -d          uses the datagram socket
+    -w window   returns the link qualities of the given additional window
+    -t timeout  timeout of the request in seconds, default: 5
+
+The records are printed in the text format of the TCP interface.
+
+
+Authors:    Matthias Philipp <mphilipp@inf.fu-berlin.de>,
+            Felix Juraschek <fjuraschek@gmail.com>
+
+Copyright 2008-2013, Freie Universitaet Berlin (FUB). All rights reserved.
+
+These sources were developed at the Freie Universitaet Berlin,
+Computer Systems and Telematics / Distributed, embedded Systems (DES) group
+(http://cst.mi.fu-berlin.de, http://www.des-testbed.net)
+-------------------------------------------------------------------------------
+This program is free software: you can redistribute it and/or modify it under
+the terms of the GNU General Public License as published by the Free Software
+Foundation, either version 3 of the License, or (at your option) any later
+version.
+
+This program is distributed in the hope that it will be useful, but WITHOUT
+ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License along with
+this program. If not, see http://www.gnu.org/licenses/ .
+--------------------------------------------------------------------------------
+For further information and questions please use the web site
+       http://www.des-testbed.net
+
+"""
+
+import getopt
+import socket
+import struct
+import sys
+
+from etx_ipc import (DATAGRAM_SUFFIX, FIELDS, MAX_DATAGRAM, MESSAGE_HEADER,
+                     decode_records, encode_binary_request, encode_message, encode_text)
+
+
+class EtxClient:
+    """Sends binary requests to the Unix domain sockets of etxd.
+
+    """
+    def __init__(self, path, datagram=False, timeout=5):
+        """ Constructor:
+
+        path     - path of the stream socket of etxd
+        datagram - whether the datagram socket (path.dgram) is used
+        timeout  - timeout of each request in seconds
+
+        """
+        self.path = path
+        self.datagram = datagram
+        self.timeout = timeout
+        self.sock = None
+
+    def _connect(self):
+        if self.datagram:
+            self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+            # bind to an abstract address, so etxd can send the response
+            self.sock.bind("")
+            self.sock.connect(self.path + DATAGRAM_SUFFIX)
+        else:
+            self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self.sock.connect(self.path)
+        self.sock.settimeout(self.timeout)
+
+    def _receive(self, length):
+        chunks = []
+        while length > 0:
+            chunk = self.sock.recv(length)
+            if not chunk:
+                raise socket.error("connection closed by etxd")
+            chunks.append(chunk)
+            length -= len(chunk)
+        return b"".join(chunks)
+
+    def request(self, data):
+        """Sends an encoded request and returns the encoded response. The
+        connection is established again after an error.
+
+        """
+        if self.sock is None:
+            self._connect()
+        try:
+            if self.datagram:
+                self.sock.send(data)
+                return self.sock.recv(MAX_DATAGRAM)
+            self.sock.sendall(encode_message(data))
+            length, = struct.unpack(MESSAGE_HEADER,
+                                    self._receive(struct.calcsize(MESSAGE_HEADER)))
+            return self._receive(length)
+        except socket.error:
+            self.close()
+            raise
+
+    def query(self, command, args=(), window=0):
+        """Returns the records of the request as list of tuples, see
+        etx_ipc.handle_request(..) for the commands. window selects an
+        additional window (etxd -L), 0 the window of the daemon. Raises
+        ValueError for invalid requests and socket.error if etxd cannot be
+        reached.
+
+        """
+        command = command.upper()
+        data = self.request(encode_binary_request(command, args, window))
+        return decode_records(FIELDS[command], data)
+
+    def close(self):
+        if self.sock is not None:
+            self.sock.close()
+            self.sock = None
+
+
+def main():
+    try:
+        opt_list, args = getopt.getopt(sys.argv[1:], "dw:t:")
+    except getopt.GetoptError:
+        sys.stderr.write("Error while parsing parameters: %s\n" % sys.exc_info()[1])
+        sys.exit(1)
+    options = dict(opt_list)
+    if len(args) < 2:
+        sys.stderr.write(__doc__.split("Authors:")[0])
+        sys.exit(1)
+    client = EtxClient(args[0], "-d" in options, float(options.get("-t", 5)))
+    command = args[1].upper()
+    try:
+        records = client.query(command, args[2:], int(options.get("-w", 0)))
+    except (ValueError, socket.error) as error:
+        sys.stderr.write("%s\n" % error)
+        sys.exit(1)
+    finally:
+        client.close()
+    sys.stdout.write(encode_text(command, records).decode("ascii"))
+
+
+if __name__ == "__main__":
+    main()
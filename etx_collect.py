@@ -0,0 +1,373 @@
+#!/usr/bin/python
+"""
+This file is part of etxd: A daemon for to measure the Exptected Transmission
+Count (ETX)
+
+This file contains the collector that retrieves the JSON documents of the
+web servers of many etxd nodes and merges them into a single snapshot of the
+testbed topology:
+
+    python etx_collect.py [options] node[:port] ...
+
+    -f file     reads further nodes from the file, one per line
+    -P port     port of the web servers, default: 9157
+    -u path     path of the JSON document, e.g. /best, default: /
+    -t timeout  timeout of each request in seconds, default: 2
+    -c number   maximum number of concurrent requests, default: 32
+    -n count    number of sweeps, default: 1
+    -i seconds  interval between the sweeps, default: 10
+    -o file     writes the merged snapshot as JSON to the file
+    -b file     writes the merged snapshot in the binary format to the file
+
+The nodes are polled concurrently. The connection to each node is kept alive
+between the sweeps and the documents are requested conditionally, so a node
+answers with 304 Not Modified if its neighbor table is unchanged and the
+previous document is used. For each sweep the latency, the latency
+percentiles of the nodes and the failed nodes are reported.
+
+The binary snapshot starts with the magic bytes, the format version, the time
+of the sweep (double), the number of fields (1 byte) and for each field its
+name (1 byte length + name) and type (1 byte: s = string, d = double, i =
+integer). It is followed by the number of links (4 bytes) and the fields of
+each link, encoded like the BIN responses of the IPC interface.
+
+
+Authors:    Matthias Philipp <mphilipp@inf.fu-berlin.de>,
+            Felix Juraschek <fjuraschek@gmail.com>
+
+Copyright 2008-2013, Freie Universitaet Berlin (FUB). All rights reserved.
+
+These sources were developed at the Freie Universitaet Berlin,
+Computer Systems and Telematics / Distributed, embedded Systems (DES) group
+(http://cst.mi.fu-berlin.de, http://www.des-testbed.net)
+-------------------------------------------------------------------------------
+This program is free software: you can redistribute it and/or modify it under
+the terms of the GNU General Public License as published by the Free Software
+Foundation, either version 3 of the License, or (at your option) any later
+version.
+
+This program is distributed in the hope that it will be useful, but WITHOUT
+ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License along with
+this program. If not, see http://www.gnu.org/licenses/ .
+--------------------------------------------------------------------------------
+For further information and questions please use the web site
+       http://www.des-testbed.net
+
+"""
+
+try:
+    import simplejson
+except ImportError:
+    import json as simplejson
+import getopt
+import socket
+import struct
+import sys
+import threading
+import time
+try:
+    import queue
+    from http.client import HTTPConnection, HTTPException
+except ImportError:
+    # Python 2
+    import Queue as queue
+    from httplib import HTTPConnection, HTTPException
+
+import etx_stats
+
+SNAPSHOT_MAGIC = b"ETXS"
+SNAPSHOT_VERSION = 1
+# field types of the binary format, from the narrowest to the widest one
+FIELD_TYPES = ("i", "d", "s")
+
+# status of a node after a sweep, failed nodes have the error message instead
+OK = "ok"
+NOT_MODIFIED = "not modified"
+
+
+class EtxCollector:
+
+    def __init__(self, nodes, path="/", timeout=2.0, concurrency=32):
+        """ Constructor:
+
+        nodes - list of the addresses (host, port) of the web servers
+        path - path of the JSON document
+        timeout - timeout of each request in seconds
+        concurrency - maximum number of concurrent requests
+
+        """
+        self.nodes = nodes
+        self.path = path
+        self.timeout = timeout
+        self.concurrency = concurrency
+        # _connections[address] = HTTPConnection kept alive between sweeps
+        self._connections = dict()
+        # _cache[address] = (etag, document) of the last complete response
+        self._cache = dict()
+
+    def _request(self, address, headers):
+        """Sends the request over the persistent connection to the node and
+        returns the response and its body. A new connection is established
+        if the node has closed the idle one.
+
+        """
+        for attempt in range(2):
+            connection = self._connections.get(address)
+            reused = connection is not None
+            if connection is None:
+                connection = HTTPConnection(address[0], address[1],
+                                            timeout=self.timeout)
+                self._connections[address] = connection
+            try:
+                connection.request("GET", self.path, headers=headers)
+                response = connection.getresponse()
+                body = response.read()
+            except (HTTPException, socket.error) as error:
+                connection.close()
+                del self._connections[address]
+                if reused and attempt == 0 and not isinstance(error, socket.timeout):
+                    continue
+                raise
+            if (response.getheader("connection") or "").lower() == "close":
+                connection.close()
+                del self._connections[address]
+            return response, body
+
+    def fetch(self, address):
+        """Returns the tuple (status, document) for the node with the given
+        address. Raises HTTPException, socket.error or ValueError if the node
+        cannot be polled.
+
+        """
+        headers = {}
+        cached = self._cache.get(address)
+        if cached is not None:
+            headers["If-None-Match"] = cached[0]
+        response, body = self._request(address, headers)
+        if response.status == 304 and cached is not None:
+            return NOT_MODIFIED, cached[1]
+        if response.status != 200:
+            raise ValueError("HTTP %d %s" % (response.status, response.reason))
+        document = simplejson.loads(body.decode("utf-8"))
+        etag = response.getheader("etag")
+        if etag:
+            self._cache[address] = (etag, document)
+        return OK, document
+
+    def sweep(self):
+        """Polls all nodes concurrently and returns the merged snapshot, see
+        merge(..).
+
+        """
+        start = time.time()
+        pending = queue.Queue()
+        for address in self.nodes:
+            pending.put(address)
+        # results[address] = (status, document, latency)
+        results = dict()
+
+        def poll():
+            while True:
+                try:
+                    address = pending.get_nowait()
+                except queue.Empty:
+                    return
+                begin = time.time()
+                try:
+                    status, document = self.fetch(address)
+                except (HTTPException, socket.error, ValueError) as error:
+                    status = "%s" % error or error.__class__.__name__
+                    document = None
+                results[address] = (status, document, time.time() - begin)
+
+        threads = [threading.Thread(target=poll)
+                   for i in range(min(self.concurrency, len(self.nodes)))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return merge(start, time.time() - start, results)
+
+    def close(self):
+        for connection in self._connections.values():
+            connection.close()
+        self._connections.clear()
+
+
+def merge(start, latency, results):
+    """Merges the results of a sweep into a snapshot, a dictionary with the
+    time and the latency of the sweep, the status and latency of each node
+    and the links of all nodes. Each link is the neighbor entry of the JSON
+    document with the node name of the reporting node as source.
+
+    """
+    snapshot = {"time": start, "latency": latency, "nodes": [], "links": []}
+    for address in sorted(results.keys()):
+        status, document, node_latency = results[address]
+        node = {"address": "%s:%s" % address, "status": status,
+                "latency": node_latency}
+        if document is not None:
+            node["node"] = document.get("node")
+            node["time"] = document.get("time")
+            for neighbor in document.get("neighbors", []):
+                link = dict(neighbor)
+                link["source"] = document.get("node")
+                snapshot["links"].append(link)
+        snapshot["nodes"].append(node)
+    return snapshot
+
+
+def encode_snapshot(snapshot):
+    """Encodes the links of the snapshot in the binary format.
+
+    """
+    # fields[name] = type, derived from the values of the links; if the
+    # values of a field have different types, the widest one is used, i.e.
+    # the field is encoded as string as soon as one value is no number
+    fields = dict()
+    for link in snapshot["links"]:
+        for name, value in link.items():
+            if value is None:
+                fields.setdefault(name, None)
+                continue
+            if isinstance(value, (bool, int)):
+                field_type = "i"
+            elif isinstance(value, float):
+                field_type = "d"
+            else:
+                field_type = "s"
+            if fields.get(name) is None or \
+               FIELD_TYPES.index(field_type) > FIELD_TYPES.index(fields[name]):
+                fields[name] = field_type
+    for name, field_type in fields.items():
+        if field_type is None:
+            fields[name] = "s"
+    names = sorted(fields.keys())
+    chunks = [SNAPSHOT_MAGIC, struct.pack("!BdB", SNAPSHOT_VERSION,
+                                          snapshot["time"], len(names))]
+    for name in names:
+        chunks.append(struct.pack("!B", len(name)) + name.encode("ascii")
+                      + fields[name].encode("ascii"))
+    chunks.append(struct.pack("!I", len(snapshot["links"])))
+    for link in snapshot["links"]:
+        for name in names:
+            value = link.get(name)
+            if fields[name] == "s":
+                value = ("%s" % (value or "")).encode("utf-8")[:255]
+                chunks.append(struct.pack("!B", len(value)) + value)
+            else:
+                chunks.append(struct.pack("!" + fields[name], value or 0))
+    return b"".join(chunks)
+
+
+def decode_snapshot(data):
+    """Decodes a snapshot in the binary format and returns the tuple (time,
+    links). Raises ValueError if the data is malformed.
+
+    """
+    if data[:len(SNAPSHOT_MAGIC)] != SNAPSHOT_MAGIC:
+        raise ValueError("no snapshot")
+    try:
+        offset = len(SNAPSHOT_MAGIC)
+        version, start, count = struct.unpack_from("!BdB", data, offset)
+        if version != SNAPSHOT_VERSION:
+            raise ValueError("unsupported snapshot version %d" % version)
+        offset += struct.calcsize("!BdB")
+        fields = []
+        for i in range(count):
+            length, = struct.unpack_from("!B", data, offset)
+            if offset + 2 + length > len(data):
+                raise ValueError("malformed snapshot: truncated field")
+            name = data[offset + 1:offset + 1 + length].decode("ascii")
+            field_type = data[offset + 1 + length:offset + 2 + length].decode("ascii")
+            fields.append((name, field_type))
+            offset += 2 + length
+        count, = struct.unpack_from("!I", data, offset)
+        offset += 4
+        links = []
+        for i in range(count):
+            link = dict()
+            for name, field_type in fields:
+                if field_type == "s":
+                    length, = struct.unpack_from("!B", data, offset)
+                    if offset + 1 + length > len(data):
+                        raise ValueError("malformed snapshot: truncated link")
+                    link[name] = data[offset + 1:offset + 1 + length].decode("utf-8")
+                    offset += 1 + length
+                else:
+                    link[name], = struct.unpack_from("!" + field_type, data, offset)
+                    offset += struct.calcsize("!" + field_type)
+            links.append(link)
+    except (struct.error, UnicodeDecodeError) as error:
+        raise ValueError("malformed snapshot: %s" % error)
+    return start, links
+
+
+def report(number, snapshot):
+    """Prints the latency and the failed nodes of a sweep.
+
+    """
+    nodes = snapshot["nodes"]
+    counts = {OK: 0, NOT_MODIFIED: 0}
+    for node in nodes:
+        if node["status"] in counts:
+            counts[node["status"]] += 1
+    latency = etx_stats.percentiles([node["latency"] for node in nodes])
+    print("sweep %d: %d nodes, %d ok, %d not modified, %d failed, %d links in "
+          "%.1f ms (node latency p50 %.1f ms, p90 %.1f ms, p99 %.1f ms, max %.1f ms)"
+          % (number, len(nodes), counts[OK], counts[NOT_MODIFIED],
+             len(nodes) - counts[OK] - counts[NOT_MODIFIED],
+             len(snapshot["links"]), 1000 * snapshot["latency"],
+             1000 * latency["p50"], 1000 * latency["p90"],
+             1000 * latency["p99"], 1000 * latency["max"]))
+    for node in nodes:
+        if node["status"] not in counts:
+            print("  %s: %s" % (node["address"], node["status"]))
+
+
+def main():
+    try:
+        opt_list, args = getopt.getopt(sys.argv[1:], "f:P:u:t:c:n:i:o:b:")
+    except getopt.GetoptError:
+        sys.stderr.write("Error while parsing parameters: %s\n" % sys.exc_info()[1])
+        sys.exit(1)
+    options = dict(opt_list)
+    timeout = float(options.get("-t", 2))
+    concurrency = int(options.get("-c", 32))
+    port = int(options.get("-P", 9157))
+    if "-f" in options:
+        nodes_file = open(options["-f"])
+        args.extend([line.strip() for line in nodes_file if line.strip()])
+        nodes_file.close()
+    if len(args) < 1:
+        sys.stderr.write(__doc__.split("Authors:")[0])
+        sys.exit(1)
+    nodes = []
+    for arg in args:
+        host, _, node_port = arg.partition(":")
+        nodes.append((host, int(node_port or port)))
+    collector = EtxCollector(nodes, options.get("-u", "/"), timeout, concurrency)
+    sweeps = int(options.get("-n", 1))
+    interval = float(options.get("-i", 10))
+    for number in range(1, sweeps + 1):
+        start = time.time()
+        snapshot = collector.sweep()
+        report(number, snapshot)
+        if "-o" in options:
+            output = open(options["-o"], "w")
+            output.write(simplejson.dumps(snapshot) + "\n")
+            output.close()
+        if "-b" in options:
+            output = open(options["-b"], "wb")
+            output.write(encode_snapshot(snapshot))
+            output.close()
+        if number < sweeps:
+            time.sleep(max(start + interval - time.time(), 0))
+    collector.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -12,6 +12,37 @@ The class follows a lazy implementation where incoming data from received probes
 first saved as it is. The transmission probabilities and ETX values are 
 calculated on demand only, thus ensuring their freshness. 
 
+The link qualities that are published to the consumers (IPC interface, web
+server) can be damped to avoid route flapping: a new neighbor is published
+only after a minimum number of received probes, a published quality is only
+updated if the measured quality leaves the hysteresis band around it, and a
+withdrawn link is held down, i.e. not published again, for some time. The
+damping is disabled by default.
+
+The memory is bounded by a maximum number of neighbors per interface and of
+two-hop entries per neighbor, since any host in the broadcast domain can send
+probes with arbitrary source addresses.
+
+Optionally, the transmission probability derived from the unicast traffic to
+a neighbor (see etx_station.py) is merged with or substituted for the one
+derived from the probes.
+
+The link qualities of additional windows, e.g. a short and a long one, are
+kept in a bucketed store besides the ones of the daemon window, see
+etx_window.py.
+
+The multipoint relays of the interface are selected from the two-hop
+neighborhood on demand and kept until a link quality changes, see etx_mpr.py.
+
+The arrival times of all probes are kept in order as well, so removing the
+old probes only visits the neighbors with expired probes. If the probes are
+sent in the binary format (etxd -B), the entries of our probes are patched in
+the buffer of the probe protocol (see etx_probe.EtxProbeBuffer) as soon as a
+probe of a neighbor arrives. Expired entries are only applied to the buffer
+by expire_probes(), which the probe protocol calls on every received probe
+and once per interval, so sending a probe involves no expiry at all and the
+queries of the IPC interface do not change the sent probes.
+
 Authors:    Matthias Philipp <mphilipp@inf.fu-berlin.de>,
             Felix Juraschek <fjuraschek@gmail.com>
 
@@ -39,25 +70,86 @@ For further information and questions please use the web site
 """
 
 import time
+from collections import deque
+
+from etx_mpr import get_relay_links, select_mpr
+from etx_window import EtxWindowCounter
+
+# number of changes of the published link tables of all interfaces
+_churn = {"published": 0, "changed": 0, "withdrawn": 0, "suppressed": 0,
+          "gated": 0, "held_down": 0}
+
+
+def get_churn():
+    """Returns the number of published, changed and withdrawn links and the
+    number of changes that have been suppressed by the hysteresis, the
+    minimum number of samples and the hold-down.
+
+    """
+    return dict(_churn)
+
+
+# number of evicted and rejected neighbors and truncated two-hop entries of
+# all interfaces
+_limits = {"evicted": 0, "rejected": 0, "truncated": 0}
+
+
+def get_limits():
+    """Returns the number of neighbors that have been evicted or rejected
+    because the neighbor table was full and the number of two-hop entries
+    that have been dropped.
+
+    """
+    return dict(_limits)
+
 
 class EtxData():
 
     # configured in etxd.py
     WINDOW = None
     INTERVAL = None
+    # damping of the published link qualities, disabled by default
+    MIN_SAMPLES = 0
+    HYSTERESIS = 0.0
+    HOLD_DOWN = 0
+    # maximum number of neighbors and of two-hop entries per neighbor, 0
+    # means unlimited
+    MAX_NEIGHBORS = 512
+    MAX_TWOHOP = 512
+    # source of the transmission probability: "probe", "merge" (mean of the
+    # probe and the station based value) or "station" (station based value
+    # if available)
+    ESTIMATOR = "probe"
+    # minimum transmission probability of the links that are used to select
+    # the multipoint relays, see etx_mpr.py
+    MPR_QUALITY = 0.5
+    # additional windows in seconds whose link qualities are kept besides the
+    # one of WINDOW, see etx_window.py
+    WINDOWS = ()
 
     def __init__(self, ip_address, neighbor_probes=None,
-                 received_probes=None):
+                 received_probes=None, if_name=None, index=None, clock=None):
         """ Constructor:
 
         ip_address - the IP address of the associated interface
         neighbor_probes - number of received probes from the neighbors' neighbors 
         received_probes - arrival times of received probes per neighbor
+        if_name - the name of the associated interface
+        index - EtxNeighborIndex that is kept up to date with our neighbors
+        clock - function that returns the current time, time.time by default
 
         """
         self.ip_address = ip_address
+        self.if_name = if_name
+        self.index = index
+        if clock is None:
+            self.clock = time.time
+        else:
+            self.clock = clock
         # initialize our custom ARP cache
         self._mac_addresses = {}
+        # node IDs advertised by the neighbors
+        self._node_ids = {}
         # _neighbor_probes keeps the number of received probes from the
         # neighbors' neighbors 
         # _neighbor_probes[originator][originators' neighbor] = number of
@@ -76,6 +168,40 @@ class EtxData():
             self._received_probes = dict()
         else:
             self._received_probes = received_probes
+        # _arrivals = deque of (timestamp, neighbor) of the received probes in
+        # the order of their arrival
+        self._arrivals = deque()
+        # whether all neighbors have to be checked for old probes, e.g. after
+        # the clock has gone backwards
+        self._unordered = received_probes is not None
+        # EtxProbeBuffer that is kept up to date with the entries of our
+        # probes, see get_probe_data()
+        self.probe_buffer = None
+        # neighbors whose entries in the buffer have changed due to expired
+        # probes, applied by expire_probes()
+        self._pending = set()
+        # _published[neighbor] = quality that is published if damping is
+        # enabled
+        self._published = dict()
+        # _withdrawn[neighbor] = time the link has been withdrawn
+        self._withdrawn = dict()
+        # _damped[neighbor] = (reason, quality) of the last change that has
+        # been counted as suppressed, gated or held down
+        self._damped = dict()
+        # _station[neighbor] = (transmission probability, time) derived from
+        # the unicast traffic
+        self._station = dict()
+        # incremented whenever a link quality may have changed
+        self.version = 0
+        # multipoint relays of the version and the links they were selected
+        # from
+        self._mpr = dict()
+        self._mpr_version = None
+        self._mpr_links = None
+        # _windows[neighbor] = [EtxWindowCounter of the received probes,
+        # {window: number of probes the neighbor received from us}, time of
+        # the last probe] if additional WINDOWS are configured
+        self._windows = dict()
 
 
     def __repr__(self):
@@ -84,54 +210,262 @@ class EtxData():
 
 
     def set_neighbor_info(self, neighbor, data):
-        """Sets the neighborhood information of the given neighbor.
+        """Sets the neighborhood information of the given neighbor. If it
+        contains more than MAX_TWOHOP entries, the entry for this interface
+        and the entries with the most received probes are kept.
 
         """
+        if EtxData.MAX_TWOHOP > 0 and len(data) > EtxData.MAX_TWOHOP:
+            _limits["truncated"] += len(data) - EtxData.MAX_TWOHOP
+            own = data.pop(self.ip_address, None)
+            entries = sorted(data.items(), key=lambda item: item[1][0], reverse=True)
+            if own is not None:
+                entries = [(self.ip_address, own)] + entries
+            data = dict(entries[:EtxData.MAX_TWOHOP])
         self._neighbor_probes[neighbor] = data
+        self.version += 1
+        if self.probe_buffer is not None and neighbor in self._received_probes:
+            self._update_probe_entry(neighbor)
+
+
+    def admit_neighbor(self, neighbor, timestamp=None):
+        """Returns True if the probes of the given neighbor may be stored,
+        which is always the case for known neighbors. If the neighbor table is
+        full, the outdated neighbors are removed first. Otherwise the neighbor
+        with the fewest received probes is evicted, but only if it has not
+        received more probes than the new neighbor, i.e. a single one. Thus
+        new neighbors cannot displace established ones.
+
+        """
+        if neighbor in self._received_probes or EtxData.MAX_NEIGHBORS <= 0 or \
+           len(self._received_probes) < EtxData.MAX_NEIGHBORS:
+            return True
+        # use current time, if timestamp not given
+        if timestamp == None:
+            timestamp = self.clock()
+        self.remove_old_probes(timestamp)
+        if len(self._received_probes) < EtxData.MAX_NEIGHBORS:
+            return True
+        # the neighbor with the fewest probes, the one heard least recently
+        worst, timestamps = min(self._received_probes.items(),
+                                key=lambda item: (len(item[1]), item[1][-1]))
+        if len(timestamps) > 1:
+            _limits["rejected"] += 1
+            return False
+        self._remove_neighbor(worst)
+        _limits["evicted"] += 1
+        return True
+
+
+    def _remove_neighbor(self, neighbor):
+        """Removes all information about the neighbor.
+
+        """
+        self._received_probes.pop(neighbor, None)
+        self._neighbor_probes.pop(neighbor, None)
+        self._mac_addresses.pop(neighbor, None)
+        self._node_ids.pop(neighbor, None)
+        self._station.pop(neighbor, None)
+        self.version += 1
+        if self.probe_buffer is not None:
+            self._pending.add(neighbor)
+        # the neighbor is no longer reachable via this interface
+        if self.index is not None:
+            self.index.remove_link(self.if_name, neighbor)
 
 
     def add_timestamp(self, neighbor, timestamp=None):
         """Adds a timestamp, which indicates a successfully received probe, for
         the given neighbor to the internal data structure.
         The optional timestamp argument allows to use a different reference time
-        than the current time, which is the default.
+        than the current time of the clock, which is the default.
 
         """
         # use current time, if timestamp not given
         if timestamp == None:
-            timestamp = time.time()
+            timestamp = self.clock()
         # prepare data structure if first entry for that neighbor
         if neighbor not in self._received_probes.keys():
             self._received_probes[neighbor] = list()
+        timestamps = self._received_probes[neighbor]
+        # drop the expired probes of the neighbor right away, so its entry in
+        # our probes is not patched once more when they expire
+        while timestamps and timestamps[0] + EtxData.WINDOW < timestamp:
+            del timestamps[0]
         # append timestamp
-        self._received_probes[neighbor].append(timestamp)
+        timestamps.append(timestamp)
+        if self._arrivals and timestamp < self._arrivals[-1][0]:
+            self._unordered = True
+        self._arrivals.append((timestamp, neighbor))
+        self.version += 1
+        if self.probe_buffer is not None:
+            self._update_probe_entry(neighbor)
+        # count the probe for the additional windows
+        if EtxData.WINDOWS:
+            entry = self._get_window_entry(neighbor)
+            entry[0].add(int(timestamp // EtxData.INTERVAL))
+            entry[2] = timestamp
+        # make sure the neighbor is in the global index
+        if self.index is not None:
+            self.index.update_link(self.if_name, neighbor, self.get_mac(neighbor),
+                                   self.get_node_id(neighbor))
 
 
     def remove_old_probes(self, timestamp=None):
         """Removes all probes that have been received before the last window
         time from the internal data structures.
         The optional timestamp argument allows to use a different reference time
-        than the current time, which is the default.
+        than the current time of the clock, which is the default.
 
         """
         # use current time, if timestamp not given
         if timestamp == None:
-            timestamp = time.time()
-        for neighbor in self._received_probes.keys():
+            timestamp = self.clock()
+        self._remove_expired(timestamp)
+        for neighbor, entry in list(self._windows.items()):
+            if entry[2] + max(EtxData.WINDOWS) < timestamp:
+                del self._windows[neighbor]
+        for neighbor, (quality, updated) in list(self._station.items()):
+            if updated + EtxData.WINDOW < timestamp:
+                del self._station[neighbor]
+                self.version += 1
+        if EtxData.is_damped():
+            self._update_published(timestamp)
+
+
+    def expire_probes(self, timestamp=None):
+        """Removes the probes that have expired since the last call and
+        applies the changed entries to the buffer of our probes. Only the
+        neighbors with expired probes are visited. Called by the probe
+        protocol, see the description of the module.
+
+        """
+        if timestamp == None:
+            timestamp = self.clock()
+        self._remove_expired(timestamp)
+        if self._pending and self.probe_buffer is not None:
+            # in a fixed order, so the replay of a trace yields the same probes
+            pending = sorted(self._pending)
+            self._pending.clear()
+            for neighbor in pending:
+                if neighbor not in self._received_probes:
+                    self.probe_buffer.remove_entry(neighbor)
+            self._update_probe_entries([neighbor for neighbor in pending
+                                        if neighbor in self._received_probes])
+
+
+    def _remove_expired(self, timestamp):
+        """Removes the received probes that are older than the window, the
+        changed entries of our probes are marked as pending.
+
+        """
+        if self._unordered:
+            # check all neighbors and restore the order of the arrivals
+            expired = list(self._received_probes.keys())
+            self._arrivals = deque(sorted([(arrival, neighbor) for neighbor, timestamps
+                                           in self._received_probes.items()
+                                           for arrival in timestamps]))
+            self._unordered = False
+        else:
+            # only the neighbors with expired probes have to be checked
+            expired = []
+            while self._arrivals and self._arrivals[0][0] + EtxData.WINDOW < timestamp:
+                expired.append(self._arrivals.popleft()[1])
+        window = EtxData.WINDOW
+        for neighbor in expired:
+            timestamps = self._received_probes.get(neighbor)
+            # the neighbor may have been removed already or its probes have
+            # been dropped on arrival
+            if not timestamps or timestamps[0] + window >= timestamp:
+                continue
             # remove all timestamps that are older than window size
-            while len(self._received_probes[neighbor]) > 0 and self._received_probes[neighbor][0] + EtxData.WINDOW < timestamp:
-               del self._received_probes[neighbor][0] 
+            while timestamps and timestamps[0] + window < timestamp:
+               del timestamps[0]
+            self.version += 1
             # if we have not received any probes during the last window size,
-            # then the probe information from that neighbor is also out-dated
-            if len(self._received_probes[neighbor]) == 0 and neighbor in self._neighbor_probes.keys():
-                del self._neighbor_probes[neighbor]
-                # also remove the now unsued key from the dictionary
-                del self._received_probes[neighbor]
+            # then all information about that neighbor is out-dated
+            if not timestamps:
+                self._remove_neighbor(neighbor)
+            elif self.probe_buffer is not None:
+                self._pending.add(neighbor)
+
+
+    @staticmethod
+    def is_damped():
+        """Returns True if the published link qualities are damped.
+
+        """
+        return EtxData.MIN_SAMPLES > 1 or EtxData.HYSTERESIS > 0 or \
+               EtxData.HOLD_DOWN > 0
+
+
+    def _update_published(self, timestamp):
+        """Applies the measured link qualities to the published ones
+        according to the minimum number of samples, the hysteresis and the
+        hold-down.
+
+        """
+        for neighbor, withdrawn in list(self._withdrawn.items()):
+            if withdrawn + EtxData.HOLD_DOWN <= timestamp:
+                del self._withdrawn[neighbor]
+        for neighbor in list(self._published.keys()):
+            if neighbor not in self._received_probes:
+                del self._published[neighbor]
+                self._withdrawn[neighbor] = timestamp
+                _churn["withdrawn"] += 1
+                self.version += 1
+        for neighbor in list(self._damped.keys()):
+            if neighbor not in self._received_probes:
+                del self._damped[neighbor]
+        for neighbor in self._received_probes.keys():
+            quality = self.get_transmission_probability(neighbor)
+            published = self._published.get(neighbor)
+            if published is None:
+                if quality == 0:
+                    self._damped.pop(neighbor, None)
+                elif len(self._received_probes[neighbor]) < EtxData.MIN_SAMPLES:
+                    self._count_damped(neighbor, "gated")
+                elif neighbor in self._withdrawn:
+                    self._count_damped(neighbor, "held_down")
+                else:
+                    self._published[neighbor] = quality
+                    self._damped.pop(neighbor, None)
+                    _churn["published"] += 1
+                    self.version += 1
+            elif quality == 0:
+                del self._published[neighbor]
+                self._withdrawn[neighbor] = timestamp
+                self._damped.pop(neighbor, None)
+                _churn["withdrawn"] += 1
+                self.version += 1
+            elif abs(quality - published) > EtxData.HYSTERESIS:
+                self._published[neighbor] = quality
+                self._damped.pop(neighbor, None)
+                _churn["changed"] += 1
+                self.version += 1
+            elif quality != published:
+                self._count_damped(neighbor, "suppressed", quality)
+            else:
+                self._damped.pop(neighbor, None)
+
+
+    def _count_damped(self, neighbor, reason, quality=None):
+        """Counts a change of the link to the neighbor that is not published
+        for the given reason. The link qualities are updated on every query,
+        so a change is only counted once, i.e. if the reason or the
+        suppressed quality differ from the last counted change.
+
+        """
+        if self._damped.get(neighbor) != (reason, quality):
+            self._damped[neighbor] = (reason, quality)
+            _churn[reason] += 1
 
 
     def get_transmission_probability(self, neighbor):
         """Returns the probability that a packet is successfully transmitted to
         the specified neighbor and the corresponding ACK packet is received.
+        Depending on ESTIMATOR, the probability derived from the unicast
+        traffic is merged with or substituted for the one of the probes.
 
         """
         # probability that a data packet successfully arrives at the recipient
@@ -139,16 +473,45 @@ class EtxData():
         # probability that the ACK packet is successfully received
         dr = self._get_reverse_ratio(neighbor)
         # probability of a successful transmission
-        return df * dr
+        p = df * dr
+        # the probability derived from the unicast traffic, if available
+        if EtxData.ESTIMATOR != "probe" and neighbor in self._station:
+            if EtxData.ESTIMATOR == "station":
+                return self._station[neighbor][0]
+            return (p + self._station[neighbor][0]) / 2
+        return p
+
+
+    def set_station_quality(self, neighbor, quality, timestamp=None):
+        """Sets the transmission probability of the neighbor that has been
+        derived from the unicast traffic. It expires after the window time.
+
+        """
+        # use current time, if timestamp not given
+        if timestamp == None:
+            timestamp = self.clock()
+        self._station[neighbor] = (quality, timestamp)
+        self.version += 1
+
+
+    def get_quality(self, neighbor):
+        """Returns the published transmission probability of the neighbor,
+        which is damped if configured, see remove_old_probes(..).
+
+        """
+        if EtxData.is_damped():
+            return self._published.get(neighbor, 0.0)
+        return self.get_transmission_probability(neighbor)
 
 
     def get_etx(self, neighbor):
         """Returns the number of expected transmissions that are needed to
         successfully transmit a packet to the neighbor and receive the
-        corresponding ACK packet.
+        corresponding ACK packet, based on the published transmission
+        probability.
 
         """
-        p = self.get_transmission_probability(neighbor)
+        p = self.get_quality(neighbor)
         if p == 0:
             return -1
         else:
@@ -170,15 +533,45 @@ class EtxData():
             probe_data[neighbor] = (self._get_num_probes_recv_from_neighbor(neighbor),
                                     self._get_num_probes_recv_from_me(neighbor))
         return probe_data
+
+
+    def _update_probe_entry(self, neighbor):
+        """Patches the entry of the neighbor in the buffer of our probes.
+
+        """
+        self._update_probe_entries([neighbor])
+
+
+    def _update_probe_entries(self, neighbors):
+        """Patches the entries of the given neighbors in the buffer of our
+        probes at once.
+
+        """
+        received = self._received_probes
+        neighbor_probes = self._neighbor_probes
+        own_ip = self.ip_address
+        counts = []
+        for neighbor in neighbors:
+            sent = neighbor_probes.get(neighbor)
+            sent = sent and sent.get(own_ip)
+            counts.append((neighbor, len(received[neighbor]), sent and sent[0] or 0))
+        self.probe_buffer.set_counts(counts)
    
 
     def get_neighbors(self, etx=False):
-        """Returns a dictionary that contains the transmission probability for
-        each neighbor. If the optional agument etx is True, the etx value is
-        used instead of transmission probability.
+        """Returns a dictionary that contains the published transmission
+        probability for each neighbor. If the optional agument etx is True,
+        the etx value is used instead of transmission probability.
 
         """
         neighbors = dict()
+        if EtxData.is_damped():
+            for neighbor, quality in self._published.items():
+                if etx:
+                    neighbors[neighbor] = 1 / quality
+                else:
+                    neighbors[neighbor] = quality
+            return neighbors
         for neighbor in self._received_probes.keys():
             if etx:
                 etx_value = self.get_etx(neighbor)
@@ -191,6 +584,128 @@ class EtxData():
         return neighbors
 
 
+    def get_links(self):
+        """Returns a dictionary that contains the forward and reverse delivery
+        ratio (df, dr) for each neighbor we received probes from, including
+        links with a transmission probability of 0. All values are determined
+        in a single pass over the neighbor table.
+
+        """
+        expected = self._get_num_exp_probes()
+        links = dict()
+        for neighbor, timestamps in self._received_probes.items():
+            try:
+                sent = self._neighbor_probes[neighbor][self.ip_address][0]
+            except KeyError:
+                sent = 0
+            links[neighbor] = (min(float(sent) / expected, 1.0),
+                               min(float(len(timestamps)) / expected, 1.0))
+        return links
+
+
+    def get_mpr(self):
+        """Returns a dictionary that contains the number of covered two-hop
+        neighbors for each multipoint relay of the interface, see etx_mpr.py.
+        The relays are only selected again if a link quality has changed
+        since the last call and thereby a good link has appeared or vanished,
+        so they stay stable as long as possible.
+
+        """
+        if self._mpr_version != self.version:
+            twohop = dict()
+            for neighbor in self._neighbor_probes.keys():
+                twohop[neighbor] = dict([(node, self._get_twohop_transmission_probability(neighbor, node))
+                                         for node in self._neighbor_probes[neighbor].keys()])
+            links = get_relay_links(self.get_neighbors(), twohop, self.ip_address,
+                                    EtxData.MPR_QUALITY)
+            # the relays depend only on the good links, not on their ETX
+            relay_links = dict([(relay, frozenset(paths.keys())) for relay, paths in links.items()])
+            if relay_links != self._mpr_links:
+                self._mpr = select_mpr(links)
+                self._mpr_links = relay_links
+            self._mpr_version = self.version
+        return dict(self._mpr)
+
+
+    def _get_window_entry(self, neighbor):
+        """Returns the entry of _windows for the neighbor, which is created if
+        necessary. The number of entries is bounded like the neighbor table,
+        the entry heard least recently of a neighbor that is not in the
+        neighbor table is removed.
+
+        """
+        entry = self._windows.get(neighbor)
+        if entry is None:
+            if EtxData.MAX_NEIGHBORS > 0 and len(self._windows) >= EtxData.MAX_NEIGHBORS:
+                stale = [(other[2], other_neighbor) for other_neighbor, other in self._windows.items()
+                         if other_neighbor not in self._received_probes]
+                if stale:
+                    del self._windows[min(stale)[1]]
+            counter = EtxWindowCounter(max(EtxData.WINDOWS) // EtxData.INTERVAL)
+            entry = self._windows[neighbor] = [counter, dict(), self.clock()]
+        return entry
+
+
+    def set_window_info(self, neighbor, windows):
+        """Sets the number of our probes that the neighbor has received
+        during each of its windows, windows is the dictionary of its probe,
+        see get_probe_windows(..).
+
+        """
+        if not EtxData.WINDOWS:
+            return
+        entry = self._get_window_entry(neighbor)
+        entry[1] = dict([(window, counts.get(self.ip_address, 0))
+                         for window, counts in windows.items()])
+
+
+    def get_probe_windows(self, timestamp=None):
+        """Returns a dictionary that contains a dictionary with the number of
+        probes that we received from each neighbor during each of the
+        additional windows, or None if there are none.
+
+        """
+        if not EtxData.WINDOWS:
+            return None
+        # use current time, if timestamp not given
+        if timestamp == None:
+            timestamp = self.clock()
+        interval = int(timestamp // EtxData.INTERVAL)
+        windows = dict()
+        for window in EtxData.WINDOWS:
+            length = window // EtxData.INTERVAL
+            counts = windows[window] = dict()
+            for neighbor in self._received_probes.keys():
+                entry = self._windows.get(neighbor)
+                if entry is None:
+                    counts[neighbor] = 0
+                else:
+                    counts[neighbor] = entry[0].count(interval, length)
+        return windows
+
+
+    def get_window_links(self, window, timestamp=None):
+        """Returns a dictionary that contains the forward and reverse delivery
+        ratio (df, dr) during the given additional window for each neighbor,
+        also for neighbors that have already been removed from the neighbor
+        table. Each ratio is determined in constant time.
+
+        """
+        # use current time, if timestamp not given
+        if timestamp == None:
+            timestamp = self.clock()
+        interval = int(timestamp // EtxData.INTERVAL)
+        length = window // EtxData.INTERVAL
+        links = dict()
+        for neighbor, (counter, reported, updated) in self._windows.items():
+            received = counter.count(interval, length)
+            sent = reported.get(window, 0)
+            if received > 0 or sent > 0:
+                links[neighbor] = (min(float(sent) / length, 1.0),
+                                   min(float(received) / length, 1.0))
+        return links
+
+
     def get_debug_info(self, neighbor):
         """Returns a string containing the forward and reverse delivery ratio
         for the specified neighbor.
@@ -214,6 +729,14 @@ class EtxData():
         self._mac_addresses[ip] = mac
 
 
+    def get_macs(self):
+        """Returns a dictionary that contains the MAC address of each
+        neighbor.
+
+        """
+        return dict(self._mac_addresses)
+
+
     def get_mac(self, ip):
         """Lookup a MAC address for the specified IP address.
 
@@ -224,12 +747,31 @@ class EtxData():
             return None
 
 
+    def set_node_id(self, ip, node_id):
+        """Set the node ID advertised by the neighbor with the given IP.
+
+        """
+        self._node_ids[ip] = node_id
+
+
+    def get_node_id(self, ip):
+        """Returns the node ID advertised by the neighbor with the given IP.
+        For neighbors that do not advertise a node ID, the MAC address is
+        used instead.
+
+        """
+        try:
+            return self._node_ids[ip]
+        except KeyError:
+            return self.get_mac(ip)
+
+
     def _get_num_exp_probes(self):
         """Returns the number of probes that were expected to arrive during the
         window period.
 
         """
-        return EtxData.WINDOW / EtxData.INTERVAL
+        return EtxData.WINDOW // EtxData.INTERVAL
 
 
     def _get_num_probes_recv_from_me(self, neighbor):
@@ -0,0 +1,213 @@
+#!/usr/bin/python
+"""
+This file is part of etxd: A daemon for to measure the Exptected Transmission
+Count (ETX)
+
+This class functions as the global index of the neighbor nodes across all
+interfaces. A neighbor node that is reachable via several interfaces (e.g.
+wlan0 and wlan1) is identified by the node ID it advertises in its probes or,
+for nodes that do not advertise one, by its MAC address. For each node the
+index keeps the link (IP and MAC address of the neighbor) per local interface.
+
+The index is updated incrementally by EtxData whenever a probe arrives or the
+last probe of a neighbor expires, so all lookups by node ID, IP or MAC address
+take constant time. The link qualities are not stored in the index, they are
+determined on demand from the EtxData of the interface as usual.
+
+
+Authors:    Matthias Philipp <mphilipp@inf.fu-berlin.de>,
+            Felix Juraschek <fjuraschek@gmail.com>
+
+Copyright 2008-2013, Freie Universitaet Berlin (FUB). All rights reserved.
+
+These sources were developed at the Freie Universitaet Berlin,
+Computer Systems and Telematics / Distributed, embedded Systems (DES) group
+(http://cst.mi.fu-berlin.de, http://www.des-testbed.net)
+-------------------------------------------------------------------------------
+This program is free software: you can redistribute it and/or modify it under
+the terms of the GNU General Public License as published by the Free Software
+Foundation, either version 3 of the License, or (at your option) any later
+version.
+
+This program is distributed in the hope that it will be useful, but WITHOUT
+ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License along with
+this program. If not, see http://www.gnu.org/licenses/ .
+--------------------------------------------------------------------------------
+For further information and questions please use the web site
+       http://www.des-testbed.net
+
+"""
+
+
+class EtxNeighborIndex:
+
+    def __init__(self):
+        # _links[node][if_name] = (ip, mac)
+        self._links = dict()
+        # _nodes[(if_name, ip)] = node
+        self._nodes = dict()
+        # _aliases[ip or mac] = node
+        self._aliases = dict()
+
+
+    def __repr__(self):
+        return "EtxNeighborIndex(%r)" % self._links
+
+
+    def __len__(self):
+        return len(self._links)
+
+
+    def update_link(self, if_name, ip, mac, node):
+        """Adds the link to the neighbor with the given IP and MAC address
+        via the interface, if it is not already known for the given node.
+
+        """
+        if self._nodes.get((if_name, ip)) == node and \
+           self._links.get(node, {}).get(if_name) == (ip, mac):
+            return
+        # the neighbor has changed its node ID or MAC address
+        self.remove_link(if_name, ip)
+        # the node has only one link per interface, the link of another
+        # address with the same node ID is replaced, e.g. of an alias address
+        replaced = self._links.get(node, {}).get(if_name)
+        if replaced is not None:
+            self._nodes.pop((if_name, replaced[0]), None)
+            if self._aliases.get(replaced[0]) == node:
+                del self._aliases[replaced[0]]
+        self._nodes[(if_name, ip)] = node
+        self._links.setdefault(node, dict())[if_name] = (ip, mac)
+        self._aliases[ip] = node
+        if mac:
+            self._aliases[mac] = node
+
+
+    def remove_link(self, if_name, ip):
+        """Removes the link to the neighbor with the given IP address via the
+        interface.
+
+        """
+        node = self._nodes.pop((if_name, ip), None)
+        if node is None:
+            return
+        if self._links.get(node, {}).get(if_name, (None, None))[0] != ip:
+            # the link of the node via the interface has been replaced by
+            # another address, e.g. by several neighbors with the same MAC
+            if self._aliases.get(ip) == node:
+                del self._aliases[ip]
+            return
+        ip, mac = self._links[node].pop(if_name)
+        if len(self._links[node]) == 0:
+            del self._links[node]
+        if self._aliases.get(ip) == node:
+            del self._aliases[ip]
+        # the MAC address is only unique per interface
+        if mac and self._aliases.get(mac) == node and \
+           not any([link[1] == mac for link in self._links.get(node, {}).values()]):
+            del self._aliases[mac]
+
+
+    def remove_interface(self, if_name):
+        """Removes all links via the interface, e.g. if it went down.
+
+        """
+        for (link_if_name, ip) in list(self._nodes.keys()):
+            if link_if_name == if_name:
+                self.remove_link(link_if_name, ip)
+
+
+    def get_node(self, address):
+        """Returns the node for the given node ID, IP or MAC address, or None
+        if the node is unknown.
+
+        """
+        if address in self._links:
+            return address
+        return self._aliases.get(address)
+
+
+    def get_nodes(self):
+        """Returns the list of all known nodes.
+
+        """
+        return list(self._links.keys())
+
+
+    def get_nodes_for(self, addresses):
+        """Returns the list of known nodes for the given node IDs, IP or MAC
+        addresses. Each node is contained only once.
+
+        """
+        nodes = []
+        for address in addresses:
+            node = self.get_node(address)
+            if node is not None and node not in nodes:
+                nodes.append(node)
+        return nodes
+
+
+    def get_links(self, node):
+        """Returns a dictionary that contains the IP and MAC address (ip, mac)
+        of the given node for each interface it can be reached with.
+
+        """
+        return dict(self._links.get(node, {}))
+
+
+    def get_best_link(self, node, interfaces):
+        """Returns the link with the lowest ETX to the given node as tuple
+        (if_name, ip, mac, etx), or None if the node is not reachable.
+        interfaces is the dictionary of etxd.Interface objects.
+
+        """
+        best = None
+        for if_name, (ip, mac) in self._links.get(node, {}).items():
+            interface = interfaces.get(if_name)
+            if interface is None or not hasattr(interface, 'data'):
+                continue
+            etx = interface.data.get_etx(ip)
+            if etx > 0 and (best is None or etx < best[3]):
+                best = (if_name, ip, mac, etx)
+        return best
+
+
+def get_index(interfaces):
+    """Returns the EtxNeighborIndex that is shared by the EtxData objects of
+    the interfaces, or None if no interface has data.
+
+    """
+    for interface in interfaces.values():
+        if hasattr(interface, 'data') and interface.data.index is not None:
+            return interface.data.index
+    return None
+
+
+def get_best_links(interfaces, addresses=None):
+    """Returns a list that contains the best link for each neighbor node as
+    tuple (node, if_name, ip, mac, etx, channel). If a list of addresses (node
+    IDs, IP or MAC addresses) is given, only the best links to these nodes are
+    returned.
+
+    """
+    # make sure the data and thereby the index is up to date
+    for interface in interfaces.values():
+        if hasattr(interface, 'data'):
+            interface.data.remove_old_probes()
+    index = get_index(interfaces)
+    if index is None:
+        return []
+    if addresses is None:
+        nodes = index.get_nodes()
+    else:
+        nodes = index.get_nodes_for(addresses)
+    best_links = []
+    for node in nodes:
+        best = index.get_best_link(node, interfaces)
+        if best is not None:
+            if_name, ip, mac, etx = best
+            channel = getattr(interfaces[if_name], 'channel', -1)
+            best_links.append((node, if_name, ip, mac or "", etx, channel))
+    return best_links
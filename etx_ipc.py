@@ -3,13 +3,21 @@
 This file is part of etxd: A daemon for to measure the Exptected Transmission
 Count (ETX)
 
-This class defines the protocol for the inter process communication interface
+This file defines the protocol for the inter process communication interface
 of the ETX daemon. The interface handles request of other processes for the 
 local network topology. The requests may originate from this node or from
 neighboring nodes that want to determine their 2-hop neighborhood. The
 typical program to use this interface is the channel assignment framework
 DES-Chan.
 
+Local programs that query the daemon often can use the Unix domain sockets
+instead (etxd -u path), which avoid formatting and parsing the text: the
+requests and the responses are encoded in binary, see
+encode_binary_request(..) and encode_binary(..). On the stream socket, each
+message is prefixed by its length (4 bytes) and a connection can be used for
+any number of requests; on the datagram socket (path.dgram), each datagram
+holds a single message. etx_client.py implements the client side.
+
 
 Authors:    Matthias Philipp <mphilipp@inf.fu-berlin.de>,
             Felix Juraschek <fjuraschek@gmail.com>
@@ -38,20 +46,251 @@ For further information and questions please use the web site
 """
 
 from syslog import *
+from etx_log import syslog
+
+import struct
+try:
+    import simplejson
+except ImportError:
+    import json as simplejson
+
+import etx_stats
+from etx_data import EtxData
+from etx_index import get_index, get_best_links
+from etx_window import get_window_interfaces
+
+ERR_SYNTAX = "INVALID SYNTAX"
+ERR_TOO_LARGE = "RESPONSE TOO LARGE"
+
+# record fields returned by each command
+FIELDS = {
+    "NEIGHBORS": ("if_name", "ip", "quality"),
+    "MAC":       ("if_name", "mac", "quality"),
+    "CHAFT":     ("ip", "channel"),
+    "QUALITY":   ("ip", "quality"),
+    "ETX":       ("ip", "etx"),
+    "DUMP":      ("if_name", "ip", "mac", "df", "dr", "quality", "etx", "channel"),
+    "STATS":     ("name", "value"),
+    "BEST":      ("node", "if_name", "ip", "mac", "etx", "channel"),
+    "LINKS":     ("node", "if_name", "ip", "mac", "quality", "etx", "channel"),
+    "MPR":       ("if_name", "ip", "mac", "node", "etx", "covered"),
+}
+
+# line format of the records in the default text framing
+TEXT_FORMATS = {
+    "NEIGHBORS": "%s:%s:%s",
+    "MAC":       "%s|%s|%s",
+    "CHAFT":     "%s:%d",
+    "QUALITY":   "%s:%s",
+    "ETX":       "%s:%s",
+    "DUMP":      "%s|%s|%s|%s|%s|%s|%s|%s",
+    "STATS":     "%s:%s",
+    "BEST":      "%s|%s|%s|%s|%s|%d",
+    "LINKS":     "%s|%s|%s|%s|%s|%s|%d",
+    "MPR":       "%s|%s|%s|%s|%s|%d",
+}
+
+# binary encoding of the fields: strings are prefixed by their length (one
+# byte), numbers are encoded in network byte order
+BINARY_TYPES = {
+    "if_name": "s",
+    "ip":      "s",
+    "mac":     "s",
+    "df":      "d",
+    "dr":      "d",
+    "quality": "d",
+    "etx":     "d",
+    "channel": "i",
+    "name":    "s",
+    "node":    "s",
+    "value":   "d",
+    "covered": "i",
+}
+# precompiled structs of the numeric field types
+STRUCTS = dict([(field_type, struct.Struct("!" + field_type))
+                for field_type in set(BINARY_TYPES.values()) if field_type != "s"])
+
+# available framings of the response, selected by an optional prefix of the
+# request, e.g. "JSON DUMP"
+FRAMINGS = ("TEXT", "JSON", "BIN")
+
+# commands of the binary requests on the Unix domain sockets, the code of a
+# command is its index
+COMMANDS = ("NEIGHBORS", "MAC", "CHAFT", "QUALITY", "ETX", "DUMP", "STATS",
+            "BEST", "LINKS", "MPR")
+# header of the binary requests: command code, window (0 = daemon window)
+# and number of arguments
+REQUEST_HEADER = "!BHB"
+# messages on the Unix domain stream socket are prefixed by their length
+MESSAGE_HEADER = "!I"
+# maximum size of a request and of a response in a single datagram
+MAX_REQUEST = 16384
+MAX_DATAGRAM = 65536
+# the datagram socket is bound to the path of the stream socket plus suffix
+DATAGRAM_SUFFIX = ".dgram"
+
+
+def encode_text(command, records):
+    """Encodes the records in the line based text format.
+
+    """
+    line_format = TEXT_FORMATS[command]
+    lines = []
+    for record in records:
+        try:
+            lines.append((line_format % record + "\n").encode("ascii"))
+        except UnicodeError:
+            # a record that cannot be encoded is left out, see
+            # encode_records(..)
+            continue
+    return b"".join(lines)
+
 
-from twisted.internet.protocol import ServerFactory
-from twisted.protocols.basic import LineOnlyReceiver
-from pythonwifi import iwlibs
+def encode_json(command, records):
+    """Encodes the records as a JSON list of objects, terminated by a newline.
+
+    """
+    fields = FIELDS[command]
+    return (simplejson.dumps([dict(zip(fields, record)) for record in records])
+            + "\n").encode("ascii")
 
-class EtxIpcFactory(ServerFactory):
 
-    def __init__(self, interfaces):
-        self.interfaces = interfaces
-        self.protocol = EtxIpcProtocol
+def encode_records(fields, records):
+    """Encodes the records with the given fields in the compact binary
+    format. The data starts with a status byte (0 = success) and the number
+    of records (two bytes), followed by the fields of each record in the given
+    order, see BINARY_TYPES. Records with strings that are not ASCII or
+    longer than 255 characters are left out, so they do not break the whole
+    response.
+
+    """
+    # strings have no struct
+    types = [STRUCTS.get(BINARY_TYPES[field]) for field in fields]
+    chunks = []
+    for record in records:
+        try:
+            record_chunks = []
+            for field_struct, value in zip(types, record):
+                if field_struct is None:
+                    value = value.encode("ascii")
+                    record_chunks.append(struct.pack("!B", len(value)) + value)
+                else:
+                    record_chunks.append(field_struct.pack(value))
+        except (UnicodeError, struct.error):
+            continue
+        chunks.append(b"".join(record_chunks))
+    return struct.pack("!BH", 0, len(chunks)) + b"".join(chunks)
+
+
+def decode_records(fields, data):
+    """Decodes records with the given fields in the compact binary format and
+    returns them as list of tuples. Raises ValueError if the data is malformed
+    or contains an error message.
 
+    """
+    types = [STRUCTS.get(BINARY_TYPES[field]) for field in fields]
+    # the lengths of the strings are read as integers on Python 2 and 3
+    octets = bytearray(data)
+    try:
+        status, = struct.unpack_from("!B", data)
+        if status != 0:
+            length, = struct.unpack_from("!B", data, 1)
+            raise ValueError(data[2:2 + length].decode("ascii", "replace"))
+        count, = struct.unpack_from("!H", data, 1)
+        offset = 3
+        records = []
+        for i in range(count):
+            record = []
+            for field_struct in types:
+                if field_struct is None:
+                    length = octets[offset]
+                    record.append(data[offset + 1:offset + 1 + length].decode("ascii"))
+                    offset += 1 + length
+                else:
+                    record.append(field_struct.unpack_from(data, offset)[0])
+                    offset += field_struct.size
+            records.append(tuple(record))
+    except (struct.error, IndexError, UnicodeDecodeError) as error:
+        raise ValueError("malformed records: %s" % error)
+    if offset != len(data):
+        raise ValueError("malformed records")
+    return records
+
+
+def encode_binary(command, records):
+    """Encodes the records of the command in the compact binary format, see
+    encode_records(..).
+
+    """
+    return encode_records(FIELDS[command], records)
+
+
+def encode_error(framing, message):
+    """Encodes an error message in the given framing.
+
+    """
+    if framing == "JSON":
+        return (simplejson.dumps({"error": message}) + "\n").encode("ascii")
+    elif framing == "BIN":
+        message = message.encode("ascii")
+        return struct.pack("!BB", 1, len(message)) + message
+    return (message + "\n").encode("ascii")
 
-class EtxIpcProtocol(LineOnlyReceiver):
-    """The protocol supports 5 different request types, which are defined as follows
+
+ENCODERS = {
+    "TEXT": encode_text,
+    "JSON": encode_json,
+    "BIN":  encode_binary,
+}
+
+
+def encode_binary_request(command, args=(), window=0):
+    """Encodes a request for the Unix domain sockets: the header (see
+    REQUEST_HEADER), followed by the arguments, each prefixed by its length
+    (one byte). Raises ValueError for unknown commands.
+
+    """
+    command = command.upper()
+    if command not in COMMANDS:
+        raise ValueError("unknown command %s" % command)
+    chunks = [struct.pack(REQUEST_HEADER, COMMANDS.index(command), window, len(args))]
+    for arg in args:
+        arg = arg.encode("ascii")
+        chunks.append(struct.pack("!B", len(arg)) + arg)
+    return b"".join(chunks)
+
+
+def decode_binary_request(data):
+    """Decodes a binary request and returns the tuple (window, request),
+    where request is the list of the command and its arguments. Raises
+    ValueError if the request is malformed.
+
+    """
+    try:
+        code, window, count = struct.unpack_from(REQUEST_HEADER, data)
+        offset = struct.calcsize(REQUEST_HEADER)
+        request = [COMMANDS[code]]
+        for i in range(count):
+            length, = struct.unpack_from("!B", data, offset)
+            request.append(data[offset + 1:offset + 1 + length].decode("ascii"))
+            offset += 1 + length
+    except (struct.error, IndexError, UnicodeDecodeError):
+        raise ValueError("malformed request")
+    if offset != len(data):
+        raise ValueError("malformed request")
+    return window, request
+
+
+def encode_message(data):
+    """Prefixes a message on the Unix domain stream socket with its length.
+
+    """
+    return struct.pack(MESSAGE_HEADER, len(data)) + data
+
+
+def handle_request(interfaces, request):
+    """Handles the supported requests and returns the encoded response.
+    The protocol supports the following request types:
 
 
     - NEIGHBORS [interface]:    returns the IP address for each neighbor, local interface
@@ -65,137 +304,258 @@ class EtxIpcProtocol(LineOnlyReceiver):
                                 neighbor can be reached on. If min_quality is supplied, only
                                 neighbors with links are returned that satisfy min_quality.                    
 
-    - QUALITY neighbor_ip:      returns the quality (transmission probability) of the link
-                                to the specified neighbor. 
+    - QUALITY neighbor_ip ...:  returns the quality (transmission probability) of the links
+                                to the specified neighbors. 
+
+    - ETX neighbor_ip ...:      returns the ETX values of the links to the specified neighbors.
 
-    - ETX neighbor_ip:          returns the ETX value of the link to the specified neighbor.
+    - DUMP:                     returns the local interface, IP address, MAC address, forward
+                                and reverse delivery ratio, quality, ETX and channel for every
+                                link, including links with a quality of 0 (ETX -1).
+
+    - BEST [neighbor ...]:      returns the node ID, local interface, IP address, MAC address,
+                                ETX and channel of the link with the lowest ETX to each
+                                neighbor node, regardless via which interface it is reachable.
+                                A neighbor can be given by its node ID, IP or MAC address. If
+                                no neighbor is specified, the best links to all nodes are
+                                returned.
+
+    - LINKS neighbor ...:       returns the node ID, local interface, IP address, MAC address,
+                                quality, ETX and channel of all links to the neighbor nodes.
+
+    - MPR [interface ...]:      returns the local interface, IP address, MAC address, node ID
+                                and ETX of the multipoint relays of each interface and the
+                                number of two-hop neighbors they cover (see etx_mpr.py). If
+                                no interface is specified, the relays of all interfaces are
+                                returned.
+
+    - STATS:                    returns the internal statistics of the daemon, e.g. the
+                                percentiles of the event loop lag (see etx_stats.py).
+
+    By default, the response consists of one text line per record. If the
+    request is prefixed with JSON or BIN, the records are returned as a
+    single JSON document or in the binary format of encode_binary(..).
+
+    If the request is prefixed with WINDOW seconds, e.g. "WINDOW 300 DUMP" or
+    "JSON WINDOW 5 BEST", the link qualities of the given additional window
+    (etxd -L) are returned instead of the ones of the daemon window. The
+    multipoint relays are always selected for the daemon window.
+
+    The function is independent of the runtime, the line based protocols of
+    the Twisted and the asyncio runtime both use it.
 
     """
-    delimiter = '\n'
-    ERR_SYNTAX = "INVALID SYNTAX"
-
-    def connectionMade(self):
-        """This functions logs the connection. 
-
-        """
-        syslog(LOG_INFO, "Handling IPC connection from %s:%s" % (self.transport.getPeer().host,
-                                                  self.transport.getPeer().port))
-
-    def lineReceived(self, request):
-        """Handles the supported requests.
-
-        Depending on the particular request, either a bunch of neighbors are returned
-        or information about the link quality to a particular neighbor. See above
-        for the available request.
-
-        """
-        request = request.split()
-        if len(request) == 0:
-            request.append("")
-        # compare commands case-insensitive
-        request[0] = request[0].upper()
-
-        if request[0] == "NEIGHBORS":
-            # see if additional argument is given, this would be the interface name
-            if len(request) > 1:
-                # neighborhood information for a specific interface is requested
-                if_name = request[1]
-                if if_name in self.factory.interfaces.keys():
-                    interface = self.factory.interfaces[if_name]
-                    # discard interfaces without data
-                    if not hasattr(interface, 'data'):
-                        return
-                    # make sure the data is up to date
-                    interface.data.remove_old_probes()
-                    for neighbor, quality in interface.data.get_neighbors().items():
-                        self.sendLine("%s:%s:%s" % (if_name, neighbor, quality)) 
-            else:
-                # return neighborhood information for all interfaces
-                for interface in self.factory.interfaces.values():
-                    # discard interfaces without data
-                    if not hasattr(interface, 'data'):
-                        continue
-                    # make sure the data is up to date
-                    interface.data.remove_old_probes()
-                    for neighbor, quality in interface.data.get_neighbors().items():
-                        self.sendLine("%s:%s:%s" % (interface.name, neighbor, quality)) 
-
-        elif request[0] == "MAC":
-            # return neighborhood information for all interfaces
-            for interface in self.factory.interfaces.values():
+    request = request.split()
+    framing = "TEXT"
+    if len(request) > 0 and request[0].upper() in FRAMINGS:
+        framing = request.pop(0).upper()
+    window = 0
+    if len(request) > 1 and request[0].upper() == "WINDOW":
+        if not request[1].isdigit():
+            return encode_error(framing, ERR_SYNTAX)
+        window = int(request[1])
+        del request[:2]
+    if len(request) == 0:
+        request.append("")
+    # compare commands case-insensitive
+    request[0] = request[0].upper()
+    return get_response(interfaces, framing, window, request)
+
+
+def handle_binary_request(interfaces, data):
+    """Handles a binary request of the Unix domain sockets, see
+    encode_binary_request(..), and returns the response in the binary format
+    of encode_binary(..). The requests are the same as for
+    handle_request(..), but the text has neither to be parsed nor formatted.
+
+    """
+    try:
+        window, request = decode_binary_request(data)
+    except ValueError:
+        return encode_error("BIN", ERR_SYNTAX)
+    return get_response(interfaces, "BIN", window, request)
+
+
+def handle_datagram(interfaces, data):
+    """Handles a binary request on the Unix domain datagram socket. Responses
+    that do not fit into a datagram are replaced by an error, the stream
+    socket has to be used for them.
+
+    """
+    response = handle_binary_request(interfaces, data)
+    if len(response) > MAX_DATAGRAM:
+        return encode_error("BIN", ERR_TOO_LARGE)
+    return response
+
+
+def get_response(interfaces, framing, window, request):
+    """Returns the encoded response to the request for the given window, 0
+    selects the window of the daemon.
+
+    """
+    command = request[0]
+    try:
+        if window:
+            interfaces = get_window_interfaces(interfaces, window, EtxData.WINDOW,
+                                               EtxData.WINDOWS)
+        records = get_records(interfaces, request)
+    except ValueError:
+        return encode_error(framing, ERR_SYNTAX)
+    return ENCODERS[framing](command, records)
+
+
+def get_records(interfaces, request):
+    """Returns the list of records for the request. Each record is a tuple
+    with the values of the fields listed in FIELDS for the command. Raises
+    ValueError if the request is invalid.
+
+    """
+    records = []
+
+    if request[0] == "NEIGHBORS":
+        # see if additional argument is given, this would be the interface name
+        if len(request) > 1:
+            # neighborhood information for a specific interface is requested
+            if_name = request[1]
+            if if_name in interfaces.keys():
+                interface = interfaces[if_name]
                 # discard interfaces without data
                 if not hasattr(interface, 'data'):
-                    continue
+                    return records
                 # make sure the data is up to date
                 interface.data.remove_old_probes()
-                neighbors = interface.data.get_neighbors()
-                for neighbor, quality in neighbors.items():
-                    mac = interface.data.get_mac(neighbor)
-                    if not mac:
-                        syslog(LOG_ERR, "Unable to determine MAC address for %s"
-                                        % neighbor)
-                        continue
-                    self.sendLine("%s|%s|%s" % (interface.name, mac, quality)) 
-
-        elif request[0] == "CHAFT":
-            # see if additional argument for the minimum link quality is given
-            if len(request) > 1 and \
-                    (float(request[1]) >= 0 and float(request[1]) <= 1):
-                min_prob = float(request[1])
-            else:
-                min_prob = 0
-            # return neighbors and channel for all interfaces
-            for interface in self.factory.interfaces.values():
+                for neighbor, quality in interface.data.get_neighbors().items():
+                    records.append((if_name, neighbor, quality))
+        else:
+            # return neighborhood information for all interfaces
+            for interface in interfaces.values():
                 # discard interfaces without data
                 if not hasattr(interface, 'data'):
                     continue
-                # get the channel of the interface
-                channel = iwlibs.Wireless(interface.name).getChannel()
                 # make sure the data is up to date
                 interface.data.remove_old_probes()
                 for neighbor, quality in interface.data.get_neighbors().items():
-                    if quality >= min_prob:
-                        self.sendLine("%s:%d" % (neighbor, channel)) 
-
-        elif request[0] == "QUALITY":
-            # see if the neighbor argument is supplied, for which the quality
-            # (transmission probability should be returned
-            if len(request) < 2:
-                # return error message
-                self.sendLine(EtxIpcProtocol.ERR_SYNTAX)
-            else:
-                neighbor = request[1]
-                for interface in self.factory.interfaces.values():
-                    # discard interfaces without data
-                    if not hasattr(interface, 'data'):
-                        continue
-                    # make sure the data is up to date
-                    interface.data.remove_old_probes()
-                    if neighbor in interface.data.get_neighbors().keys():
-                        quality = interface.data.get_transmission_probability(neighbor)
-                        self.sendLine("%s:%s" % (neighbor, quality)) 
-
-        elif request[0] == "ETX":
-            # see if the neighbor argument is supplied, for which the ETX values should
-            # be returned
-            if len(request) < 2:
-                # return error message
-                self.sendLine(EtxIpcProtocol.ERR_SYNTAX)
-            else:
-                neighbor = request[1]
-                for interface in self.factory.interfaces.values():
-                    # discard interfaces without data
-                    if not hasattr(interface, 'data'):
-                        continue
-                    # make sure the data is up to date
-                    interface.data.remove_old_probes()
-                    if neighbor in interface.data.get_neighbors().keys():
-                        etx = interface.data.get_etx(neighbor)
-                        self.sendLine("%s:%s" % (neighbor, etx)) 
+                    records.append((interface.name, neighbor, quality))
+
+    elif request[0] == "MAC":
+        # return neighborhood information for all interfaces
+        for interface in interfaces.values():
+            # discard interfaces without data
+            if not hasattr(interface, 'data'):
+                continue
+            # make sure the data is up to date
+            interface.data.remove_old_probes()
+            neighbors = interface.data.get_neighbors()
+            for neighbor, quality in neighbors.items():
+                mac = interface.data.get_mac(neighbor)
+                if not mac:
+                    syslog(LOG_ERR, "Unable to determine MAC address for %s"
+                                    % neighbor)
+                    continue
+                records.append((interface.name, mac, quality))
 
+    elif request[0] == "CHAFT":
+        # see if additional argument for the minimum link quality is given
+        if len(request) > 1 and \
+                (float(request[1]) >= 0 and float(request[1]) <= 1):
+            min_prob = float(request[1])
         else:
-            # return error message
-            self.sendLine(EtxIpcProtocol.ERR_SYNTAX)
-        # close the connection
-        self.transport.loseConnection()
-
+            min_prob = 0
+        # return neighbors and channel for all interfaces
+        for interface in interfaces.values():
+            # discard interfaces without data
+            if not hasattr(interface, 'data'):
+                continue
+            # the channel is determined periodically in etxd.py
+            channel = getattr(interface, 'channel', -1)
+            if channel < 0:
+                syslog(LOG_ERR, "Unable to determine channel of %s" % interface.name)
+                continue
+            # make sure the data is up to date
+            interface.data.remove_old_probes()
+            for neighbor, quality in interface.data.get_neighbors().items():
+                if quality >= min_prob:
+                    records.append((neighbor, channel))
+
+    elif request[0] in ("QUALITY", "ETX"):
+        # see if the neighbor arguments are supplied, for which the quality
+        # (transmission probability) or the ETX values should be returned
+        if len(request) < 2:
+            raise ValueError(ERR_SYNTAX)
+        for interface in interfaces.values():
+            # discard interfaces without data
+            if not hasattr(interface, 'data'):
+                continue
+            # make sure the data is up to date
+            interface.data.remove_old_probes()
+            for neighbor in request[1:]:
+                quality = interface.data.get_quality(neighbor)
+                # links with a quality of 0 are no neighbors
+                if quality > 0:
+                    if request[0] == "QUALITY":
+                        records.append((neighbor, quality))
+                    else:
+                        records.append((neighbor, 1 / quality))
+
+    elif request[0] == "DUMP":
+        for interface in interfaces.values():
+            # discard interfaces without data
+            if not hasattr(interface, 'data'):
+                continue
+            channel = getattr(interface, 'channel', -1)
+            # make sure the data is up to date
+            interface.data.remove_old_probes()
+            for neighbor, (df, dr) in interface.data.get_links().items():
+                # the delivery ratios are measured, the quality is published
+                quality = interface.data.get_quality(neighbor)
+                if quality > 0:
+                    etx = 1 / quality
+                else:
+                    etx = -1
+                records.append((interface.name, neighbor,
+                                interface.data.get_mac(neighbor) or "", df, dr,
+                                quality, etx, channel))
+
+    elif request[0] == "BEST":
+        if len(request) > 1:
+            records = get_best_links(interfaces, request[1:])
+        else:
+            records = get_best_links(interfaces)
+
+    elif request[0] == "LINKS":
+        if len(request) < 2:
+            raise ValueError(ERR_SYNTAX)
+        # make sure the data and thereby the index is up to date
+        for interface in interfaces.values():
+            if hasattr(interface, 'data'):
+                interface.data.remove_old_probes()
+        index = get_index(interfaces)
+        if index is None:
+            return records
+        for node in index.get_nodes_for(request[1:]):
+            for if_name, (ip, mac) in sorted(index.get_links(node).items()):
+                data = interfaces[if_name].data
+                records.append((node, if_name, ip, mac or "",
+                                data.get_quality(ip), data.get_etx(ip),
+                                getattr(interfaces[if_name], 'channel', -1)))
+
+    elif request[0] == "MPR":
+        for if_name in request[1:] or sorted(interfaces.keys()):
+            interface = interfaces.get(if_name)
+            # discard unknown interfaces and interfaces without data
+            if interface is None or not hasattr(interface, 'data'):
+                continue
+            # make sure the data is up to date
+            interface.data.remove_old_probes()
+            for relay, covered in sorted(interface.data.get_mpr().items()):
+                records.append((if_name, relay, interface.data.get_mac(relay) or "",
+                                interface.data.get_node_id(relay) or "",
+                                interface.data.get_etx(relay), covered))
+
+    elif request[0] == "STATS":
+        for name, value in sorted(etx_stats.get_stats().items()):
+            records.append((name, value))
+
+    else:
+        raise ValueError(ERR_SYNTAX)
+    return records
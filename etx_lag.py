@@ -0,0 +1,135 @@
+#!/usr/bin/python
+"""
+This file is part of etxd: A daemon for to measure the Exptected Transmission
+Count (ETX)
+
+This file contains the stall detector of the event loop. A timer is scheduled
+periodically and the difference between its scheduled and its actual firing
+time (the lag) is recorded. Any lag delays the probes and thereby skews the
+delivery ratios of all links.
+
+A watchdog thread checks whether the timer is overdue. If it is overdue by
+more than the threshold, the watchdog records the stack of the event loop
+thread, i.e. the call site that blocks the loop. The stack is logged as soon
+as the timer fires again. The percentiles of the lag are available via
+etx_stats.
+
+
+Authors:    Matthias Philipp <mphilipp@inf.fu-berlin.de>,
+            Felix Juraschek <fjuraschek@gmail.com>
+
+Copyright 2008-2013, Freie Universitaet Berlin (FUB). All rights reserved.
+
+These sources were developed at the Freie Universitaet Berlin,
+Computer Systems and Telematics / Distributed, embedded Systems (DES) group
+(http://cst.mi.fu-berlin.de, http://www.des-testbed.net)
+-------------------------------------------------------------------------------
+This program is free software: you can redistribute it and/or modify it under
+the terms of the GNU General Public License as published by the Free Software
+Foundation, either version 3 of the License, or (at your option) any later
+version.
+
+This program is distributed in the hope that it will be useful, but WITHOUT
+ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License along with
+this program. If not, see http://www.gnu.org/licenses/ .
+--------------------------------------------------------------------------------
+For further information and questions please use the web site
+       http://www.des-testbed.net
+
+"""
+
+import sys
+import threading
+import time
+import traceback
+from syslog import *
+from etx_log import syslog
+
+import etx_stats
+
+
+class EtxLagMonitor:
+
+    # interval of the timer in seconds
+    INTERVAL = 0.25
+    # number of recent lag samples used for the percentiles
+    SAMPLES = 1200
+
+    def __init__(self, runtime, threshold):
+        """ Constructor:
+
+        runtime - the runtime of the event loop to monitor
+        threshold - lag in seconds above which a stall is reported
+
+        """
+        self.runtime = runtime
+        self.threshold = threshold
+        # ring buffer of the recent lag samples
+        self._samples = []
+        self._next_sample = 0
+        self._stalls = 0
+        # time the timer is expected to fire
+        self._expected = None
+        # thread ident of the event loop and the stack captured by the watchdog
+        self._loop_thread = None
+        self._stack = None
+
+    def start(self):
+        """Schedules the timer and starts the watchdog thread.
+
+        """
+        self._expected = time.time() + EtxLagMonitor.INTERVAL
+        self.runtime.call_later(EtxLagMonitor.INTERVAL, self._fire)
+        watchdog = threading.Thread(target=self._watch, name="etxd-watchdog")
+        watchdog.daemon = True
+        watchdog.start()
+        etx_stats.register("lag", self.get_stats)
+
+    def _fire(self):
+        """Records the lag of the timer and reschedules it.
+
+        """
+        now = time.time()
+        self._loop_thread = threading.current_thread().ident
+        lag = max(now - self._expected, 0.0)
+        if len(self._samples) < EtxLagMonitor.SAMPLES:
+            self._samples.append(lag)
+        else:
+            self._samples[self._next_sample] = lag
+            self._next_sample = (self._next_sample + 1) % EtxLagMonitor.SAMPLES
+        if lag > self.threshold:
+            self._stalls += 1
+            stack = self._stack
+            if stack is None:
+                stack = "call site unknown"
+            syslog(LOG_WARNING, "Event loop stalled for %.3fs, blocked in:\n%s"
+                                % (lag, stack))
+        self._stack = None
+        self._expected = now + EtxLagMonitor.INTERVAL
+        self.runtime.call_later(EtxLagMonitor.INTERVAL, self._fire)
+
+    def _watch(self):
+        """Captures the stack of the event loop thread while the timer is
+        overdue, runs in the watchdog thread.
+
+        """
+        while True:
+            time.sleep(self.threshold / 2)
+            if self._loop_thread is None or self._stack is not None:
+                continue
+            if time.time() - self._expected > self.threshold:
+                frame = sys._current_frames().get(self._loop_thread)
+                if frame is not None:
+                    self._stack = "".join(traceback.format_stack(frame)[-4:])
+
+    def get_stats(self):
+        """Returns the percentiles of the lag in seconds and the number of
+        stalls.
+
+        """
+        stats = etx_stats.percentiles(self._samples)
+        stats["stalls"] = self._stalls
+        return stats
@@ -0,0 +1,92 @@
+#!/usr/bin/python
+"""
+This file is part of etxd: A daemon for to measure the Exptected Transmission
+Count (ETX)
+
+This file contains a non-blocking replacement for syslog.syslog(). Writing to
+the syslog socket blocks if the syslog daemon is busy, which would delay the
+event loop and thereby the probes. Once start() has been called, messages are
+put into a bounded queue and written by a background thread. If the queue is
+full, messages are dropped and counted. Before start() (e.g. while parsing
+the command line and before forking) messages are written directly.
+
+
+Authors:    Matthias Philipp <mphilipp@inf.fu-berlin.de>,
+            Felix Juraschek <fjuraschek@gmail.com>
+
+Copyright 2008-2013, Freie Universitaet Berlin (FUB). All rights reserved.
+
+These sources were developed at the Freie Universitaet Berlin,
+Computer Systems and Telematics / Distributed, embedded Systems (DES) group
+(http://cst.mi.fu-berlin.de, http://www.des-testbed.net)
+-------------------------------------------------------------------------------
+This program is free software: you can redistribute it and/or modify it under
+the terms of the GNU General Public License as published by the Free Software
+Foundation, either version 3 of the License, or (at your option) any later
+version.
+
+This program is distributed in the hope that it will be useful, but WITHOUT
+ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License along with
+this program. If not, see http://www.gnu.org/licenses/ .
+--------------------------------------------------------------------------------
+For further information and questions please use the web site
+       http://www.des-testbed.net
+
+"""
+
+import syslog as _syslog
+import threading
+try:
+    import queue
+except ImportError:
+    # Python 2
+    import Queue as queue
+
+import etx_stats
+
+# maximum number of messages waiting to be written
+QUEUE_SIZE = 1000
+
+_queue = None
+_dropped = 0
+
+
+def _write_messages():
+    """Writes the queued messages, runs in the background thread.
+
+    """
+    while True:
+        priority, message = _queue.get()
+        _syslog.syslog(priority, message)
+
+
+def start():
+    """Starts the background thread, must be called after forking.
+
+    """
+    global _queue
+    if _queue is not None:
+        return
+    _queue = queue.Queue(QUEUE_SIZE)
+    thread = threading.Thread(target=_write_messages, name="etxd-syslog")
+    thread.daemon = True
+    thread.start()
+    etx_stats.register("log", lambda: {"queued": _queue.qsize(),
+                                       "dropped": _dropped})
+
+
+def syslog(priority, message):
+    """Logs the message with the given priority, see syslog.syslog().
+
+    """
+    global _dropped
+    if _queue is None:
+        _syslog.syslog(priority, message)
+        return
+    try:
+        _queue.put_nowait((priority, message))
+    except queue.Full:
+        _dropped += 1
@@ -0,0 +1,102 @@
+#!/usr/bin/python
+"""
+This file is part of etxd: A daemon for to measure the Exptected Transmission
+Count (ETX)
+
+This file contains the selection of the multipoint relays (MPR) of an
+interface as in OLSR (RFC 3626), based on the link qualities. The probes of
+each neighbor contain its own neighbor table, so the two-hop neighborhood
+and the quality of the links of the neighbors are known. A flooding
+application only has to let the MPRs retransmit a broadcast, as they cover
+all two-hop neighbors.
+
+Only good links, i.e. with a transmission probability of at least
+EtxData.MPR_QUALITY, are used in both hops. The two-hop neighbors are the
+nodes that are reachable via a good link of a neighbor, but not via a good
+direct link. The selection follows the heuristic of OLSR: first the neighbors
+that are the only relay for some two-hop neighbor are selected, then the
+neighbor that covers most of the remaining two-hop neighbors, until all of
+them are covered. Ties are broken by the lowest ETX of the paths via the
+neighbor instead of the willingness and the degree.
+
+
+Authors:    Matthias Philipp <mphilipp@inf.fu-berlin.de>,
+            Felix Juraschek <fjuraschek@gmail.com>
+
+Copyright 2008-2013, Freie Universitaet Berlin (FUB). All rights reserved.
+
+These sources were developed at the Freie Universitaet Berlin,
+Computer Systems and Telematics / Distributed, embedded Systems (DES) group
+(http://cst.mi.fu-berlin.de, http://www.des-testbed.net)
+-------------------------------------------------------------------------------
+This program is free software: you can redistribute it and/or modify it under
+the terms of the GNU General Public License as published by the Free Software
+Foundation, either version 3 of the License, or (at your option) any later
+version.
+
+This program is distributed in the hope that it will be useful, but WITHOUT
+ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License along with
+this program. If not, see http://www.gnu.org/licenses/ .
+--------------------------------------------------------------------------------
+For further information and questions please use the web site
+       http://www.des-testbed.net
+
+"""
+
+
+def get_relay_links(neighbors, twohop, own_ip, min_quality):
+    """Returns the good links that are relevant for the selection as
+    dictionary: the ETX of the two-hop paths via each neighbor. neighbors is
+    a dictionary with the quality of the link to each neighbor, twohop
+    contains a dictionary with the quality of the links of each neighbor.
+
+    """
+    # links without any received probes have no ETX
+    relays = dict([(neighbor, quality) for neighbor, quality in neighbors.items()
+                   if quality > 0 and quality >= min_quality])
+    links = dict()
+    for relay, quality in relays.items():
+        paths = dict()
+        for node, twohop_quality in twohop.get(relay, {}).items():
+            if node == own_ip or node in relays or twohop_quality <= 0 \
+               or twohop_quality < min_quality:
+                continue
+            paths[node] = 1 / quality + 1 / twohop_quality
+        if paths:
+            links[relay] = paths
+    return links
+
+
+def select_mpr(links):
+    """Returns a dictionary that contains the number of covered two-hop
+    neighbors for each MPR, see get_relay_links(..) for links.
+
+    """
+    # relays[node] = list of neighbors that cover the two-hop neighbor
+    relays = dict()
+    for relay, paths in links.items():
+        for node in paths.keys():
+            relays.setdefault(node, []).append(relay)
+    mpr = set()
+    # the only relays of a two-hop neighbor are always selected
+    for node, candidates in relays.items():
+        if len(candidates) == 1:
+            mpr.add(candidates[0])
+    uncovered = set(relays.keys())
+    for relay in mpr:
+        uncovered.difference_update(links[relay].keys())
+    while uncovered:
+        best = None
+        for relay in sorted(set(links.keys()) - mpr):
+            covered = [node for node in links[relay].keys() if node in uncovered]
+            if not covered:
+                continue
+            key = (len(covered), -sum([links[relay][node] for node in covered]))
+            if best is None or key > best[0]:
+                best = (key, relay)
+        mpr.add(best[1])
+        uncovered.difference_update(links[best[1]].keys())
+    return dict([(relay, len(links[relay])) for relay in mpr])
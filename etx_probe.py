@@ -8,6 +8,13 @@ probes. Probes are sent as a broadcast so potentially they reach all neighbors
 in the transmission range. Each probe contains the MAC address of the sender
 and information about our neighbors and the corresponding link qualities.
 
+By default, the probes are sent in the pickle format, which is understood by
+all versions of etxd. With etxd -B, they are sent in the compact binary
+format from a buffer that is only patched for the neighbors whose entries
+have changed (see EtxProbeBuffer), so the cost of sending a probe does not
+grow with the number of neighbors. Both formats are accepted from the
+neighbors, but older versions only understand the pickle format.
+
 
 Authors:    Matthias Philipp <mphilipp@inf.fu-berlin.de>,
             Felix Juraschek <fjuraschek@gmail.com>
@@ -35,20 +42,313 @@ For further information and questions please use the web site
        
 """
 
+import binascii
 import pickle
+import struct
 import netifaces
 from syslog import *
-from socket import SOL_SOCKET, SO_BROADCAST
-from twisted.internet.protocol import DatagramProtocol
+from etx_log import syslog
+from socket import SOL_SOCKET, SO_BROADCAST, inet_aton, inet_ntoa
+from socket import error as socket_error
+
+# key of the node ID in the neighbor information of a probe. Nodes that do not
+# know about node IDs ignore the key, since it is no IP address.
+NODE_ID = "node_id"
+# key of the number of received probes during the additional windows in the
+# neighbor data of a probe, see EtxData.get_probe_windows()
+WINDOWS = "windows"
+
+# magic bytes and version of the compact binary probe format
+PROBE_MAGIC = b"EX\x01"
+# entry of a neighbor in the compact binary format
+ENTRY = struct.Struct("!4sHH")
+# probe counts of an entry, which are patched in place
+COUNTS = struct.Struct("!HH")
+
+
+def encode_header(mac, node_id):
+    """Returns the header of a probe in the compact binary format without the
+    number of neighbors, see encode_probe(..).
+
+    """
+    if mac:
+        mac = binascii.unhexlify(mac.replace(":", "").encode("ascii"))
+    else:
+        mac = b"\x00" * 6
+    if len(mac) != 6:
+        raise ValueError("invalid MAC address")
+    node_id = (node_id or "").encode("utf-8")[:255]
+    return PROBE_MAGIC + mac + struct.pack("!B", len(node_id)) + node_id
+
+
+def encode_probe(mac, node_id, data):
+    """Encodes a probe in the compact binary format: the magic bytes, the MAC
+    address (6 bytes), the length of the node ID (1 byte) followed by the node
+    ID, the number of neighbors (2 bytes) and for each neighbor its IP address
+    (4 bytes), the number of probes we received from it and the number of
+    probes it received from us (2 bytes each).
+
+    If data contains the key WINDOWS, an optional section follows: the number
+    of windows (1 byte), the length of each window (2 bytes) and for each
+    neighbor in the same order as above the number of probes we received
+    from it during each window (2 bytes each).
+
+    """
+    try:
+        windows = data.get(WINDOWS)
+        neighbors = [neighbor for neighbor in data.keys() if neighbor != WINDOWS]
+        chunks = [encode_header(mac, node_id), struct.pack("!H", len(neighbors))]
+        for neighbor in neighbors:
+            received, sent = data[neighbor]
+            chunks.append(ENTRY.pack(inet_aton(neighbor), min(received, 0xffff),
+                                     min(sent, 0xffff)))
+        if windows is not None:
+            lengths = sorted(windows.keys())
+            chunks.append(struct.pack("!B%dH" % len(lengths), len(lengths), *lengths))
+            for neighbor in neighbors:
+                chunks.append(struct.pack("!%dH" % len(lengths),
+                                          *[min(windows[window].get(neighbor, 0), 0xffff)
+                                            for window in lengths]))
+    except (TypeError, ValueError, UnicodeError, binascii.Error, struct.error,
+            socket_error) as error:
+        raise ValueError("unable to encode probe: %s" % error)
+    return b"".join(chunks)
+
+
+def decode_probe(payload):
+    """Decodes a probe in the compact binary format and returns the tuple
+    (mac, node_id, data), see encode_probe(..). The node ID is None if the
+    sender does not advertise one. data contains the key WINDOWS if the probe
+    has a section for the additional windows. Raises ValueError if the probe
+    is malformed.
+
+    """
+    try:
+        offset = len(PROBE_MAGIC)
+        mac = ":".join(["%02x" % byte for byte in bytearray(payload[offset:offset + 6])])
+        length, = struct.unpack_from("!B", payload, offset + 6)
+        offset += 7
+        node_id = payload[offset:offset + length].decode("utf-8") or None
+        offset += length
+        count, = struct.unpack_from("!H", payload, offset)
+        offset += 2
+        data = dict()
+        neighbors = []
+        for i in range(count):
+            received, sent = struct.unpack_from("!HH", payload, offset + 4)
+            neighbors.append(inet_ntoa(payload[offset:offset + 4]))
+            data[neighbors[-1]] = (received, sent)
+            offset += 8
+        if offset < len(payload):
+            length, = struct.unpack_from("!B", payload, offset)
+            lengths = struct.unpack_from("!%dH" % length, payload, offset + 1)
+            offset += 1 + 2 * length
+            windows = data[WINDOWS] = dict([(window, dict()) for window in lengths])
+            for neighbor in neighbors:
+                counts = struct.unpack_from("!%dH" % length, payload, offset)
+                for window, received in zip(lengths, counts):
+                    windows[window][neighbor] = received
+                offset += 2 * length
+    except (struct.error, UnicodeDecodeError, socket_error) as error:
+        raise ValueError("malformed probe: %s" % error)
+    if payload[:len(PROBE_MAGIC)] != PROBE_MAGIC or offset != len(payload):
+        raise ValueError("malformed probe")
+    return mac, node_id, data
+
+
+def check_node_id(node_id):
+    """Returns the node ID of a received probe as string, or None if the
+    sender does not advertise one. The node ID is returned by the IPC
+    interface in all framings, so it has to consist of at most 255 printable
+    ASCII characters without whitespace and the separators of the text
+    format. Raises ValueError otherwise.
+
+    """
+    if not node_id:
+        return None
+    try:
+        if isinstance(node_id, bytes):
+            node_id = node_id.decode("ascii")
+        node_id = str(node_id.encode("ascii").decode("ascii"))
+    except (AttributeError, UnicodeError):
+        raise ValueError("invalid node ID %r" % (node_id,))
+    if len(node_id) > 255 or [char for char in node_id
+                               if not "!" <= char <= "~" or char in "|:"]:
+        raise ValueError("invalid node ID %r" % (node_id,))
+    return node_id
+
+
+def decode_datagram(datagram):
+    """Decodes a received probe, either in the compact binary format or in
+    the pickle format, and returns the tuple (mac, node_id, data). Raises
+    ValueError if the probe is malformed or the node ID is invalid, see
+    check_node_id(..).
+
+    """
+    if datagram[:len(PROBE_MAGIC)] == PROBE_MAGIC:
+        mac, node_id, data = decode_probe(datagram)
+    else:
+        try:
+            mac, data = pickle.loads(datagram)
+            node_id = data.pop(NODE_ID, None)
+        except Exception as error:
+            raise ValueError("malformed probe: %r" % error)
+    return mac, check_node_id(node_id), data
+
+
+class EtxProbeBuffer:
+    """Keeps the probe of an interface in the compact binary format in a
+    preallocated buffer. Each neighbor has a fixed entry, which EtxData
+    patches whenever a probe of the neighbor arrives or expires. The entry of
+    a removed neighbor is replaced by the last entry. Only the section of the
+    additional windows is written anew for each probe.
+
+    """
+    # initial number of neighbor entries
+    CAPACITY = 64
+
+    def __init__(self, mac, node_id):
+        header = encode_header(mac, node_id)
+        # offset of the number of neighbors and of the first entry
+        self._count_offset = len(header)
+        self._entries_offset = len(header) + 2
+        self.buffer = bytearray(self._entries_offset + EtxProbeBuffer.CAPACITY * ENTRY.size)
+        self.buffer[:len(header)] = header
+        # _slots[neighbor] = index of its entry, _neighbors[index] = neighbor
+        self._slots = dict()
+        self._neighbors = []
+        # _sections[number of windows] = struct of the counts of a neighbor
+        self._sections = dict()
+        # length of the probe
+        self.length = self._entries_offset
+
+    def _reserve(self, length):
+        """Makes sure the buffer holds at least length bytes.
+
+        """
+        if len(self.buffer) < length:
+            # a new buffer, the old one may still be referenced by a view
+            self.buffer = self.buffer + bytearray(max(length, 2 * len(self.buffer))
+                                                  - len(self.buffer))
+
+    def _set_count(self):
+        struct.pack_into("!H", self.buffer, self._count_offset, len(self._neighbors))
+        self.length = self._entries_offset + len(self._neighbors) * ENTRY.size
 
-class EtxProbeProtocol(DatagramProtocol):
+    def set_entry(self, neighbor, received, sent):
+        """Sets the number of probes that we received from the neighbor and
+        that it received from us.
+
+        """
+        index = self._slots.get(neighbor)
+        if index is not None:
+            COUNTS.pack_into(self.buffer, self._entries_offset + index * ENTRY.size + 4,
+                             min(received, 0xffff), min(sent, 0xffff))
+            return
+        try:
+            address = inet_aton(neighbor)
+        except socket_error:
+            # not an IPv4 address, the neighbor is left out
+            return
+        index = self._slots[neighbor] = len(self._neighbors)
+        self._neighbors.append(neighbor)
+        self._reserve(self._entries_offset + len(self._neighbors) * ENTRY.size)
+        ENTRY.pack_into(self.buffer, self._entries_offset + index * ENTRY.size,
+                        address, min(received, 0xffff), min(sent, 0xffff))
+        self._set_count()
+
+    def set_counts(self, counts):
+        """Sets the probe counts of several neighbors at once, counts is a
+        list of the tuples (neighbor, received, sent).
+
+        """
+        buffer = self.buffer
+        slots = self._slots
+        offset = self._entries_offset + 4
+        pack_into = COUNTS.pack_into
+        for neighbor, received, sent in counts:
+            index = slots.get(neighbor)
+            if index is None:
+                self.set_entry(neighbor, received, sent)
+                # the buffer may have been replaced
+                buffer = self.buffer
+                continue
+            if received > 0xffff or sent > 0xffff:
+                received, sent = min(received, 0xffff), min(sent, 0xffff)
+            pack_into(buffer, offset + index * ENTRY.size, received, sent)
+
+    def remove_entry(self, neighbor):
+        """Removes the entry of the neighbor, if any.
+
+        """
+        index = self._slots.pop(neighbor, None)
+        if index is None:
+            return
+        # move the last entry to the free slot
+        last = len(self._neighbors) - 1
+        if index != last:
+            moved = self._neighbors[index] = self._neighbors[last]
+            self._slots[moved] = index
+            source = self._entries_offset + last * ENTRY.size
+            target = self._entries_offset + index * ENTRY.size
+            self.buffer[target:target + ENTRY.size] = self.buffer[source:source + ENTRY.size]
+        del self._neighbors[last]
+        self._set_count()
+
+    def set_windows(self, windows):
+        """Writes the section of the additional windows after the entries,
+        windows is the dictionary of EtxData.get_probe_windows().
+
+        """
+        lengths = sorted(windows.keys())
+        section = self._sections.get(len(lengths))
+        if section is None:
+            section = self._sections[len(lengths)] = struct.Struct("!%dH" % len(lengths))
+        offset = self._entries_offset + len(self._neighbors) * ENTRY.size
+        self._reserve(offset + 1 + section.size * (len(self._neighbors) + 1))
+        struct.pack_into("!B", self.buffer, offset, len(lengths))
+        section.pack_into(self.buffer, offset + 1, *lengths)
+        offset += 1 + section.size
+        for neighbor in self._neighbors:
+            section.pack_into(self.buffer, offset,
+                              *[min(windows[window].get(neighbor, 0), 0xffff)
+                                for window in lengths])
+            offset += section.size
+        self.length = offset
+
+    def get_probe(self):
+        """Returns a view of the probe in the buffer.
+
+        """
+        return memoryview(self.buffer)[:self.length]
+
+
+class EtxProbeProtocol:
 
     DEBUG = False
+    # whether the probes are sent in the compact binary format, which older
+    # versions do not understand
+    BINARY = False
 
-    def __init__(self, if_name, own_ip, etx_data):
+    def __init__(self, if_name, own_ip, etx_data, mac=None, node_id=None):
         self.if_name = if_name
         self.own_ip = own_ip
         self.etx_data = etx_data
+        # MAC address of the interface, looked up when sending if not given
+        self.mac = mac
+        # node ID that is advertised in the probes on all interfaces
+        self.node_id = node_id
+        # set by the runtime as soon as the protocol is listening
+        self.transport = None
+        # EtxTraceWriter that records all probes, if enabled
+        self.trace = None
+        # EtxProbeScheduler that learns the probe phases of the neighbors
+        self.scheduler = None
+        # EtxProbeBuffer of the compact binary probes, created with the first
+        # probe
+        self.buffer = None
+        # broadcast address of the probes
+        self.destination = None
 
     def startProtocol(self):
         # set broadcast socket option
@@ -57,7 +357,7 @@ class EtxProbeProtocol(DatagramProtocol):
     def datagramReceived(self, datagram, addr):
         """This functions handles incoming probes.
 
-        Each correctly received probe is unpickled, and the corresponding MAC and
+        Each correctly received probe is decoded, and the corresponding MAC and
         IP are stored. The neighbor information is stored as receveived and the
         timestamp for the sender is updated.
         
@@ -66,14 +366,38 @@ class EtxProbeProtocol(DatagramProtocol):
         neighbor_ip = addr[0]
         # ignore probes from myself
         if neighbor_ip != self.own_ip:
+            timestamp = self.etx_data.clock()
             # deserialize the message
-            neighbor_mac, data = pickle.loads(datagram)
+            try:
+                neighbor_mac, node_id, data = decode_datagram(datagram)
+            except ValueError as error:
+                syslog(LOG_WARNING, "%s: ignoring probe from %s: %s" % (self.if_name,
+                                                                      neighbor_ip, error))
+                return
+            # ignore new neighbors if the neighbor table is full
+            if not self.etx_data.admit_neighbor(neighbor_ip, timestamp):
+                return
+            if self.trace is not None:
+                self.trace.record_probe(self.trace.RECEIVED, timestamp, self.if_name,
+                                        neighbor_ip, neighbor_mac, node_id, data)
+            # the number of received probes during the additional windows
+            windows = data.pop(WINDOWS, None)
+            if windows is not None:
+                self.etx_data.set_window_info(neighbor_ip, windows)
             # store mac <-> ip association
             self.etx_data.set_mac(neighbor_ip, neighbor_mac)
+            # store the node ID if the neighbor advertises one
+            if node_id is not None:
+                self.etx_data.set_node_id(neighbor_ip, node_id)
             # store etx data
             self.etx_data.set_neighbor_info(neighbor_ip, data)
             # add timestamp to the list
-            self.etx_data.add_timestamp(neighbor_ip)
+            self.etx_data.add_timestamp(neighbor_ip, timestamp)
+            # keep the buffer of the binary probes up to date
+            if self.buffer is not None:
+                self.etx_data.expire_probes(timestamp)
+            if self.scheduler is not None:
+                self.scheduler.observe(self.if_name, neighbor_ip, timestamp)
             if EtxProbeProtocol.DEBUG:
                 # remove old probes
                 self.etx_data.remove_old_probes()
@@ -82,20 +406,77 @@ class EtxProbeProtocol(DatagramProtocol):
     def send_probe(self):
         """This functions generates a probe and sends it out as a broadcast.
 
-        The probe consists of our MAC address and our information about our neighbors.
+        The probe consists of our MAC address and our information about our neighbors,
+        which includes our node ID.
         
         """
+        # the runtime has not yet started the protocol
+        if self.transport is None:
+            return
+        if self.destination is None:
+            self.destination = (self.transport.getHost().host, self.transport.getHost().port)
         if EtxProbeProtocol.DEBUG:
-            syslog(LOG_DEBUG, "Sending probe to %s:%s" % (self.transport.getHost().host,
-                                                          self.transport.getHost().port))
+            syslog(LOG_DEBUG, "Sending probe to %s:%s" % self.destination)
         # get mac address of this interface
-        mac = netifaces.ifaddresses(self.if_name)[netifaces.AF_LINK][0]['addr']
+        if self.mac is None:
+            self.mac = netifaces.ifaddresses(self.if_name)[netifaces.AF_LINK][0]['addr']
+        mac = self.mac
+        timestamp = self.etx_data.clock()
+        if EtxProbeProtocol.BINARY:
+            # the buffer is kept up to date on arrival and by expire_probes()
+            self.send_buffer(timestamp)
+            return
         # make sure the probe data is up to date
-        self.etx_data.remove_old_probes()
+        self.etx_data.remove_old_probes(timestamp)
         data = self.etx_data.get_probe_data()
-        # serialize tuple with mac and data 
-        datagram = pickle.dumps((mac, data))
+        windows = self.etx_data.get_probe_windows(timestamp)
+        if windows is not None:
+            data[WINDOWS] = windows
+        if self.trace is not None:
+            self.trace.record_probe(self.trace.SENT, timestamp, self.if_name,
+                                    self.own_ip, mac, self.node_id, data)
+        if self.node_id is not None:
+            data[NODE_ID] = self.node_id
+        # serialize tuple with mac and data, protocol 2 is understood by
+        # nodes running on python 2 and 3
+        datagram = pickle.dumps((mac, data), 2)
+        # broadcast the probe
+        self.transport.write(datagram, self.destination)
+
+    def expire_probes(self):
+        """Applies the expired probes to the buffer of the binary probes. It
+        is called once per probe interval, so the entries of neighbors that
+        have gone silent expire as well. The call is recorded in the trace,
+        so the replay yields the same probes.
+
+        """
+        if self.buffer is None:
+            return
+        timestamp = self.etx_data.clock()
+        self.etx_data.expire_probes(timestamp)
+        if self.trace is not None:
+            self.trace.record_payload(self.trace.EXPIRED, timestamp, self.if_name,
+                                      self.own_ip, b"")
+
+    def send_buffer(self, timestamp):
+        """Sends the probe from the buffer, whose entries are patched by
+        EtxData as soon as they change.
+
+        """
+        if self.buffer is None or self.etx_data.probe_buffer is not self.buffer:
+            # the buffer is filled once, afterwards only changes are applied
+            self.etx_data.expire_probes(timestamp)
+            self.buffer = EtxProbeBuffer(self.mac, self.node_id)
+            for neighbor, (received, sent) in self.etx_data.get_probe_data().items():
+                self.buffer.set_entry(neighbor, received, sent)
+            self.etx_data.probe_buffer = self.buffer
+        windows = self.etx_data.get_probe_windows(timestamp)
+        if windows is not None:
+            self.buffer.set_windows(windows)
+        probe = self.buffer.get_probe()
+        if self.trace is not None:
+            self.trace.record_payload(self.trace.SENT, timestamp, self.if_name,
+                                      self.own_ip, probe.tobytes())
         # broadcast the probe
-        self.transport.write(datagram, (self.transport.getHost().host,
-                                        self.transport.getHost().port))
+        self.transport.write(probe, self.destination)
 
@@ -0,0 +1,209 @@
+#!/usr/bin/python
+"""
+This file is part of etxd: A daemon for to measure the Exptected Transmission
+Count (ETX)
+
+This file contains the replay tool for probe traces that were recorded by
+etxd -t. The received probes are fed back through EtxProbeProtocol and EtxData
+on a virtual clock with the window, the limits, the damping and the probe
+format of the recorded daemon, so the link tables evolve exactly as in the
+daemon. For
+each sent probe the link table of the replay is compared with the recorded
+one. The rotated files of a trace have to be given from the oldest to the
+newest one:
+
+    python etx_replay.py [-s speed] [-o] trace.2 trace.1 trace
+
+    -s speed  replays the trace speed times faster than real time, by default
+              the trace is replayed as fast as possible
+    -o        prints the link table of the interface for each sent probe
+
+The tool exits with status 1 if any link table differs from the recorded one.
+
+
+Authors:    Matthias Philipp <mphilipp@inf.fu-berlin.de>,
+            Felix Juraschek <fjuraschek@gmail.com>
+
+Copyright 2008-2013, Freie Universitaet Berlin (FUB). All rights reserved.
+
+These sources were developed at the Freie Universitaet Berlin,
+Computer Systems and Telematics / Distributed, embedded Systems (DES) group
+(http://cst.mi.fu-berlin.de, http://www.des-testbed.net)
+-------------------------------------------------------------------------------
+This program is free software: you can redistribute it and/or modify it under
+the terms of the GNU General Public License as published by the Free Software
+Foundation, either version 3 of the License, or (at your option) any later
+version.
+
+This program is distributed in the hope that it will be useful, but WITHOUT
+ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License along with
+this program. If not, see http://www.gnu.org/licenses/ .
+--------------------------------------------------------------------------------
+For further information and questions please use the web site
+       http://www.des-testbed.net
+
+"""
+
+import getopt
+import sys
+import time
+
+from etx_data import EtxData
+from etx_index import EtxNeighborIndex
+from etx_probe import WINDOWS, EtxProbeProtocol, decode_datagram, decode_probe
+from etx_trace import EtxTraceReader, EtxTraceWriter
+
+
+class VirtualClock:
+    """Clock of the replay, set to the timestamp of each record.
+
+    """
+    def __init__(self):
+        self.now = 0.0
+
+    def time(self):
+        return self.now
+
+
+class _Transport:
+    """Keeps the last probe sent by the protocol instead of sending it.
+
+    """
+    host = "<broadcast>"
+    port = 0
+
+    def __init__(self):
+        self.datagram = None
+
+    def getHost(self):
+        return self
+
+    def write(self, datagram, addr):
+        # the protocol reuses the buffer of the probe
+        self.datagram = memoryview(datagram).tobytes()
+
+
+def replay(paths, speed=0, output=None):
+    """Replays the trace files in the given order and returns a dictionary
+    with the number of records, received and sent probes, the number of link
+    tables that differ from the recorded ones, the duration of the trace and
+    the wall clock time of the replay. If output is given, the link table of
+    each sent probe is written to it.
+
+    If the trace does not start with the first file of etxd, the probes that
+    were received before are missing. The link tables of the first window are
+    then not compared, but counted as warm-up.
+
+    """
+    clock = VirtualClock()
+    index = EtxNeighborIndex()
+    # protocols[if_name] = EtxProbeProtocol
+    protocols = dict()
+    # warm_up[if_name] = end of the warm-up or None until the first probe
+    warm_up = dict()
+    stats = {"records": 0, "received": 0, "sent": 0, "mismatches": 0,
+             "warm_up": 0, "duration": 0.0}
+    first = None
+    start = time.time()
+    for path in paths:
+        reader = EtxTraceReader(path)
+        EtxData.WINDOW = reader.window
+        EtxData.INTERVAL = reader.interval
+        # the limits and the damping of the recorded daemon
+        for name, value in reader.settings.items():
+            setattr(EtxData, name, value)
+        EtxProbeProtocol.BINARY = reader.binary
+        for kind, timestamp, if_name, ip, payload in reader:
+            stats["records"] += 1
+            if kind in (EtxTraceWriter.INTERFACE, EtxTraceWriter.RESUMED):
+                protocol = protocols.get(if_name)
+                # keep the state of resumed interfaces, unless the interface
+                # has been reconfigured
+                if kind == EtxTraceWriter.RESUMED and protocol is not None \
+                   and protocol.own_ip == ip:
+                    continue
+                mac, node_id, data = decode_probe(payload)
+                EtxData.WINDOWS = tuple(sorted(data.get(WINDOWS, {}).keys()))
+                index.remove_interface(if_name)
+                data = EtxData(ip, if_name=if_name, index=index, clock=clock.time)
+                protocol = EtxProbeProtocol(if_name, ip, data, mac, node_id)
+                protocol.transport = _Transport()
+                protocols[if_name] = protocol
+                if kind == EtxTraceWriter.RESUMED:
+                    warm_up[if_name] = None
+                else:
+                    warm_up.pop(if_name, None)
+                continue
+            protocol = protocols.get(if_name)
+            if protocol is None:
+                continue
+            if first is None:
+                first = timestamp
+            stats["duration"] = timestamp - first
+            if speed > 0:
+                delay = start + (timestamp - first) / speed - time.time()
+                if delay > 0:
+                    time.sleep(delay)
+            clock.now = timestamp
+            if if_name in warm_up and warm_up[if_name] is None:
+                warm_up[if_name] = timestamp + EtxData.WINDOW
+            if kind == EtxTraceWriter.EXPIRED:
+                protocol.expire_probes()
+            elif kind == EtxTraceWriter.RECEIVED:
+                stats["received"] += 1
+                protocol.datagramReceived(payload, (ip, 0))
+            elif kind == EtxTraceWriter.SENT:
+                stats["sent"] += 1
+                protocol.send_probe()
+                mac, node_id, data = decode_datagram(protocol.transport.datagram)
+                if if_name in warm_up and timestamp <= warm_up[if_name]:
+                    stats["warm_up"] += 1
+                elif data != decode_probe(payload)[2]:
+                    stats["mismatches"] += 1
+                if output is not None:
+                    output.write("%.6f %s %s\n" % (timestamp, if_name,
+                                 " ".join(["%s:%s:%s" % (neighbor, received, sent)
+                                           for neighbor, (received, sent) in sorted(data.items())])))
+        reader.close()
+    stats["time"] = time.time() - start
+    return stats
+
+
+def main():
+    try:
+        opt_list, paths = getopt.getopt(sys.argv[1:], "s:o")
+    except getopt.GetoptError:
+        sys.stderr.write("Error while parsing parameters: %s\n" % sys.exc_info()[1])
+        sys.exit(1)
+    if len(paths) < 1:
+        sys.stderr.write(__doc__.split("Authors:")[0])
+        sys.exit(1)
+    speed = 0
+    output = None
+    for opt, val in opt_list:
+        if opt == "-s":
+            speed = float(val)
+        elif opt == "-o":
+            output = sys.stdout
+    try:
+        stats = replay(paths, speed, output)
+    except (IOError, ValueError) as error:
+        sys.stderr.write("Error: %s\n" % error)
+        sys.exit(1)
+    rate = stats["records"] / max(stats["time"], 1e-9)
+    print("%d records (%d received, %d sent probes) of %.1fs in %.3fs: "
+          "%.0f records/s, %.0fx real time"
+          % (stats["records"], stats["received"], stats["sent"],
+             stats["duration"], stats["time"], rate,
+             stats["duration"] / max(stats["time"], 1e-9)))
+    print("%d of %d link tables differ from the recorded ones, %d not compared "
+          "during the warm-up" % (stats["mismatches"], stats["sent"], stats["warm_up"]))
+    if stats["mismatches"] > 0:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
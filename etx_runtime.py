@@ -0,0 +1,161 @@
+#!/usr/bin/python
+"""
+This file is part of etxd: A daemon for to measure the Exptected Transmission
+Count (ETX)
+
+This file contains the runtime abstraction of etxd. The daemon itself, the
+probe protocol, the IPC interface and the web server do not talk to an event
+loop directly, but to a runtime object that provides timers, datagram and
+stream listeners. Two runtimes are available: the Twisted epoll reactor (see
+etx_twisted.py), which is the default, and a lightweight runtime based on the
+asyncio module of the Python standard library (see etx_aio.py), which does not
+need Twisted at all.
+
+The runtime modules are only imported when the runtime is created, so a node
+that uses the asyncio runtime does not need to have Twisted installed.
+
+Blocking operations (subprocesses, ioctls, ...) must not be run in the event
+loop thread, since they would delay the probes. Runtime.run_blocking(..)
+runs them in a bounded thread pool and enforces a timeout.
+
+
+Authors:    Matthias Philipp <mphilipp@inf.fu-berlin.de>,
+            Felix Juraschek <fjuraschek@gmail.com>
+
+Copyright 2008-2013, Freie Universitaet Berlin (FUB). All rights reserved.
+
+These sources were developed at the Freie Universitaet Berlin,
+Computer Systems and Telematics / Distributed, embedded Systems (DES) group
+(http://cst.mi.fu-berlin.de, http://www.des-testbed.net)
+-------------------------------------------------------------------------------
+This program is free software: you can redistribute it and/or modify it under
+the terms of the GNU General Public License as published by the Free Software
+Foundation, either version 3 of the License, or (at your option) any later
+version.
+
+This program is distributed in the hope that it will be useful, but WITHOUT
+ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License along with
+this program. If not, see http://www.gnu.org/licenses/ .
+--------------------------------------------------------------------------------
+For further information and questions please use the web site
+       http://www.des-testbed.net
+
+"""
+
+from syslog import *
+from etx_log import syslog
+
+import os
+import stat
+
+import etx_stats
+
+# names of the available runtimes, the first one is the default
+RUNTIMES = ("twisted", "asyncio")
+
+
+class CannotListenError(Exception):
+    """Raised by the runtimes if a port cannot be bound.
+
+    """
+    pass
+
+
+class BlockingCallTimeout(Exception):
+    """Passed to the errback of Runtime.run_blocking(..) if the call did not
+    return in time.
+
+    """
+    pass
+
+
+class Runtime:
+    """Base class of the runtimes. The subclasses provide the timers, the
+    listeners, the event loop and _call_in_thread(..).
+
+    """
+    # maximum number of threads for blocking calls
+    THREADS = 4
+
+    def __init__(self):
+        self._pending = 0
+        self._timeouts = 0
+        self._errors = 0
+        etx_stats.register("threads", self._get_stats)
+
+    def _get_stats(self):
+        return {"pending": self._pending, "timeouts": self._timeouts,
+                "errors": self._errors}
+
+    def _call_in_thread(self, func, args, finished):
+        """Calls func(*args) in the thread pool and finished(result, error) in
+        the event loop thread afterwards.
+
+        """
+        raise NotImplementedError
+
+    def run_blocking(self, func, args, callback, timeout, errback=None):
+        """Calls func(*args) in the thread pool and callback(result) in the
+        event loop thread as soon as it returned. If func raises an exception
+        or does not return within timeout seconds, errback(exception) is
+        called instead and a late result is discarded. The default errback
+        logs the error.
+
+        """
+        if errback is None:
+            def errback(error):
+                syslog(LOG_WARNING, "Blocking call %s failed: %r" % (func.__name__, error))
+        # the call is done as soon as it returned or timed out
+        done = []
+
+        def finished(result, error):
+            self._pending -= 1
+            if done:
+                return
+            done.append(True)
+            timer.cancel()
+            if error is None:
+                callback(result)
+            else:
+                self._errors += 1
+                errback(error)
+
+        def timed_out():
+            if done:
+                return
+            done.append(True)
+            self._timeouts += 1
+            errback(BlockingCallTimeout("%s did not return within %ss"
+                                        % (func.__name__, timeout)))
+
+        self._pending += 1
+        timer = self.call_later(timeout, timed_out)
+        self._call_in_thread(func, args, finished)
+
+
+def remove_stale_socket(path):
+    """Removes the Unix domain socket at path that has been left behind by a
+    previous run, other files are kept.
+
+    """
+    try:
+        if stat.S_ISSOCK(os.stat(path).st_mode):
+            os.unlink(path)
+    except OSError:
+        pass
+
+
+def create_runtime(name):
+    """Returns a new runtime object for the runtime with the given name.
+
+    """
+    if name == "twisted":
+        from etx_twisted import TwistedRuntime
+        return TwistedRuntime()
+    elif name == "asyncio":
+        from etx_aio import AsyncioRuntime
+        return AsyncioRuntime()
+    raise ValueError("unknown runtime: %s" % name)
@@ -0,0 +1,193 @@
+#!/usr/bin/python
+"""
+This file is part of etxd: A daemon for to measure the Exptected Transmission
+Count (ETX)
+
+This file contains the scheduler of the probe transmissions. With a random
+jitter, probes of neighbors that send at nearly the same time collide again
+and again, and these broadcast losses are counted as link loss. The scheduler
+divides the probe interval into slots and learns the slot of each neighbor
+from the arrival time of its probes, relative to the local clock. Each
+interface sends its probes at a random offset within its own slot, so the
+phase of its probes stays stable from interval to interval. If the slot is
+shared with neighbors while another slot is less occupied, the interface
+moves there with a probability of 1/2, so two neighbors in the same slot
+rarely move to the same new one. Neighbors in the same slot still hear each
+other most of the time, as their offsets within the slot differ. In a cell
+with more neighbors than half the number of slots, the probes are spread over
+the whole interval with a random jitter as before.
+
+The interfaces of a node share one scheduler and prefer slots that are not
+used by another local interface. Worker processes (etxd -W) can not see the
+slots of each other, instead each one uses only its share of the slots.
+
+
+Authors:    Matthias Philipp <mphilipp@inf.fu-berlin.de>,
+            Felix Juraschek <fjuraschek@gmail.com>
+
+Copyright 2008-2013, Freie Universitaet Berlin (FUB). All rights reserved.
+
+These sources were developed at the Freie Universitaet Berlin,
+Computer Systems and Telematics / Distributed, embedded Systems (DES) group
+(http://cst.mi.fu-berlin.de, http://www.des-testbed.net)
+-------------------------------------------------------------------------------
+This program is free software: you can redistribute it and/or modify it under
+the terms of the GNU General Public License as published by the Free Software
+Foundation, either version 3 of the License, or (at your option) any later
+version.
+
+This program is distributed in the hope that it will be useful, but WITHOUT
+ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License along with
+this program. If not, see http://www.gnu.org/licenses/ .
+--------------------------------------------------------------------------------
+For further information and questions please use the web site
+       http://www.des-testbed.net
+
+"""
+
+import random
+import time
+
+
+class EtxProbeScheduler:
+
+    # number of slots per probe interval, 0 falls back to a random jitter
+    SLOTS = 200
+    # a slot is left only for one with at least MARGIN neighbors less
+    MARGIN = 1
+    # probability to leave a crowded slot per probe
+    MOVE_PROBABILITY = 0.5
+    # neighbors are assigned to the slot of their last probe for EXPIRE
+    # probe intervals
+    EXPIRE = 10
+    # maximum number of neighbors per slot, beyond that the probes are spread
+    # over the whole interval again
+    MAX_LOAD = 0.5
+
+    def __init__(self, interval, group=None, clock=time.time):
+        """ Constructor:
+
+        interval - probe interval in seconds
+        group    - tuple (index, count), restricts the slots to those with
+                   slot % count == index, used by the worker processes
+        clock    - function that returns the current time in seconds
+
+        """
+        self.interval = interval
+        self.group = group
+        self.clock = clock
+        # _arrivals[if_name][neighbor] = time of the last probe
+        self._arrivals = dict()
+        # _slots[if_name] = slot of the interface
+        self._slots = dict()
+        # number of slot changes
+        self.moves = 0
+
+
+    def observe(self, if_name, neighbor, timestamp):
+        """Records the arrival of a probe from the neighbor.
+
+        """
+        self._arrivals.setdefault(if_name, dict())[neighbor] = timestamp
+
+
+    def remove_interface(self, if_name):
+        """Releases the slot of the interface, e.g. if it went down.
+
+        """
+        self._arrivals.pop(if_name, None)
+        self._slots.pop(if_name, None)
+
+
+    def get_slot(self, timestamp):
+        """Returns the slot of the given time.
+
+        """
+        phase = timestamp % self.interval
+        return min(int(phase * EtxProbeScheduler.SLOTS / self.interval),
+                   EtxProbeScheduler.SLOTS - 1)
+
+
+    def get_occupancy(self, if_name, now=None):
+        """Returns a list with the number of neighbors of the interface in
+        each slot. Neighbors that have not sent a probe for a while are
+        removed.
+
+        """
+        if now is None:
+            now = self.clock()
+        occupancy = [0] * EtxProbeScheduler.SLOTS
+        arrivals = self._arrivals.get(if_name, {})
+        for neighbor, timestamp in list(arrivals.items()):
+            if now - timestamp > EtxProbeScheduler.EXPIRE * self.interval:
+                del arrivals[neighbor]
+            else:
+                occupancy[self.get_slot(timestamp)] += 1
+        return occupancy
+
+
+    def _select_slot(self, if_name, occupancy):
+        """Returns the slot of the interface for the next probe and moves
+        the interface to a less occupied slot if required.
+
+        """
+        # slots of the other local interfaces
+        local = [slot for name, slot in self._slots.items() if name != if_name]
+        slots = range(EtxProbeScheduler.SLOTS)
+        if self.group is not None:
+            index, count = self.group
+            slots = [slot for slot in slots if slot % count == index % count] or slots
+        costs = dict([(slot, (local.count(slot), occupancy[slot])) for slot in slots])
+        best = min(costs.values())
+        slot = self._slots.get(if_name)
+        if slot in costs:
+            shared, neighbors = costs[slot]
+            if shared == best[0] and neighbors < best[1] + EtxProbeScheduler.MARGIN:
+                return slot
+            if random.random() >= EtxProbeScheduler.MOVE_PROBABILITY:
+                return slot
+            self.moves += 1
+        slot = random.choice([slot for slot, cost in costs.items() if cost == best])
+        self._slots[if_name] = slot
+        return slot
+
+
+    def next_delay(self, if_name, now=None):
+        """Returns the delay in seconds until the interface sends its next
+        probe. Called right after each probe.
+
+        """
+        if now is None:
+            now = self.clock()
+        if EtxProbeScheduler.SLOTS > 0:
+            occupancy = self.get_occupancy(if_name, now)
+        # probes that collide whenever they are sent make their slots look
+        # free, so the slots of a crowded cell would be filled up more and more
+        if EtxProbeScheduler.SLOTS <= 0 or \
+           sum(occupancy) > EtxProbeScheduler.MAX_LOAD * EtxProbeScheduler.SLOTS:
+            self._slots.pop(if_name, None)
+            # variate delay by +-10% to avoid collisions due to synchronization
+            return 0.9*self.interval + random.uniform(0.0, 0.2*self.interval)
+        slot = self._select_slot(if_name, occupancy)
+        length = float(self.interval) / EtxProbeScheduler.SLOTS
+        start = now - now % self.interval
+        target = start + (slot + random.random()) * length
+        # keep the average rate when the slot changes
+        while target - now < 0.5 * self.interval:
+            target += self.interval
+        return target - now
+
+
+    def get_stats(self):
+        """Returns the number of slot changes and the number of neighbors
+        that share the slots of the interfaces.
+
+        """
+        now = self.clock()
+        shared = 0
+        for if_name, slot in list(self._slots.items()):
+            shared += self.get_occupancy(if_name, now)[slot]
+        return {"moves": self.moves, "shared": shared}
@@ -0,0 +1,205 @@
+#!/usr/bin/python
+"""
+This file is part of etxd: A daemon for to measure the Exptected Transmission
+Count (ETX)
+
+This file contains the passive link estimator. The broadcast probes are sent
+at the basic rate and cost airtime, while the wireless driver keeps counters
+of the unicast traffic to each station: the number of transmitted frames, of
+retries and of frames that failed after all retries (nl80211 station dump).
+The estimator periodically reads the counters, derives the probability that a
+unicast transmission including the ACK succeeds from their increase and passes
+it to EtxData, where it is merged with or substituted for the probe based
+value (etxd -e). Intervals with too few transmissions are ignored, so idle
+links keep the probe based value.
+
+The counters are read from a pluggable source: the output of
+"iw dev <interface> station dump" or a file with recorded dumps, which allows
+to test the estimator on a machine without wireless hardware. A recorded file
+contains several dumps, each one preceded by a line starting with #, e.g.:
+
+    while true; do date +"# %s"; iw dev wlan0 station dump; sleep 2; done
+
+
+Authors:    Matthias Philipp <mphilipp@inf.fu-berlin.de>,
+            Felix Juraschek <fjuraschek@gmail.com>
+
+Copyright 2008-2013, Freie Universitaet Berlin (FUB). All rights reserved.
+
+These sources were developed at the Freie Universitaet Berlin,
+Computer Systems and Telematics / Distributed, embedded Systems (DES) group
+(http://cst.mi.fu-berlin.de, http://www.des-testbed.net)
+-------------------------------------------------------------------------------
+This program is free software: you can redistribute it and/or modify it under
+the terms of the GNU General Public License as published by the Free Software
+Foundation, either version 3 of the License, or (at your option) any later
+version.
+
+This program is distributed in the hope that it will be useful, but WITHOUT
+ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License along with
+this program. If not, see http://www.gnu.org/licenses/ .
+--------------------------------------------------------------------------------
+For further information and questions please use the web site
+       http://www.des-testbed.net
+
+"""
+
+import subprocess
+
+# sources of the transmission probability, see EtxData.ESTIMATOR
+ESTIMATORS = ("probe", "merge", "station")
+
+# fields of the station dump that are used by the estimator
+_FIELDS = {
+    "tx packets": "tx_packets",
+    "tx retries": "tx_retries",
+    "tx failed":  "tx_failed",
+    "inactive time": "inactive",
+    "signal avg": "signal",
+}
+
+
+def parse_station_dump(text):
+    """Parses the output of "iw dev <interface> station dump" and returns a
+    dictionary that contains a dictionary with the counters (tx_packets,
+    tx_retries, tx_failed), the inactive time in ms and the average signal in
+    dBm for each MAC address. Stations without transmit counters are left
+    out.
+
+    """
+    stations = dict()
+    station = None
+    for line in text.splitlines():
+        if line.startswith("Station "):
+            station = dict()
+            stations[line.split()[1].lower()] = station
+            continue
+        key, _, value = line.partition(":")
+        key = key.strip()
+        if station is None or key not in _FIELDS:
+            continue
+        try:
+            station[_FIELDS[key]] = int(value.split()[0])
+        except (IndexError, ValueError):
+            continue
+    return dict([(mac, station) for mac, station in stations.items()
+                 if "tx_packets" in station and "tx_retries" in station
+                 and "tx_failed" in station])
+
+
+class IwSource:
+    """Reads the station dump of the interface with iw.
+
+    """
+    def __init__(self, if_name):
+        self.if_name = if_name
+
+    def read(self):
+        return subprocess.check_output(["iw", "dev", self.if_name, "station",
+                                        "dump"]).decode("ascii", "replace")
+
+
+class FileSource:
+    """Returns the dumps of a file with recorded dumps one after the other,
+    the last one is repeated.
+
+    """
+    def __init__(self, path):
+        self.path = path
+        self._dumps = None
+        self._next = 0
+
+    def read(self):
+        if self._dumps is None:
+            dump_file = open(self.path)
+            self._dumps = [[]]
+            for line in dump_file:
+                if line.startswith("#"):
+                    if self._dumps[-1]:
+                        self._dumps.append([])
+                else:
+                    self._dumps[-1].append(line)
+            dump_file.close()
+        dump = "".join(self._dumps[self._next])
+        self._next = min(self._next + 1, len(self._dumps) - 1)
+        return dump
+
+
+def create_source(spec, if_name):
+    """Returns the source of the station dumps for the interface: "iw" or
+    the path of a file with recorded dumps, in which %s is replaced by the
+    name of the interface.
+
+    """
+    if spec == "iw":
+        return IwSource(if_name)
+    # other % characters of the path are kept
+    return FileSource(spec.replace("%s", if_name))
+
+
+class EtxStationEstimator:
+
+    # interval of the station dumps in seconds, configured in etxd.py
+    INTERVAL = 2
+    # minimum number of transmission attempts per interval for an estimate
+    MIN_FRAMES = 10
+    # weight of the latest interval in the moving average
+    ALPHA = 0.3
+
+    def __init__(self, source):
+        """ Constructor:
+
+        source - source of the station dumps, see create_source(..)
+
+        """
+        self.source = source
+        # _counters[mac] = (tx_packets, tx_retries, tx_failed) of the last dump
+        self._counters = dict()
+        # _qualities[mac] = moving average of the transmission probability
+        self._qualities = dict()
+
+    def read_stations(self):
+        """Reads and parses a station dump. This function blocks, thus it is
+        run in the thread pool of the runtime.
+
+        """
+        return parse_station_dump(self.source.read())
+
+    def update(self, stations, etx_data, timestamp=None):
+        """Derives the transmission probability of each station from the
+        increase of its counters since the last dump and passes it to the
+        EtxData object for the neighbor with the MAC address of the station.
+
+        """
+        neighbors = dict([(mac, ip) for ip, mac in etx_data.get_macs().items() if mac])
+        for mac, station in stations.items():
+            counters = (station["tx_packets"], station["tx_retries"],
+                        station["tx_failed"])
+            previous = self._counters.get(mac)
+            self._counters[mac] = counters
+            if previous is None:
+                continue
+            sent, retries, failed = [counter - last for counter, last in zip(counters, previous)]
+            # the counters have been reset, e.g. after a reassociation
+            if sent < 0 or retries < 0 or failed < 0:
+                continue
+            attempts = sent + retries
+            if attempts < EtxStationEstimator.MIN_FRAMES:
+                continue
+            sample = float(max(sent - failed, 0)) / attempts
+            quality = self._qualities.get(mac)
+            if quality is None:
+                quality = sample
+            else:
+                quality += EtxStationEstimator.ALPHA * (sample - quality)
+            self._qualities[mac] = quality
+            if mac in neighbors:
+                etx_data.set_station_quality(neighbors[mac], quality, timestamp)
+        # forget the stations that have left
+        for mac in list(self._counters.keys()):
+            if mac not in stations:
+                del self._counters[mac]
+                self._qualities.pop(mac, None)
@@ -0,0 +1,84 @@
+#!/usr/bin/python
+"""
+This file is part of etxd: A daemon for to measure the Exptected Transmission
+Count (ETX)
+
+This file contains the registry for the internal statistics of the daemon.
+Components register a function that returns a dictionary of their current
+counters and measurements. The statistics of all components are returned by
+the STATS request of the IPC interface and by the /stats page of the web
+server.
+
+
+Authors:    Matthias Philipp <mphilipp@inf.fu-berlin.de>,
+            Felix Juraschek <fjuraschek@gmail.com>
+
+Copyright 2008-2013, Freie Universitaet Berlin (FUB). All rights reserved.
+
+These sources were developed at the Freie Universitaet Berlin,
+Computer Systems and Telematics / Distributed, embedded Systems (DES) group
+(http://cst.mi.fu-berlin.de, http://www.des-testbed.net)
+-------------------------------------------------------------------------------
+This program is free software: you can redistribute it and/or modify it under
+the terms of the GNU General Public License as published by the Free Software
+Foundation, either version 3 of the License, or (at your option) any later
+version.
+
+This program is distributed in the hope that it will be useful, but WITHOUT
+ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License along with
+this program. If not, see http://www.gnu.org/licenses/ .
+--------------------------------------------------------------------------------
+For further information and questions please use the web site
+       http://www.des-testbed.net
+
+"""
+
+# registered sources, _sources[name] = function returning a dictionary
+_sources = {}
+
+
+def register(name, source):
+    """Registers a function that returns a dictionary with the statistics of
+    the component with the given name.
+
+    """
+    _sources[name] = source
+
+
+def unregister(name):
+    """Removes the statistics source with the given name.
+
+    """
+    _sources.pop(name, None)
+
+
+def get_stats():
+    """Returns a dictionary with the statistics of all registered components.
+    The keys are prefixed with the name of the component, e.g. lag.p99.
+
+    """
+    stats = dict()
+    for name, source in _sources.items():
+        for key, value in source().items():
+            stats["%s.%s" % (name, key)] = value
+    return stats
+
+
+def percentiles(samples, points=(50, 90, 99)):
+    """Returns a dictionary with the given percentiles (p50, ...) and the
+    maximum of the samples.
+
+    """
+    ordered = sorted(samples)
+    result = dict()
+    for point in points:
+        if ordered:
+            result["p%d" % point] = ordered[min(len(ordered) - 1,
+                                                len(ordered) * point // 100)]
+        else:
+            result["p%d" % point] = 0.0
+    result["max"] = ordered and ordered[-1] or 0.0
+    return result
@@ -0,0 +1,268 @@
+#!/usr/bin/python
+"""
+This file is part of etxd: A daemon for to measure the Exptected Transmission
+Count (ETX)
+
+This file contains the writer and the reader of probe traces. If enabled, etxd
+records every received and sent probe to an append-only binary trace, which
+can be fed back through EtxProbeProtocol and EtxData by etx_replay.py to
+reproduce the behavior of a link in the field.
+
+A trace file starts with a header that contains the magic bytes, the format
+version, the window size and the probe interval, followed by the other
+settings of EtxData that change the link tables (see SETTINGS) and the flags
+(BINARY_PROBES if the probes were sent in the binary format), which are
+applied again by the replay. The header is followed by records
+that consist of the record type (1 byte), the timestamp (8 bytes, double),
+the length of the interface name (1 byte) and the interface name, the IP
+address of the sender (4 bytes), the length of the probe (2 bytes) and the
+probe in the compact binary format of etx_probe.encode_probe(..). The first
+records of each file describe the local interfaces (IP address, MAC address,
+node ID and the additional windows, see etx_window.py), the other records the
+received and sent probes. An interface
+record is written whenever etxd starts to use the interface and repeated at
+the beginning of each rotated file. If the probes are sent in the binary
+format, an empty expiry record is written whenever the expired probes are
+removed from the buffer of the probes once per interval.
+
+The size of a trace file is bounded. If it exceeds the maximum size, the file
+is rotated like a log file (trace, trace.1, trace.2, ...) and the oldest file
+is removed.
+
+
+Authors:    Matthias Philipp <mphilipp@inf.fu-berlin.de>,
+            Felix Juraschek <fjuraschek@gmail.com>
+
+Copyright 2008-2013, Freie Universitaet Berlin (FUB). All rights reserved.
+
+These sources were developed at the Freie Universitaet Berlin,
+Computer Systems and Telematics / Distributed, embedded Systems (DES) group
+(http://cst.mi.fu-berlin.de, http://www.des-testbed.net)
+-------------------------------------------------------------------------------
+This program is free software: you can redistribute it and/or modify it under
+the terms of the GNU General Public License as published by the Free Software
+Foundation, either version 3 of the License, or (at your option) any later
+version.
+
+This program is distributed in the hope that it will be useful, but WITHOUT
+ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License along with
+this program. If not, see http://www.gnu.org/licenses/ .
+--------------------------------------------------------------------------------
+For further information and questions please use the web site
+       http://www.des-testbed.net
+
+"""
+
+import os
+import struct
+from socket import inet_aton, inet_ntoa
+
+import etx_stats
+from etx_data import EtxData
+from etx_probe import WINDOWS, EtxProbeProtocol, encode_probe
+
+TRACE_MAGIC = b"ETXT"
+TRACE_VERSION = 2
+HEADER = struct.Struct("!4sBHH")
+# settings of EtxData that are recorded after the header since version 2
+SETTINGS = ("MAX_NEIGHBORS", "MAX_TWOHOP", "MIN_SAMPLES", "HYSTERESIS", "HOLD_DOWN")
+SETTINGS_FORMAT = struct.Struct("!IIIdIB")
+# flags that follow the settings
+BINARY_PROBES = 1
+RECORD = struct.Struct("!Bd")
+
+
+class EtxTraceWriter:
+
+    # record types
+    INTERFACE = 0
+    RECEIVED = 1
+    SENT = 2
+    # interface record repeated at the beginning of a rotated file
+    RESUMED = 3
+    # expired probes removed from the buffer of the binary probes
+    EXPIRED = 4
+
+    def __init__(self, path, max_size=10 * 1024 * 1024, backups=4):
+        """ Constructor:
+
+        path - path of the trace file
+        max_size - maximum size of a trace file in bytes
+        backups - number of rotated trace files that are kept
+
+        """
+        self.path = path
+        self.max_size = max_size
+        self.backups = backups
+        # _interfaces[if_name] = arguments of the interface record, repeated
+        # in each file
+        self._interfaces = dict()
+        self.records = 0
+        self.skipped = 0
+        # never append to a trace that was written with another configuration
+        if os.path.exists(path) and os.path.getsize(path) > 0:
+            self._shift()
+        self._open()
+        etx_stats.register("trace", lambda: {"records": self.records,
+                                             "skipped": self.skipped,
+                                             "size": self.size})
+
+    def _open(self):
+        """Creates the trace file and writes the header and the interfaces.
+
+        """
+        self.file = open(self.path, "wb")
+        self.size = 0
+        self._write(HEADER.pack(TRACE_MAGIC, TRACE_VERSION, EtxData.WINDOW,
+                                EtxData.INTERVAL))
+        flags = 0
+        if EtxProbeProtocol.BINARY:
+            flags |= BINARY_PROBES
+        self._write(SETTINGS_FORMAT.pack(*[getattr(EtxData, name) for name in SETTINGS]
+                                         + [flags]))
+        for args in self._interfaces.values():
+            self._write(self._encode(EtxTraceWriter.RESUMED, *args))
+
+    def _shift(self):
+        """Renames the existing trace files, the oldest one is removed.
+
+        """
+        for i in range(self.backups, 0, -1):
+            if i > 1:
+                source = "%s.%d" % (self.path, i - 1)
+            else:
+                source = self.path
+            if os.path.exists(source):
+                os.rename(source, "%s.%d" % (self.path, i))
+        if self.backups == 0:
+            os.remove(self.path)
+
+    def _rotate(self):
+        """Starts a new trace file.
+
+        """
+        self.file.close()
+        self._shift()
+        self._open()
+
+    def _write(self, record):
+        self.file.write(record)
+        self.size += len(record)
+
+    def _encode(self, kind, timestamp, if_name, ip, payload):
+        if_name = if_name.encode("ascii")
+        return b"".join([RECORD.pack(kind, timestamp),
+                         struct.pack("!B", len(if_name)), if_name, inet_aton(ip),
+                         struct.pack("!H", len(payload)), payload])
+
+    def add_interface(self, timestamp, if_name, ip, mac, node_id):
+        """Records the address, MAC address and node ID of the interface and
+        the additional windows of EtxData.
+
+        """
+        data = dict()
+        if EtxData.WINDOWS:
+            data[WINDOWS] = dict([(window, dict()) for window in EtxData.WINDOWS])
+        args = (timestamp, if_name, ip, encode_probe(mac, node_id, data))
+        self._interfaces[if_name] = args
+        self._write(self._encode(EtxTraceWriter.INTERFACE, *args))
+
+    def record_probe(self, kind, timestamp, if_name, ip, mac, node_id, data):
+        """Records a received or sent probe. Probes that cannot be encoded
+        are skipped. The file is flushed whenever a probe has been sent.
+
+        """
+        try:
+            payload = encode_probe(mac, node_id, data)
+        except ValueError:
+            self.skipped += 1
+            return
+        self.record_payload(kind, timestamp, if_name, ip, payload)
+
+    def record_payload(self, kind, timestamp, if_name, ip, payload):
+        """Records a probe that is already encoded in the compact binary
+        format, e.g. the probes sent from an EtxProbeBuffer.
+
+        """
+        self._write(self._encode(kind, timestamp, if_name, ip, payload))
+        self.records += 1
+        if self.size >= self.max_size:
+            self._rotate()
+        elif kind == EtxTraceWriter.SENT:
+            # make the records available to etx_replay.py once per interval
+            self.file.flush()
+
+    def close(self):
+        etx_stats.unregister("trace")
+        self.file.close()
+
+
+class EtxTraceReader:
+
+    def __init__(self, path):
+        """ Constructor:
+
+        path - path of the trace file
+
+        Reads the header of the trace file and raises ValueError if it is no
+        trace file. The recorded settings of EtxData are kept in settings,
+        which is empty for traces of version 1, and binary tells whether the
+        probes were sent in the binary format.
+
+        """
+        self.file = open(path, "rb")
+        header = self.file.read(HEADER.size)
+        if len(header) != HEADER.size:
+            raise ValueError("%s: no trace file" % path)
+        magic, version, self.window, self.interval = HEADER.unpack(header)
+        if magic != TRACE_MAGIC or version not in (1, TRACE_VERSION):
+            raise ValueError("%s: no trace file or unsupported version" % path)
+        self.settings = dict()
+        self.binary = False
+        if version >= 2:
+            settings = self.file.read(SETTINGS_FORMAT.size)
+            if len(settings) != SETTINGS_FORMAT.size:
+                raise ValueError("%s: truncated header" % path)
+            settings = SETTINGS_FORMAT.unpack(settings)
+            self.settings = dict(zip(SETTINGS, settings[:-1]))
+            self.binary = bool(settings[-1] & BINARY_PROBES)
+
+    def __iter__(self):
+        """Returns the records as tuples (kind, timestamp, if_name, ip,
+        payload). The payload is the probe in the compact binary format, see
+        etx_probe.decode_probe(..). The records are read one by one, so large
+        traces are not kept in memory. A truncated record at the end of the
+        file, e.g. of a trace that is still written, is ignored.
+
+        """
+        data = b""
+        offset = 0
+        while True:
+            # the data always contains the largest possible record, unless
+            # the end of the file has been reached
+            if len(data) - offset < 2 * 65536:
+                data = data[offset:] + self.file.read(4 * 65536)
+                offset = 0
+            if offset + RECORD.size + 1 > len(data):
+                return
+            kind, timestamp = RECORD.unpack_from(data, offset)
+            length, = struct.unpack_from("!B", data, offset + RECORD.size)
+            start = offset + RECORD.size + 1
+            if start + length + 6 > len(data):
+                return
+            if_name = data[start:start + length].decode("ascii")
+            start += length
+            ip = inet_ntoa(data[start:start + 4])
+            length, = struct.unpack_from("!H", data, start + 4)
+            start += 6
+            if start + length > len(data):
+                return
+            payload = data[start:start + length]
+            offset = start + length
+            yield kind, timestamp, if_name, ip, payload
+
+    def close(self):
+        self.file.close()
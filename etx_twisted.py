@@ -0,0 +1,242 @@
+#!/usr/bin/python
+"""
+This file is part of etxd: A daemon for to measure the Exptected Transmission
+Count (ETX)
+
+This file contains the runtime based on the Twisted epoll reactor. The probe
+protocol, the IPC request handling and the web server are independent of
+Twisted, this file contains the Twisted protocols, factories and resources
+that connect them to the reactor.
+
+
+Authors:    Matthias Philipp <mphilipp@inf.fu-berlin.de>,
+            Felix Juraschek <fjuraschek@gmail.com>
+
+Copyright 2008-2013, Freie Universitaet Berlin (FUB). All rights reserved.
+
+These sources were developed at the Freie Universitaet Berlin,
+Computer Systems and Telematics / Distributed, embedded Systems (DES) group
+(http://cst.mi.fu-berlin.de, http://www.des-testbed.net)
+-------------------------------------------------------------------------------
+This program is free software: you can redistribute it and/or modify it under
+the terms of the GNU General Public License as published by the Free Software
+Foundation, either version 3 of the License, or (at your option) any later
+version.
+
+This program is distributed in the hope that it will be useful, but WITHOUT
+ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License along with
+this program. If not, see http://www.gnu.org/licenses/ .
+--------------------------------------------------------------------------------
+For further information and questions please use the web site
+       http://www.des-testbed.net
+
+"""
+
+from syslog import *
+from etx_log import syslog
+
+import socket
+
+from twisted.internet import epollreactor
+from twisted.internet import error
+from twisted.internet.protocol import DatagramProtocol, ServerFactory
+from twisted.protocols.basic import Int32StringReceiver, LineOnlyReceiver
+from twisted.web import http, resource, server
+
+from etx_runtime import CannotListenError, Runtime, remove_stale_socket
+from etx_ipc import MAX_REQUEST, handle_binary_request, handle_datagram, handle_request
+
+
+class EtxDatagramProtocol(DatagramProtocol):
+    """Forwards the datagram events of the reactor to an EtxProbeProtocol.
+
+    """
+    def __init__(self, protocol):
+        self.protocol = protocol
+
+    def startProtocol(self):
+        self.protocol.transport = self.transport
+        self.protocol.startProtocol()
+
+    def datagramReceived(self, datagram, addr):
+        self.protocol.datagramReceived(datagram, addr)
+
+
+class EtxIpcFactory(ServerFactory):
+
+    def __init__(self, interfaces, protocol=None):
+        self.interfaces = interfaces
+        self.protocol = protocol or EtxIpcProtocol
+
+
+class EtxIpcProtocol(LineOnlyReceiver):
+    """Line based IPC protocol, see etx_ipc.handle_request(..) for the
+    supported requests.
+
+    """
+    delimiter = b'\n'
+
+    def connectionMade(self):
+        """This functions logs the connection. 
+
+        """
+        syslog(LOG_INFO, "Handling IPC connection from %s:%s" % (self.transport.getPeer().host,
+                                                  self.transport.getPeer().port))
+
+    def lineReceived(self, request):
+        """Handles the request and closes the connection afterwards.
+
+        """
+        self.transport.write(handle_request(self.factory.interfaces,
+                                            request.decode("ascii", "replace")))
+        # close the connection
+        self.transport.loseConnection()
+
+
+class EtxUnixIpcProtocol(Int32StringReceiver):
+    """Binary IPC protocol of the Unix domain stream socket, the messages are
+    prefixed by their length. The connection is kept open for further
+    requests.
+
+    """
+    MAX_LENGTH = MAX_REQUEST
+
+    def stringReceived(self, request):
+        self.sendString(handle_binary_request(self.factory.interfaces, request))
+
+
+class EtxUnixDatagramProtocol(DatagramProtocol):
+    """Binary IPC protocol of the Unix domain datagram socket.
+
+    """
+    def __init__(self, interfaces):
+        self.interfaces = interfaces
+
+    def datagramReceived(self, datagram, addr):
+        # clients without an address cannot receive the response
+        if not addr:
+            return
+        try:
+            self.transport.write(handle_datagram(self.interfaces, datagram), addr)
+        except (socket.error, error.MessageLengthError):
+            # the client has gone
+            pass
+
+
+class EtxWebResource(resource.Resource):
+    """Serves the JSON document of an EtxWebServer.
+
+    """
+    isLeaf = True
+
+    def __init__(self, web_server):
+        resource.Resource.__init__(self)
+        self.web_server = web_server
+
+    def render_GET(self, request):
+        path = request.uri
+        if not isinstance(path, str):
+            path = path.decode("latin-1")
+        etag, body = self.web_server.render(path)
+        # answer conditional requests if the document is unchanged
+        if request.setETag(etag.encode("ascii")) == http.CACHED:
+            return b""
+        return body.encode("utf-8")
+
+
+class TwistedRuntime(Runtime):
+    """Runtime based on the Twisted epoll reactor.
+
+    """
+    name = "twisted"
+
+    def __init__(self):
+        Runtime.__init__(self)
+        epollreactor.install()
+        from twisted.internet import reactor
+        self.reactor = reactor
+        self.reactor.suggestThreadPoolSize(Runtime.THREADS)
+
+    def _call_in_thread(self, func, args, finished):
+        def call():
+            try:
+                result = func(*args)
+            except Exception as error:
+                self.reactor.callFromThread(finished, None, error)
+            else:
+                self.reactor.callFromThread(finished, result, None)
+        self.reactor.callInThread(call)
+
+    def call_later(self, delay, func, *args):
+        """Calls func with the given arguments after delay seconds.
+
+        """
+        return self.reactor.callLater(delay, func, *args)
+
+    def call_when_running(self, func, *args):
+        """Calls func with the given arguments as soon as the event loop runs.
+
+        """
+        self.reactor.callWhenRunning(func, *args)
+
+    def listen_udp(self, port, protocol, interface):
+        """Starts the datagram protocol at the given address. Returns an
+        object that provides stopListening() and getHost().
+
+        """
+        try:
+            return self.reactor.listenUDP(port, EtxDatagramProtocol(protocol), interface)
+        except error.CannotListenError:
+            raise CannotListenError(interface, port)
+
+    def listen_ipc(self, port, interfaces, interface):
+        """Starts the IPC protocol at the given address. Returns an object
+        that provides stopListening().
+
+        """
+        try:
+            return self.reactor.listenTCP(port, EtxIpcFactory(interfaces), 10,
+                                          interface)
+        except error.CannotListenError:
+            raise CannotListenError(interface, port)
+
+    def listen_unix(self, path, interfaces, datagram=False):
+        """Starts the binary IPC protocol at the Unix domain stream socket or
+        datagram socket at path. Returns an object that provides
+        stopListening().
+
+        """
+        remove_stale_socket(path)
+        try:
+            if datagram:
+                return self.reactor.listenUNIXDatagram(path, EtxUnixDatagramProtocol(interfaces),
+                                                       MAX_REQUEST)
+            return self.reactor.listenUNIX(path, EtxIpcFactory(interfaces, EtxUnixIpcProtocol), 10)
+        except error.CannotListenError:
+            raise CannotListenError(path)
+
+    def listen_web(self, port, web_server, interface):
+        """Serves the given EtxWebServer at the given address. Returns an
+        object that provides stopListening().
+
+        """
+        try:
+            return self.reactor.listenTCP(port, server.Site(EtxWebResource(web_server)),
+                                          10, interface)
+        except error.CannotListenError:
+            raise CannotListenError(interface, port)
+
+    def run(self):
+        """Runs the event loop until stop() is called.
+
+        """
+        self.reactor.run()
+
+    def stop(self):
+        """Stops the event loop.
+
+        """
+        self.reactor.stop()
@@ -36,22 +36,67 @@ For further information and questions please use the web site
 """
 
 from syslog import *
-
-from twisted.web import resource
-import simplejson
+from etx_log import syslog
+
+try:
+    import simplejson
+except ImportError:
+    import json as simplejson
+try:
+    from urllib.parse import urlsplit, parse_qs
+except ImportError:
+    from urlparse import urlsplit, parse_qs
+
+import hashlib
 import time
 
-class EtxWebServer(resource.Resource):
+import etx_stats
+from etx_data import EtxData
+from etx_index import get_best_links
+from etx_window import get_window_interfaces
 
-    isLeaf = True
+class EtxWebServer:
 
     def __init__(self, interfaces, hostname):
         self.interfaces = interfaces
         self.hostname = hostname
 
-    def render_GET(self, request):
+    def render(self, path="/"):
+        """Returns the tuple (etag, body) with the JSON document for the
+        given path, see get_document(..). The entity tag is derived from the
+        document without its timestamp, so it only changes with the content
+        and conditional requests (If-None-Match) can be answered with 304 Not
+        Modified by the runtime.
+
+        The link qualities of an additional window (etxd -L) are returned for
+        the query ?window=seconds.
+
+        """
+        path, query = urlsplit(path)[2:4]
+        window = parse_qs(query).get("window")
+        try:
+            interfaces = self.interfaces
+            if window:
+                interfaces = get_window_interfaces(interfaces, int(window[0]),
+                                                   EtxData.WINDOW, EtxData.WINDOWS)
+        except ValueError:
+            document = {
+                "node": self.hostname,
+                "error": "unknown window %s" % window[0]
+            }
+        else:
+            document = self.get_document(path, interfaces)
+        etag = '"%s"' % hashlib.md5(simplejson.dumps(document, sort_keys=True)
+                                    .encode("utf-8")).hexdigest()
+        document["time"] = time.time()
+        return etag, simplejson.dumps(document) + "\n"
+
+    def get_document(self, path="/", interfaces=None):
         """This functions handles the GET requests by returning a list of
-        neighbors.
+        neighbors as JSON document. The HTTP part is handled by the runtime.
+        The internal statistics of the daemon are returned for /stats, the
+        best link to each neighbor node for /best and the multipoint relays
+        of each interface for /mpr.
 
         All neighbors are returned, regardless via which interface they
         are reachable. For each neighbor, its MAC adress, the link
@@ -59,15 +104,57 @@ class EtxWebServer(resource.Resource):
         reached with is returned.
         
         """
+        if interfaces is None:
+            interfaces = self.interfaces
+        if path == "/stats":
+            return {
+                "node": self.hostname,
+                "stats": etx_stats.get_stats()
+            }
+
+        if path == "/best":
+            return {
+                "node": self.hostname,
+                "neighbors": [{
+                    "node": node,
+                    "if_name": if_name,
+                    "ip": ip,
+                    "mac_address": mac,
+                    "etx": etx,
+                    "channel": channel
+                } for node, if_name, ip, mac, etx, channel in get_best_links(interfaces)]
+            }
+
+        if path == "/mpr":
+            relays = []
+            for interface in interfaces.values():
+                # discard interfaces without data
+                if not hasattr(interface, 'data'):
+                    continue
+                # make sure the data is up to date
+                interface.data.remove_old_probes()
+                for relay, covered in interface.data.get_mpr().items():
+                    relays.append({
+                        "if_name": interface.name,
+                        "ip": relay,
+                        "mac_address": interface.data.get_mac(relay) or "",
+                        "node": interface.data.get_node_id(relay) or "",
+                        "etx": interface.data.get_etx(relay),
+                        "covered": covered
+                    })
+            return {
+                "node": self.hostname,
+                "relays": sorted(relays, key=lambda relay: (relay["if_name"], relay["ip"]))
+            }
+
         # initialize dictionary to assemble all neighbors
         ret_val = { 
             "node": self.hostname,
-            "time": time.time(),
             "neighbors": []
         }
 
         # return neighborhood information for all interfaces
-        for interface in self.interfaces.values():
+        for interface in interfaces.values():
             # discard interfaces without data
             if not hasattr(interface, 'data'):
                 continue
@@ -87,5 +174,5 @@ class EtxWebServer(resource.Resource):
                     "mac_address": mac,
                     "quality": quality
                 })
-        return simplejson.dumps(ret_val) + "\n"
+        return ret_val
 
@@ -0,0 +1,188 @@
+#!/usr/bin/python
+"""
+This file is part of etxd: A daemon for to measure the Exptected Transmission
+Count (ETX)
+
+This file contains the store for the link qualities of several windows at
+once (etxd -L), e.g. a short window for a fast failover and a long one for a
+stable route selection, besides the window of the daemon (-w). The probes of
+each neighbor are counted per probe interval in a ring of prefix sums, so the
+number of probes received during any window up to the longest one is the
+difference of two sums. The probes carry these counts for each window, so the
+neighbors can determine the forward delivery ratio of each window as well.
+
+Only completed intervals are counted, thus the counts do not drop at the
+beginning of each interval. The counters of a neighbor are kept for the
+longest window, also if the neighbor has already been removed from the
+neighbor table of the daemon window.
+
+
+Authors:    Matthias Philipp <mphilipp@inf.fu-berlin.de>,
+            Felix Juraschek <fjuraschek@gmail.com>
+
+Copyright 2008-2013, Freie Universitaet Berlin (FUB). All rights reserved.
+
+These sources were developed at the Freie Universitaet Berlin,
+Computer Systems and Telematics / Distributed, embedded Systems (DES) group
+(http://cst.mi.fu-berlin.de, http://www.des-testbed.net)
+-------------------------------------------------------------------------------
+This program is free software: you can redistribute it and/or modify it under
+the terms of the GNU General Public License as published by the Free Software
+Foundation, either version 3 of the License, or (at your option) any later
+version.
+
+This program is distributed in the hope that it will be useful, but WITHOUT
+ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License along with
+this program. If not, see http://www.gnu.org/licenses/ .
+--------------------------------------------------------------------------------
+For further information and questions please use the web site
+       http://www.des-testbed.net
+
+"""
+
+
+def parse_windows(spec, interval):
+    """Parses a comma-separated list of window sizes in seconds and returns
+    them as sorted tuple. Raises ValueError if a window is not a positive
+    multiple of the probe interval.
+
+    """
+    windows = set()
+    for window in spec.split(","):
+        window = int(window)
+        if window <= 0 or window % interval != 0:
+            raise ValueError("invalid window %s" % window)
+        windows.add(window)
+    return tuple(sorted(windows))
+
+
+class EtxWindowCounter:
+    """Counts the probes per interval and returns the number of probes of
+    the last completed intervals in constant time.
+
+    """
+    def __init__(self, size):
+        """ Constructor:
+
+        size - maximum number of intervals that are queried
+
+        """
+        # the ring additionally holds the sum before the oldest interval and
+        # the sum of the current interval
+        self.size = size + 2
+        # _sums[interval % size] = number of probes up to the end of the
+        # interval
+        self._sums = [0] * self.size
+        # current interval
+        self.interval = None
+        self.total = 0
+
+    def _advance(self, interval):
+        if self.interval is None:
+            self.interval = interval
+            return
+        if interval <= self.interval:
+            return
+        for skipped in range(max(self.interval + 1, interval - self.size + 1), interval + 1):
+            self._sums[skipped % self.size] = self.total
+        self.interval = interval
+
+    def add(self, interval):
+        """Counts a probe that has been received during the given interval.
+
+        """
+        self._advance(interval)
+        if interval < self.interval:
+            # the clock has gone backwards, count it for the current one
+            interval = self.interval
+        self.total += 1
+        self._sums[interval % self.size] = self.total
+
+    def count(self, interval, length):
+        """Returns the number of probes of the length intervals before the
+        given one.
+
+        """
+        self._advance(interval)
+        length = min(length, self.size - 2)
+        last = self.interval - 1
+        return self._sums[last % self.size] - self._sums[(last - length) % self.size]
+
+
+class EtxWindowView:
+    """Provides the query functions of EtxData for the link qualities of one
+    of the additional windows. Functions that do not depend on the window
+    are passed to the data of the interface.
+
+    """
+    def __init__(self, data, window):
+        self.data = data
+        self.window = window
+        self._links = None
+
+    def __getattr__(self, name):
+        return getattr(self.data, name)
+
+    def remove_old_probes(self, timestamp=None):
+        self.data.remove_old_probes(timestamp)
+        self._links = None
+
+    def get_links(self):
+        if self._links is None:
+            self._links = self.data.get_window_links(self.window)
+        return dict(self._links)
+
+    def get_quality(self, neighbor):
+        if self._links is None:
+            self._links = self.data.get_window_links(self.window)
+        df, dr = self._links.get(neighbor, (0.0, 0.0))
+        return df * dr
+
+    get_transmission_probability = get_quality
+
+    def get_etx(self, neighbor):
+        p = self.get_quality(neighbor)
+        if p == 0:
+            return -1
+        else:
+            return 1 / p
+
+    def get_neighbors(self, etx=False):
+        neighbors = dict()
+        for neighbor in self.get_links().keys():
+            p = self.get_quality(neighbor)
+            if p > 0:
+                if etx:
+                    neighbors[neighbor] = 1 / p
+                else:
+                    neighbors[neighbor] = p
+        return neighbors
+
+
+class _WindowInterface:
+    """Stand-in for etxd.Interface with the data of one window.
+
+    """
+    def __init__(self, interface, window):
+        self.name = interface.name
+        self.channel = getattr(interface, 'channel', -1)
+        if hasattr(interface, 'data'):
+            self.data = EtxWindowView(interface.data, window)
+
+
+def get_window_interfaces(interfaces, window, default, windows):
+    """Returns the interfaces with the link qualities of the given window.
+    default is the window of the daemon, for which the interfaces are
+    returned unchanged, windows the additional windows. Raises ValueError if
+    the window is unknown.
+
+    """
+    if window == default:
+        return interfaces
+    if window not in windows:
+        raise ValueError("unknown window %s" % window)
+    return dict([(if_name, _WindowInterface(interface, window))
+                 for if_name, interface in interfaces.items()])
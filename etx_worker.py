@@ -0,0 +1,513 @@
+#!/usr/bin/python
+"""
+This file is part of etxd: A daemon for to measure the Exptected Transmission
+Count (ETX)
+
+This file contains the worker processes of etxd -W. On nodes with several
+radios, a busy interface delays the probes of the other interfaces if all of
+them share a single event loop. In the worker mode, the probe protocol and the
+EtxData of each interface run in a worker process of its own, optionally
+pinned to a CPU core. Each worker publishes the link table of its interface
+once per probe interval to the parent process as a UDP datagram on the
+loopback interface, encoded like the BIN responses of the IPC interface,
+together with its statistics (see etx_stats.py). The parent keeps the latest
+table and statistics of each worker in an EtxDataProxy and answers the IPC
+and web requests from these tables, the counters of the workers are summed
+up in the statistics of the parent. The socket of each worker is
+created by the parent and inherited by the worker, so the parent only accepts
+the tables that are sent from the address of the current worker.
+
+The parent restarts a worker that has exited, with an increasing delay if it
+keeps crashing. A worker exits as soon as its parent has gone.
+
+The worker is started by etxd as:
+
+    python etx_worker.py -r runtime -P table_port -p probe_port -c config
+                         -s socket_fd [-a cpu] if_name inet_addr bcast_addr
+                         mac_addr node_id
+
+
+Authors:    Matthias Philipp <mphilipp@inf.fu-berlin.de>,
+            Felix Juraschek <fjuraschek@gmail.com>
+
+Copyright 2008-2013, Freie Universitaet Berlin (FUB). All rights reserved.
+
+These sources were developed at the Freie Universitaet Berlin,
+Computer Systems and Telematics / Distributed, embedded Systems (DES) group
+(http://cst.mi.fu-berlin.de, http://www.des-testbed.net)
+-------------------------------------------------------------------------------
+This program is free software: you can redistribute it and/or modify it under
+the terms of the GNU General Public License as published by the Free Software
+Foundation, either version 3 of the License, or (at your option) any later
+version.
+
+This program is distributed in the hope that it will be useful, but WITHOUT
+ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License along with
+this program. If not, see http://www.gnu.org/licenses/ .
+--------------------------------------------------------------------------------
+For further information and questions please use the web site
+       http://www.des-testbed.net
+
+"""
+
+try:
+    import simplejson
+except ImportError:
+    import json as simplejson
+import fcntl
+import getopt
+import os
+import socket
+import struct
+import subprocess
+import sys
+import time
+from syslog import *
+import etx_log
+import etx_stats
+from etx_log import syslog
+
+from etx_data import EtxData, get_churn, get_limits
+from etx_ipc import FIELDS, encode_records, decode_records
+
+# path of this file, the worker processes are started with it
+WORKER = os.path.splitext(os.path.abspath(__file__))[0] + ".py"
+
+# fields of the link tables published by the workers, covered is the number
+# of two-hop neighbors covered by a multipoint relay and 0 for other neighbors,
+# followed by df and dr of each additional window, see get_table_fields()
+TABLE_FIELDS = ("ip", "mac", "node", "df", "dr", "quality", "etx", "covered")
+TABLE_VERSION = 4
+# maximum size of a table, it has to fit into a single datagram
+MAX_TABLE_SIZE = 65000
+
+# attributes of EtxData that are configured in the workers
+DATA_OPTIONS = ("WINDOW", "INTERVAL", "MIN_SAMPLES", "HYSTERESIS", "HOLD_DOWN",
+                "MAX_NEIGHBORS", "MAX_TWOHOP", "ESTIMATOR", "MPR_QUALITY", "WINDOWS")
+
+
+def get_table_fields():
+    """Returns the fields of the link tables for the configured windows.
+
+    """
+    return TABLE_FIELDS + ("df", "dr") * len(EtxData.WINDOWS)
+
+
+def encode_table(if_name, records, stats=None):
+    """Encodes the link table of the worker: the version (1 byte), the length
+    of the interface name (1 byte) and the interface name, the length of the
+    records (2 bytes) and the records, see etx_ipc.encode_records(..),
+    followed by the statistics of the worker as records of the STATS request.
+    Records that cannot be encoded are left out and logged. If the table does
+    not fit into a datagram, the links with the lowest quality are left out.
+
+    """
+    fields = get_table_fields()
+    header = struct.pack("!BB", TABLE_VERSION, len(if_name)) + if_name.encode("ascii")
+    stats = encode_records(FIELDS["STATS"], sorted((stats or {}).items()))
+    table = encode_records(fields, records)
+    count, = struct.unpack_from("!H", table, 1)
+    if count < len(records):
+        syslog(LOG_WARNING, "%s: left out %d links that cannot be encoded"
+                            % (if_name, len(records) - count))
+    if len(header) + 2 + len(table) + len(stats) > MAX_TABLE_SIZE:
+        records = sorted(records, key=lambda record: record[5], reverse=True)
+        while len(header) + 2 + len(table) + len(stats) > MAX_TABLE_SIZE:
+            records = records[:len(records) * 9 // 10]
+            table = encode_records(fields, records)
+    return header + struct.pack("!H", len(table)) + table + stats
+
+
+def decode_table(datagram):
+    """Decodes a link table and returns the tuple (if_name, records, stats),
+    stats is the dictionary with the statistics of the worker. Raises
+    ValueError if the table is malformed.
+
+    """
+    try:
+        version, length = struct.unpack_from("!BB", datagram)
+    except struct.error:
+        raise ValueError("malformed table")
+    if version != TABLE_VERSION:
+        raise ValueError("unsupported table version %d" % version)
+    offset = struct.calcsize("!BB")
+    try:
+        if_name = datagram[offset:offset + length].decode("ascii")
+        offset += length
+        length, = struct.unpack_from("!H", datagram, offset)
+    except (UnicodeDecodeError, struct.error):
+        raise ValueError("malformed table")
+    offset += 2
+    records = decode_records(get_table_fields(), datagram[offset:offset + length])
+    stats = dict(decode_records(FIELDS["STATS"], datagram[offset + length:]))
+    return if_name, records, stats
+
+
+class EtxDataProxy:
+    """Provides the query functions of EtxData for the link table that is
+    published by the worker of an interface.
+
+    """
+    def __init__(self, ip_address, if_name=None, index=None, clock=None):
+        self.ip_address = ip_address
+        self.if_name = if_name
+        self.index = index
+        if clock is None:
+            self.clock = time.time
+        else:
+            self.clock = clock
+        # _links[neighbor] = (mac, node, df, dr, quality, etx, covered,
+        #                     df and dr of each additional window)
+        self._links = dict()
+        # time of the latest table
+        self.updated = None
+        # statistics of the worker that sent the latest table
+        self.stats = dict()
+
+    def __repr__(self):
+        return "EtxDataProxy(%s, %r)" % (self.ip_address, self._links)
+
+    def set_table(self, records, timestamp=None):
+        """Replaces the link table and updates the neighbor index.
+
+        """
+        # use current time, if timestamp not given
+        if timestamp == None:
+            timestamp = self.clock()
+        links = dict([(record[0], record[1:]) for record in records])
+        if self.index is not None:
+            for neighbor in self._links.keys():
+                if neighbor not in links:
+                    self.index.remove_link(self.if_name, neighbor)
+            for neighbor, link in links.items():
+                mac, node = link[:2]
+                self.index.update_link(self.if_name, neighbor, mac or None,
+                                       node or mac or neighbor)
+        self._links = links
+        self.updated = timestamp
+
+    def remove_old_probes(self, timestamp=None):
+        """The worker removes the old probes, but its table is discarded if
+        it has not been updated during the window time, e.g. if the worker
+        hangs.
+
+        """
+        # use current time, if timestamp not given
+        if timestamp == None:
+            timestamp = self.clock()
+        if self.updated is not None and self.updated + EtxData.WINDOW < timestamp:
+            self.set_table([], timestamp)
+            self.updated = None
+            self.stats = dict()
+
+    def get_quality(self, neighbor):
+        if neighbor not in self._links:
+            return 0.0
+        return self._links[neighbor][4]
+
+    get_transmission_probability = get_quality
+
+    def get_etx(self, neighbor):
+        p = self.get_quality(neighbor)
+        if p == 0:
+            return -1
+        else:
+            return 1 / p
+
+    def get_neighbors(self, etx=False):
+        neighbors = dict()
+        for neighbor, link in self._links.items():
+            if link[4] > 0:
+                if etx:
+                    neighbors[neighbor] = 1 / link[4]
+                else:
+                    neighbors[neighbor] = link[4]
+        return neighbors
+
+    def get_links(self):
+        return dict([(neighbor, (link[2], link[3]))
+                     for neighbor, link in self._links.items()])
+
+    def get_window_links(self, window, timestamp=None):
+        offset = 7 + 2 * EtxData.WINDOWS.index(window)
+        return dict([(neighbor, tuple(link[offset:offset + 2]))
+                     for neighbor, link in self._links.items()
+                     if link[offset] > 0 or link[offset + 1] > 0])
+
+    def get_mpr(self):
+        return dict([(neighbor, link[6]) for neighbor, link in self._links.items()
+                     if link[6] > 0])
+
+    def get_mac(self, ip):
+        if ip not in self._links:
+            return None
+        return self._links[ip][0] or None
+
+    def get_macs(self):
+        return dict([(neighbor, link[0]) for neighbor, link in self._links.items()])
+
+    def get_node_id(self, ip):
+        if ip not in self._links:
+            return None
+        return self._links[ip][1] or self.get_mac(ip)
+
+
+def sum_worker_stats(interfaces, name, totals):
+    """Returns the sums of the counters of the component with the given name
+    (e.g. churn) over the workers of all interfaces. totals contains the
+    counters that are always returned, e.g. the ones of the parent.
+
+    """
+    totals = dict(totals)
+    prefix = name + "."
+    for interface in interfaces.values():
+        if not hasattr(interface, 'worker'):
+            continue
+        for key, value in interface.data.stats.items():
+            if key.startswith(prefix):
+                key = key[len(prefix):]
+                totals[key] = totals.get(key, 0) + value
+    return totals
+
+
+class EtxTableProtocol:
+    """Receives the link tables of the workers in the parent process.
+
+    """
+    def __init__(self, interfaces):
+        self.interfaces = interfaces
+        # set by the runtime as soon as the protocol is listening
+        self.transport = None
+
+    def startProtocol(self):
+        pass
+
+    def datagramReceived(self, datagram, addr):
+        try:
+            if_name, records, stats = decode_table(datagram)
+        except ValueError as error:
+            syslog(LOG_WARNING, "Ignoring link table: %s" % error)
+            return
+        interface = self.interfaces.get(if_name)
+        # only the current worker of the interface sends from the address of
+        # its socket, tables of replaced workers and other processes are
+        # ignored
+        if interface is None or not hasattr(interface, 'worker') or \
+           tuple(addr[:2]) != interface.worker.address:
+            return
+        interface.data.set_table(records)
+        # the counters are sent as doubles
+        interface.data.stats = dict([(name, int(value) if value == int(value) else value)
+                                     for name, value in stats.items()])
+
+
+class EtxWorker:
+
+    # delay before a crashed worker is restarted in seconds, doubled after
+    # each crash up to the maximum
+    RESTART_DELAY = 1
+    MAX_RESTART_DELAY = 60
+
+    def __init__(self, args, inet_addr, bcast_addr):
+        """ Constructor:
+
+        args - command line of the worker process
+        inet_addr - IP address of the interface
+        bcast_addr - broadcast address of the interface
+
+        """
+        self.args = args
+        self.inet_addr = inet_addr
+        self.bcast_addr = bcast_addr
+        self.process = None
+        self.started = None
+        # socket of the worker for the link tables and its address
+        self.sock = None
+        self.address = None
+        self.restarts = 0
+        self._delay = EtxWorker.RESTART_DELAY
+        self._restart_at = None
+
+    def start(self):
+        # the parent keeps the socket of the worker open, so no other process
+        # can take over its address after the worker has exited
+        if self.sock is not None:
+            self.sock.close()
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.bind(("127.0.0.1", 0))
+        self.address = self.sock.getsockname()
+        fd = self.sock.fileno()
+        args = self.args[:2] + ["-s", str(fd)] + self.args[2:]
+        if sys.version_info[0] >= 3:
+            self.process = subprocess.Popen(args, close_fds=True, pass_fds=[fd])
+        else:
+            # Python 2 cannot pass a single descriptor, the other sockets of
+            # Twisted are closed on exec anyway
+            self.process = subprocess.Popen(args, close_fds=False)
+            # the next workers must not inherit the socket
+            fcntl.fcntl(fd, fcntl.F_SETFD, fcntl.fcntl(fd, fcntl.F_GETFD) | fcntl.FD_CLOEXEC)
+        self.started = time.time()
+
+    def stop(self):
+        if self.process.poll() is None:
+            self.process.terminate()
+        self.sock.close()
+        self.sock = None
+
+    def check(self, now=None):
+        """Restarts the worker if it has exited and the restart delay has
+        expired. Returns the exit status if the worker has just been found
+        dead, None otherwise.
+
+        """
+        if now is None:
+            now = time.time()
+        status = self.process.poll()
+        if status is None:
+            # the worker runs stable again
+            if now - self.started > EtxWorker.MAX_RESTART_DELAY:
+                self._delay = EtxWorker.RESTART_DELAY
+            return None
+        if self._restart_at is None:
+            self._restart_at = now + self._delay
+            self._delay = min(2 * self._delay, EtxWorker.MAX_RESTART_DELAY)
+            return status
+        if now >= self._restart_at:
+            self._restart_at = None
+            self.restarts += 1
+            self.start()
+        return None
+
+
+def get_worker_args(runtime, table_port, probe_port, config, cpu, if_name,
+                    inet_addr, bcast_addr, mac_addr, node_id):
+    """Returns the command line of a worker process. config is a dictionary
+    with the values of DATA_OPTIONS and the optional keys station_source,
+    trace, trace_size, timeout, slots, slot_group, binary and lag_threshold.
+
+    """
+    args = [sys.executable, WORKER, "-r", runtime, "-P", str(table_port),
+            "-p", str(probe_port), "-c", simplejson.dumps(config)]
+    if cpu is not None:
+        args.extend(["-a", str(cpu)])
+    return args + [if_name, inet_addr, bcast_addr, mac_addr or "", node_id]
+
+
+def run_worker(runtime_name, table_port, probe_port, config, cpu, if_name,
+               inet_addr, bcast_addr, mac_addr, node_id, table_fd):
+    """Runs the probe protocol of the interface and publishes its link table
+    to the parent process once per probe interval, over the socket that has
+    been inherited from the parent as descriptor table_fd.
+
+    """
+    from etx_runtime import CannotListenError, create_runtime
+    from etx_lag import EtxLagMonitor
+    from etx_probe import EtxProbeProtocol
+    from etx_schedule import EtxProbeScheduler
+    openlog("etxd-%s" % if_name, LOG_PID|LOG_PERROR, LOG_DAEMON)
+    etx_log.start()
+    # pin the worker to a core, not available on Python 2
+    if cpu is not None and hasattr(os, "sched_setaffinity"):
+        cpus = sorted(os.sched_getaffinity(0))
+        os.sched_setaffinity(0, [cpus[cpu % len(cpus)]])
+    parent = os.getppid()
+    runtime = create_runtime(runtime_name)
+    for name in DATA_OPTIONS:
+        setattr(EtxData, name, config[name])
+    # JSON has no tuples
+    EtxData.WINDOWS = tuple(EtxData.WINDOWS)
+    data = EtxData(inet_addr, if_name=if_name)
+    EtxProbeProtocol.BINARY = config.get("binary", False)
+    protocol = EtxProbeProtocol(if_name, inet_addr, data, mac_addr or None, node_id)
+    # the workers use disjoint shares of the slots, see etx_schedule.py
+    EtxProbeScheduler.SLOTS = config.get("slots", EtxProbeScheduler.SLOTS)
+    group = config.get("slot_group")
+    scheduler = EtxProbeScheduler(EtxData.INTERVAL, group and tuple(group))
+    protocol.scheduler = scheduler
+    # the statistics are sent to the parent with each table
+    etx_stats.register("churn", get_churn)
+    etx_stats.register("limits", get_limits)
+    etx_stats.register("schedule", scheduler.get_stats)
+    if config.get("lag_threshold", 0) > 0:
+        EtxLagMonitor(runtime, config["lag_threshold"] / 1000.0).start()
+    if config.get("trace"):
+        from etx_trace import EtxTraceWriter
+        protocol.trace = EtxTraceWriter("%s.%s" % (config["trace"], if_name),
+                                        config["trace_size"])
+        protocol.trace.add_interface(data.clock(), if_name, inet_addr, mac_addr, node_id)
+    try:
+        runtime.listen_udp(probe_port, protocol, bcast_addr)
+    except CannotListenError:
+        syslog(LOG_ERR, "%s: unable to listen at %s:%s" % (if_name, bcast_addr, probe_port))
+        sys.exit(1)
+    sock = socket.fromfd(table_fd, socket.AF_INET, socket.SOCK_DGRAM)
+    os.close(table_fd)
+    sock.setblocking(False)
+
+    def send_probe():
+        protocol.send_probe()
+        # send the next probe in the slot of the interface
+        runtime.call_later(scheduler.next_delay(if_name), send_probe)
+
+    def publish():
+        # exit if the parent has gone
+        if os.getppid() != parent:
+            runtime.stop()
+            return
+        try:
+            # the expiry of the binary probes shares the timer
+            protocol.expire_probes()
+            data.remove_old_probes()
+            records = []
+            mpr = data.get_mpr()
+            windows = [data.get_window_links(window) for window in EtxData.WINDOWS]
+            for neighbor, (df, dr) in data.get_links().items():
+                record = (neighbor, data.get_mac(neighbor) or "",
+                          data.get_node_id(neighbor) or "", df, dr,
+                          data.get_quality(neighbor), data.get_etx(neighbor),
+                          mpr.get(neighbor, 0))
+                for links in windows:
+                    record += links.get(neighbor, (0.0, 0.0))
+                records.append(record)
+            sock.sendto(encode_table(if_name, records, etx_stats.get_stats()),
+                        ("127.0.0.1", table_port))
+        except socket.error as error:
+            syslog(LOG_WARNING, "%s: unable to publish the link table: %s" % (if_name, error))
+        finally:
+            # keep publishing, otherwise the table of the parent expires
+            # while the worker keeps running
+            runtime.call_later(EtxData.INTERVAL, publish)
+
+    if EtxData.ESTIMATOR != "probe":
+        from etx_station import EtxStationEstimator, create_source
+        station = EtxStationEstimator(create_source(config["station_source"], if_name))
+
+        def poll_stations():
+            runtime.run_blocking(station.read_stations, [],
+                                 lambda stations: station.update(stations, data),
+                                 config["timeout"])
+            runtime.call_later(EtxStationEstimator.INTERVAL, poll_stations)
+        runtime.call_when_running(poll_stations)
+
+    runtime.call_when_running(send_probe)
+    runtime.call_when_running(publish)
+    runtime.run()
+
+
+def main():
+    opt_list, args = getopt.getopt(sys.argv[1:], "r:P:p:c:s:a:")
+    options = dict(opt_list)
+    cpu = None
+    if "-a" in options:
+        cpu = int(options["-a"])
+    if_name, inet_addr, bcast_addr, mac_addr, node_id = args
+    run_worker(options["-r"], int(options["-P"]), int(options["-p"]),
+               simplejson.loads(options["-c"]), cpu, if_name, inet_addr,
+               bcast_addr, mac_addr, node_id, int(options["-s"]))
+
+
+if __name__ == "__main__":
+    main()
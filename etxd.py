@@ -36,23 +36,32 @@ For further information and questions please use the web site
 
 import netifaces
 import time
-import random
 import sys
 import getopt
 import os
 import subprocess
 from syslog import *
-
-from twisted.internet import epollreactor
-epollreactor.install()
-from twisted.internet import reactor
-from twisted.internet.error import CannotListenError
-from twisted.web import server
+try:
+    from pythonwifi import iwlibs
+except ImportError:
+    iwlibs = None
 
 sys.path.insert(0, '/usr/share/etxd') 
+import etx_log
+import etx_stats
+from etx_log import syslog
+from etx_runtime import RUNTIMES, CannotListenError, create_runtime
+from etx_lag import EtxLagMonitor
 from etx_probe import EtxProbeProtocol
-from etx_data import EtxData
-from etx_ipc import EtxIpcFactory
+from etx_data import EtxData, get_churn, get_limits
+from etx_index import EtxNeighborIndex
+from etx_ipc import DATAGRAM_SUFFIX
+from etx_trace import EtxTraceWriter
+from etx_schedule import EtxProbeScheduler
+from etx_window import parse_windows
+from etx_station import ESTIMATORS, EtxStationEstimator, create_source
+from etx_worker import DATA_OPTIONS, EtxDataProxy, EtxTableProtocol, EtxWorker, get_worker_args, \
+                       sum_worker_stats
 from etx_web import EtxWebServer
 
 class Interface:
@@ -61,11 +70,14 @@ class Interface:
 
         name:     name of the interface (e.g. wlan0)
 
-        The following fields will be set in initialize_interfaces(..)
-        data:     pointer to an instance of EtxData
+        The following fields will be set in configure_interfaces(..)
+        data:     pointer to an instance of EtxData (EtxDataProxy in the worker mode)
         protocol: pointer to an instance of EtxProbeProtocol
         port:     object which provides IListeningPort for stopping the probe protocol
         ipc_port: object which provides IListeningPort for stopping the ipc protocol
+        channel:  channel of the interface (-1 if unknown)
+        station:  pointer to an instance of EtxStationEstimator, if enabled
+        worker:   pointer to an instance of EtxWorker in the worker mode
     """
     def __init__(self, if_name):
         self.name = if_name
@@ -81,12 +93,12 @@ def print_data(interfaces):
         if hasattr(interface, 'data'):
             interface.data.remove_old_probes()
             syslog(LOG_DEBUG, "%s: %s" % (interface.name, interface.data.get_neighbors()))
-    reactor.callLater(WINDOW, print_data, interfaces)
+    runtime.call_later(WINDOW, print_data, interfaces)
 
 
 def send_probe(interface):
-    """Initiates to send a probe over the specified interface. Adds a random jitter to the 
-    sending interval in order to reduce the chance of message collisions.
+    """Initiates to send a probe over the specified interface. The time of the next probe
+    is chosen by the scheduler in order to reduce the chance of message collisions.
 
     """
     # stop sending probes if the object reference has been deleted
@@ -94,12 +106,125 @@ def send_probe(interface):
         return
     # send the probe
     interface.protocol.send_probe()
-    # variate delay by +-10% to avoid collisions due to synchronization 
-    jitter = random.uniform(0.0, 0.2*INTERVAL)
-    reactor.callLater(0.9*INTERVAL + jitter, send_probe, interface)
+    # send the next probe in the slot of the interface
+    runtime.call_later(scheduler.next_delay(interface.name), send_probe, interface)
+
+
+def expire_probes(interfaces):
+    """Removes the expired probes from the binary probes of all interfaces once per
+    probe interval. Calls itself again later.
+
+    """
+    for interface in interfaces.values():
+        if hasattr(interface, 'protocol'):
+            interface.protocol.expire_probes()
+    runtime.call_later(INTERVAL, expire_probes, interfaces)
+
+
+def get_interface_config(if_names):
+    """Determines the configuration of the network interfaces. Returns a dictionary
+    that contains None for each interface that is not configured and a tuple
+    (inet_addr, bcast_addr, mac_addr, channel) for each interface that is up. 
+    Interfaces that are up, but without an IP address, are left out.
+
+    This function calls ifconfig and performs several ioctls, thus it is run in
+    the thread pool of the runtime and not in the event loop.
+
+    """
+    config = dict()
+    for if_name in if_names:
+        # see if the interface is configured
+        if subprocess.call("ifconfig | grep -q %s" % if_name, shell=True) != 0:
+            config[if_name] = None
+            continue
+        # interface is up, try to determine its ip and broadcast address
+        try:
+            addresses = netifaces.ifaddresses(if_name)
+            inet_addr = addresses[netifaces.AF_INET][0]['addr']
+            bcast_addr = addresses[netifaces.AF_INET][0]['broadcast']
+        except (KeyError, ValueError):
+            syslog(LOG_WARNING, "%s: unable to determine IP address, although the interface seems to be up" % (if_name))
+            continue
+        try:
+            mac_addr = addresses[netifaces.AF_LINK][0]['addr']
+        except KeyError:
+            mac_addr = None
+        # determine the channel of wireless interfaces
+        try:
+            channel = iwlibs.Wireless(if_name).getChannel()
+        except (AttributeError, IOError, OSError):
+            channel = -1
+        config[if_name] = (inet_addr, bcast_addr, mac_addr, channel)
+    return config
 
 
 def initialize_interfaces(interfaces):
+    """Determines the configuration of the network interfaces in the thread pool and
+    applies it with configure_interfaces(..). Calls itself again later when the window
+    has expired.
+
+    """
+    def failed(error):
+        syslog(LOG_WARNING, "Unable to determine the interface configuration: %r" % error)
+    if WORKERS:
+        configure = configure_workers
+    else:
+        configure = configure_interfaces
+    runtime.run_blocking(get_interface_config, [list(interfaces.keys())],
+                         lambda config: configure(interfaces, config),
+                         TIMEOUT, failed)
+    # schedule next execution of this function
+    runtime.call_later(WINDOW, initialize_interfaces, interfaces)
+
+
+def poll_stations(interfaces):
+    """Reads the station dumps of the interfaces in the thread pool and
+    updates the station based transmission probabilities. Calls itself again
+    later.
+
+    """
+    def failed(error, interface):
+        syslog(LOG_WARNING, "%s: unable to read the station dump: %r" % (interface.name, error))
+    def update(stations, interface):
+        # the interface may have been reconfigured in the meantime
+        if hasattr(interface, 'station') and hasattr(interface, 'data'):
+            interface.station.update(stations, interface.data)
+    for interface in interfaces.values():
+        if hasattr(interface, 'station'):
+            runtime.run_blocking(interface.station.read_stations, [],
+                                 lambda stations, interface=interface: update(stations, interface),
+                                 TIMEOUT, lambda error, interface=interface: failed(error, interface))
+    runtime.call_later(EtxStationEstimator.INTERVAL, poll_stations, interfaces)
+
+
+def stop_interface(interface):
+    """Stops listening for probes and IPC connections on the interface and clears
+    its data.
+
+    """
+    if hasattr(interface, 'worker'):
+        # the worker process listens for probes
+        interface.worker.stop()
+        del interface.worker
+    else:
+        # stop listening for probes
+        interface.port.stopListening()
+        del interface.port
+        # stop sending probes
+        del interface.protocol
+        scheduler.remove_interface(interface.name)
+    # stop listening for IPC connections
+    if hasattr(interface, 'ipc_port'):
+        interface.ipc_port.stopListening()
+        del interface.ipc_port
+    # clear data
+    del interface.data
+    if hasattr(interface, 'station'):
+        del interface.station
+    neighbor_index.remove_interface(interface.name)
+
+
+def configure_interfaces(interfaces, config):
     """Initialized the network interfaces. If the interface is UP, it is ensured, that an instance
     of ETXData is associated with the interface. The EtxProbeProtocol is associated and started. 
     Finally, the IPC protocol is initialized to support requests of other processes. 
@@ -107,30 +232,18 @@ def initialize_interfaces(interfaces):
     """
     # iterate over all interfaces 
     for interface in interfaces.values():
+        # interfaces that are up, but without IP address are left untouched
+        if interface.name not in config:
+            continue
         # see if the interface is configured
-        if subprocess.call("ifconfig | grep -q %s" % interface.name, shell=True) != 0:
+        if config[interface.name] is None:
             # see if we previously used the interface
             if hasattr(interface, 'port'):
-                # stop listening for probes
-                interface.port.stopListening()
-                del interface.port
-                # stop listening for IPC connections
-                interface.ipc_port.stopListening()
-                del interface.ipc_port
-                # stop sending probes
-                del interface.protocol
-                # clear data
-                del interface.data
+                stop_interface(interface)
             if DEBUG:
                 syslog(LOG_DEBUG, "%s: interface not configured" % (interface.name))
             continue
-        # interface is up, try to determine its ip and broadcast address
-        try:
-            inet_addr = netifaces.ifaddresses(interface.name)[netifaces.AF_INET][0]['addr']
-            bcast_addr = netifaces.ifaddresses(interface.name)[netifaces.AF_INET][0]['broadcast']
-        except KeyError:
-            syslog(LOG_WARNING, "%s: unable to determine IP address, although the interface seems to be up" % (interface.name))
-            continue
+        inet_addr, bcast_addr, mac_addr, interface.channel = config[interface.name]
         # interface is up, see if we are already listening on it
         if hasattr(interface, 'port'):
             # we are listening, see if the broadcast address has changed
@@ -138,27 +251,30 @@ def initialize_interfaces(interfaces):
                 # interface has been reconfigured, stop listening at the old
                 # address
                 syslog(LOG_INFO, "%s: interface has been reconfigured" % (interface.name))
-                interface.port.stopListening()
-                del interface.port
-                # stop listening for IPC connections
-                interface.ipc_port.stopListening()
-                del interface.ipc_port
-                # stop sending probes
-                del interface.protocol
-                # clear data
-                del interface.data
+                stop_interface(interface)
             else:
                 # broadcast address still up to date and we are already
                 # listening, nothing to do
                 continue
         # interface is up, but we are not listening (anymore)
         # initialize data
-        interface.data = EtxData(inet_addr)
+        interface.data = EtxData(inet_addr, if_name=interface.name, index=neighbor_index)
         # create probe protocol for this interface
-        interface.protocol = EtxProbeProtocol(interface.name, inet_addr, interface.data)
+        interface.protocol = EtxProbeProtocol(interface.name, inet_addr, interface.data,
+                                              mac_addr, NODE_ID)
+        # learn the probe phases of the neighbors
+        interface.protocol.scheduler = scheduler
+        # estimate the links from the unicast traffic if requested
+        if ESTIMATOR != "probe":
+            interface.station = EtxStationEstimator(create_source(STATION_SOURCE, interface.name))
+        # record the probes of this interface if requested
+        if trace is not None:
+            interface.protocol.trace = trace
+            trace.add_interface(interface.data.clock(), interface.name, inet_addr,
+                                mac_addr, NODE_ID)
         try:
             # try to listen at the broadcast address
-            interface.port = reactor.listenUDP(PROBE_PORT, interface.protocol, bcast_addr)
+            interface.port = runtime.listen_udp(PROBE_PORT, interface.protocol, bcast_addr)
             syslog(LOG_INFO, "%s: listening for probes at %s:%s"  % (interface.name, bcast_addr, PROBE_PORT))
         except CannotListenError:
             syslog(LOG_WARNING, "%s: unable to listen at %s:%s, although the interface seems to be up. Maybe another interface uses the same broadcast address" % (interface.name, bcast_addr, PROBE_PORT))
@@ -166,14 +282,87 @@ def initialize_interfaces(interfaces):
             del interface.protocol
             continue
         # if everything was initialized successfully, start sending probes
-        reactor.callWhenRunning(send_probe, interface)
+        runtime.call_when_running(send_probe, interface)
         try:
             # listen for ipc connections on the wireless interface
-            interface.ipc_port = reactor.listenTCP(IPC_PORT, EtxIpcFactory(interfaces), 10, inet_addr)
+            interface.ipc_port = runtime.listen_ipc(IPC_PORT, interfaces, inet_addr)
         except CannotListenError:
             syslog(LOG_WARNING, "%s: unable to listen for IPC connections at %s:%s" % (interface.name, bcast_addr, IPC_PORT))
-    # schedule next execution of this function
-    reactor.callLater(WINDOW, initialize_interfaces, interfaces)
+
+
+def configure_workers(interfaces, config):
+    """Starts a worker process for each interface that is UP, which runs the probe
+    protocol and publishes the link table of the interface, and stops the workers of
+    the interfaces that are down or have been reconfigured.
+
+    """
+    for number, if_name in enumerate(sorted(interfaces.keys())):
+        interface = interfaces[if_name]
+        # interfaces that are up, but without IP address are left untouched
+        if if_name not in config:
+            continue
+        # see if the interface is configured
+        if config[if_name] is None:
+            if hasattr(interface, 'worker'):
+                stop_interface(interface)
+            continue
+        inet_addr, bcast_addr, mac_addr, interface.channel = config[if_name]
+        if hasattr(interface, 'worker'):
+            if interface.worker.inet_addr == inet_addr and interface.worker.bcast_addr == bcast_addr:
+                continue
+            syslog(LOG_INFO, "%s: interface has been reconfigured" % (if_name))
+            stop_interface(interface)
+        worker_config = dict([(name, getattr(EtxData, name)) for name in DATA_OPTIONS])
+        worker_config.update({"station_source": STATION_SOURCE, "trace": TRACE,
+                              "trace_size": TRACE_SIZE * 1024 * 1024, "timeout": TIMEOUT,
+                              "slots": EtxProbeScheduler.SLOTS,
+                              "slot_group": [number, len(interfaces)],
+                              "binary": EtxProbeProtocol.BINARY,
+                              "lag_threshold": LAG_THRESHOLD})
+        if PIN_WORKERS:
+            cpu = number
+        else:
+            cpu = None
+        interface.data = EtxDataProxy(inet_addr, if_name=if_name, index=neighbor_index)
+        interface.worker = EtxWorker(get_worker_args(RUNTIME, TABLE_PORT, PROBE_PORT,
+                                                     worker_config, cpu, if_name, inet_addr,
+                                                     bcast_addr, mac_addr, NODE_ID),
+                                     inet_addr, bcast_addr)
+        interface.worker.start()
+        syslog(LOG_INFO, "%s: started worker process %s" % (if_name, interface.worker.process.pid))
+        try:
+            # listen for ipc connections on the wireless interface
+            interface.ipc_port = runtime.listen_ipc(IPC_PORT, interfaces, inet_addr)
+        except CannotListenError:
+            syslog(LOG_WARNING, "%s: unable to listen for IPC connections at %s:%s" % (if_name, inet_addr, IPC_PORT))
+
+
+def check_workers(interfaces):
+    """Restarts the worker processes that have exited. Calls itself again later.
+
+    """
+    for interface in interfaces.values():
+        if hasattr(interface, 'worker'):
+            status = interface.worker.check()
+            if status is not None:
+                syslog(LOG_ERR, "%s: worker process %s exited with status %s, restarting it"
+                                % (interface.name, interface.worker.process.pid, status))
+    runtime.call_later(INTERVAL, check_workers, interfaces)
+
+
+def get_worker_stats(interfaces):
+    """Returns the number of running worker processes and their restarts and
+    the statistics of each worker, prefixed with the interface name.
+
+    """
+    workers = [interface.worker for interface in interfaces.values() if hasattr(interface, 'worker')]
+    stats = {"running": len([worker for worker in workers if worker.process.poll() is None]),
+             "restarts": sum([worker.restarts for worker in workers])}
+    for interface in interfaces.values():
+        if hasattr(interface, 'worker'):
+            for name, value in interface.data.stats.items():
+                stats["%s.%s" % (interface.name, name)] = value
+    return stats
 
 
 def main():
@@ -182,6 +371,9 @@ def main():
     background. 
 
     """
+    # write log messages in the background from now on
+    etx_log.start()
+
     # dictionary that stores all Interface objects indexed by the interface name
     interfaces = dict()
 
@@ -191,26 +383,63 @@ def main():
         interfaces[if_name] = Interface(if_name)
 
     # initialize interfaces
-    reactor.callWhenRunning(initialize_interfaces, interfaces)
+    runtime.call_when_running(initialize_interfaces, interfaces)
 
-    # create factory for ipc protocol
-    ipc_factory = EtxIpcFactory(interfaces)
     # listen for ipc connections on localhost
-    reactor.listenTCP(IPC_PORT, ipc_factory, 10, '127.0.0.1')
+    runtime.listen_ipc(IPC_PORT, interfaces, '127.0.0.1')
+
+    # listen for binary requests of local programs on the Unix domain sockets
+    if UNIX_PATH:
+        try:
+            runtime.listen_unix(UNIX_PATH, interfaces)
+            runtime.listen_unix(UNIX_PATH + DATAGRAM_SUFFIX, interfaces, True)
+        except CannotListenError:
+            syslog(LOG_WARNING, "Warning: unable to listen for IPC connections at %s" % UNIX_PATH)
+
+    # receive the link tables of the worker processes
+    if WORKERS:
+        runtime.listen_udp(TABLE_PORT, EtxTableProtocol(interfaces), '127.0.0.1')
+        runtime.call_when_running(check_workers, interfaces)
+        etx_stats.register("workers", lambda: get_worker_stats(interfaces))
 
     # create server for JSON RPC
-    web_server = EtxWebServer(interfaces, os.uname()[1])
+    web_server = EtxWebServer(interfaces, NODE_ID)
     # get IP of the ethernet interface
     inet_addr = netifaces.ifaddresses("eth0")[netifaces.AF_INET][0]['addr']	
     # listen for RPC connections on the ethernet interface
-    reactor.listenTCP(IPC_PORT, server.Site(web_server), 10, inet_addr)
+    runtime.listen_web(IPC_PORT, web_server, inet_addr)
 
     # print debug output if requested
     if DEBUG:
-        reactor.callWhenRunning(print_data, interfaces)
+        runtime.call_when_running(print_data, interfaces)
+
+    # keep the binary probes current, the workers do it on their own
+    if EtxProbeProtocol.BINARY and not WORKERS:
+        runtime.call_when_running(expire_probes, interfaces)
 
-    # start the twisted event loop
-    reactor.run()
+    # read the station dumps if requested, the workers read them on their own
+    if ESTIMATOR != "probe" and not WORKERS:
+        runtime.call_when_running(poll_stations, interfaces)
+
+    # count the changes of the published link tables, the neighbors that did
+    # not fit into the neighbor tables and the slot changes of the probe
+    # scheduler, which are summed up over the workers if there are any
+    if WORKERS:
+        etx_stats.register("churn", lambda: sum_worker_stats(interfaces, "churn", get_churn()))
+        etx_stats.register("limits", lambda: sum_worker_stats(interfaces, "limits", get_limits()))
+        etx_stats.register("schedule", lambda: sum_worker_stats(interfaces, "schedule",
+                                                                scheduler.get_stats()))
+    else:
+        etx_stats.register("churn", get_churn)
+        etx_stats.register("limits", get_limits)
+        etx_stats.register("schedule", scheduler.get_stats)
+
+    # monitor the lag of the event loop
+    if LAG_THRESHOLD > 0:
+        EtxLagMonitor(runtime, LAG_THRESHOLD / 1000.0).start()
+
+    # start the event loop
+    runtime.run()
 
 
 if __name__ == "__main__":
@@ -220,17 +449,37 @@ if __name__ == "__main__":
     # set default values 
     IPC_PORT = 9157
     PROBE_PORT = 9158
+    TABLE_PORT = 9159
     INTERVAL = 1 # seconds
     WINDOW = 10 # seconds
     DEBUG = False
     FOREGROUND = False
+    RUNTIME = RUNTIMES[0]
+    LAG_THRESHOLD = 100 # milliseconds
+    TIMEOUT = 5 # seconds
+    TRACE = None
+    TRACE_SIZE = 10 # megabytes
+    MIN_SAMPLES = 0 # probes, damping is disabled by default
+    HYSTERESIS = 0.0 # quality
+    HOLD_DOWN = 0 # seconds
+    MAX_NEIGHBORS = EtxData.MAX_NEIGHBORS # per interface, 0 = unlimited
+    MAX_TWOHOP = EtxData.MAX_TWOHOP # per neighbor, 0 = unlimited
+    ESTIMATOR = ESTIMATORS[0]
+    STATION_SOURCE = "iw"
+    WORKERS = False
+    PIN_WORKERS = False
+    SLOTS = EtxProbeScheduler.SLOTS # per interval, 0 = random jitter
+    MPR_QUALITY = EtxData.MPR_QUALITY # minimum quality of the links of the relays
+    WINDOWS = "" # additional windows in seconds, e.g. 5,300
+    UNIX_PATH = None # Unix domain socket for binary requests
+    BINARY = False # send the probes in the binary format, not understood by older versions
 
     # prepare logger
     openlog("etxd", LOG_PID|LOG_PERROR, LOG_DAEMON)
 
     # parse command line parameters
     try:
-        opt_list, if_names = getopt.getopt(sys.argv[1:], "fDi:w:p:")
+        opt_list, if_names = getopt.getopt(sys.argv[1:], "fDi:w:p:r:l:t:T:m:y:H:N:X:e:s:WAS:M:L:u:B")
     except getopt.GetoptError:
         syslog(LOG_ERR, "Error while parsing parameters: %s" % sys.exc_info()[1]) 
         sys.exit(1)
@@ -243,6 +492,7 @@ if __name__ == "__main__":
             if val.isdigit() and int(val) > 0:
                 IPC_PORT = int(val)
                 PROBE_PORT = IPC_PORT + 1
+                TABLE_PORT = IPC_PORT + 2
             else:
                 syslog(LOG_WARNING, "Warning: Invalid port specification. Using default: %s" % IPC_PORT)
         elif opt == "-i":
@@ -262,15 +512,119 @@ if __name__ == "__main__":
                 EtxProbeProtocol.DEBUG = True
         elif opt == "-f":
             FOREGROUND = True
+        elif opt == "-r":
+            if val in RUNTIMES:
+                RUNTIME = val
+            else:
+                syslog(LOG_WARNING, "Warning: Invalid runtime specification. Using default: %s" % RUNTIME)
+        elif opt == "-l":
+            if val.isdigit():
+                LAG_THRESHOLD = int(val)
+            else:
+                syslog(LOG_WARNING, "Warning: Invalid lag threshold specification. Using default: %s" % LAG_THRESHOLD)
+        elif opt == "-t":
+            TRACE = os.path.abspath(val)
+        elif opt == "-T":
+            if val.isdigit() and int(val) > 0:
+                TRACE_SIZE = int(val)
+            else:
+                syslog(LOG_WARNING, "Warning: Invalid trace size specification. Using default: %s" % TRACE_SIZE)
+        elif opt == "-m":
+            if val.isdigit():
+                MIN_SAMPLES = int(val)
+            else:
+                syslog(LOG_WARNING, "Warning: Invalid minimum number of samples. Using default: %s" % MIN_SAMPLES)
+        elif opt == "-y":
+            try:
+                HYSTERESIS = float(val)
+            except ValueError:
+                HYSTERESIS = -1
+            if not 0 <= HYSTERESIS <= 1:
+                HYSTERESIS = 0.0
+                syslog(LOG_WARNING, "Warning: Invalid hysteresis specification. Using default: %s" % HYSTERESIS)
+        elif opt == "-H":
+            if val.isdigit():
+                HOLD_DOWN = int(val)
+            else:
+                syslog(LOG_WARNING, "Warning: Invalid hold-down specification. Using default: %s" % HOLD_DOWN)
+        elif opt == "-N":
+            if val.isdigit():
+                MAX_NEIGHBORS = int(val)
+            else:
+                syslog(LOG_WARNING, "Warning: Invalid maximum number of neighbors. Using default: %s" % MAX_NEIGHBORS)
+        elif opt == "-X":
+            if val.isdigit():
+                MAX_TWOHOP = int(val)
+            else:
+                syslog(LOG_WARNING, "Warning: Invalid maximum number of two-hop entries. Using default: %s" % MAX_TWOHOP)
+        elif opt == "-W":
+            WORKERS = True
+        elif opt == "-A":
+            PIN_WORKERS = True
+        elif opt == "-S":
+            if val.isdigit():
+                SLOTS = int(val)
+            else:
+                syslog(LOG_WARNING, "Warning: Invalid number of slots. Using default: %s" % SLOTS)
+        elif opt == "-M":
+            try:
+                MPR_QUALITY = float(val)
+            except ValueError:
+                MPR_QUALITY = -1
+            if not 0 < MPR_QUALITY <= 1:
+                MPR_QUALITY = EtxData.MPR_QUALITY
+                syslog(LOG_WARNING, "Warning: Invalid minimum quality of the relay links. Using default: %s" % MPR_QUALITY)
+        elif opt == "-L":
+            WINDOWS = val
+        elif opt == "-u":
+            UNIX_PATH = os.path.abspath(val)
+        elif opt == "-B":
+            BINARY = True
+        elif opt == "-e":
+            if val in ESTIMATORS:
+                ESTIMATOR = val
+            else:
+                syslog(LOG_WARNING, "Warning: Invalid estimator specification. Using default: %s" % ESTIMATOR)
+        elif opt == "-s":
+            if val == "iw":
+                STATION_SOURCE = val
+            else:
+                STATION_SOURCE = os.path.abspath(val)
 
     # check if window size and interval correspond
     if WINDOW < INTERVAL:
         syslog(LOG_ERR, "Error: Window (%s) must be >= interval (%s)!" % (WINDOW, INTERVAL))
         sys.exit(1)
 
+    # the minimum number of samples has to be reachable within the window
+    if MIN_SAMPLES > WINDOW // INTERVAL:
+        syslog(LOG_ERR, "Error: Minimum number of samples (%s) must be <= window / interval (%s)!"
+               % (MIN_SAMPLES, WINDOW // INTERVAL))
+        sys.exit(1)
+
+    # the additional windows have to be multiples of the interval
+    if WINDOWS:
+        try:
+            WINDOWS = parse_windows(WINDOWS, INTERVAL)
+        except ValueError:
+            WINDOWS = ()
+            syslog(LOG_WARNING, "Warning: Invalid window specification. Using no additional windows.")
+    else:
+        WINDOWS = ()
+
     # forward configuration to the data class
     EtxData.WINDOW = WINDOW
     EtxData.INTERVAL = INTERVAL
+    EtxData.MIN_SAMPLES = MIN_SAMPLES
+    EtxData.HYSTERESIS = HYSTERESIS
+    EtxData.HOLD_DOWN = HOLD_DOWN
+    EtxData.MAX_NEIGHBORS = MAX_NEIGHBORS
+    EtxData.MAX_TWOHOP = MAX_TWOHOP
+    EtxData.ESTIMATOR = ESTIMATOR
+    EtxProbeScheduler.SLOTS = SLOTS
+    EtxData.MPR_QUALITY = MPR_QUALITY
+    EtxData.WINDOWS = WINDOWS
+    EtxProbeProtocol.BINARY = BINARY
 
     if DEBUG:
         syslog(LOG_DEBUG, "IPC_PORT:   %s" % IPC_PORT)
@@ -279,6 +633,24 @@ if __name__ == "__main__":
         syslog(LOG_DEBUG, "WINDOW:     %s" % WINDOW)
         syslog(LOG_DEBUG, "DEBUG:      %s" % DEBUG)
         syslog(LOG_DEBUG, "FOREGROUND: %s" % FOREGROUND)
+        syslog(LOG_DEBUG, "RUNTIME:    %s" % RUNTIME)
+        syslog(LOG_DEBUG, "LAG_THRESHOLD: %s" % LAG_THRESHOLD)
+        syslog(LOG_DEBUG, "TRACE:      %s" % TRACE)
+        syslog(LOG_DEBUG, "TRACE_SIZE: %s" % TRACE_SIZE)
+        syslog(LOG_DEBUG, "MIN_SAMPLES: %s" % MIN_SAMPLES)
+        syslog(LOG_DEBUG, "HYSTERESIS: %s" % HYSTERESIS)
+        syslog(LOG_DEBUG, "HOLD_DOWN:  %s" % HOLD_DOWN)
+        syslog(LOG_DEBUG, "MAX_NEIGHBORS: %s" % MAX_NEIGHBORS)
+        syslog(LOG_DEBUG, "MAX_TWOHOP: %s" % MAX_TWOHOP)
+        syslog(LOG_DEBUG, "ESTIMATOR:  %s" % ESTIMATOR)
+        syslog(LOG_DEBUG, "STATION_SOURCE: %s" % STATION_SOURCE)
+        syslog(LOG_DEBUG, "WORKERS:    %s" % WORKERS)
+        syslog(LOG_DEBUG, "PIN_WORKERS: %s" % PIN_WORKERS)
+        syslog(LOG_DEBUG, "SLOTS:      %s" % SLOTS)
+        syslog(LOG_DEBUG, "MPR_QUALITY: %s" % MPR_QUALITY)
+        syslog(LOG_DEBUG, "WINDOWS:    %s" % (WINDOWS,))
+        syslog(LOG_DEBUG, "UNIX_PATH:  %s" % UNIX_PATH)
+        syslog(LOG_DEBUG, "BINARY:     %s" % BINARY)
 
     for if_name in list(if_names):
         # check if interface is valid
@@ -298,8 +670,8 @@ if __name__ == "__main__":
             if pid > 0:
                 # exit first parent
                 sys.exit(0) 
-        except OSError, e: 
-            print >>sys.stderr, "fork #1 failed: %d (%s)" % (e.errno, e.strerror) 
+        except OSError as e: 
+            sys.stderr.write("fork #1 failed: %d (%s)\n" % (e.errno, e.strerror))
             sys.exit(1)
 
         # decouple from parent environment
@@ -316,18 +688,39 @@ if __name__ == "__main__":
                 pidfile.write("%d" % pid)
                 pidfile.close()
                 sys.exit(0) 
-        except OSError, e: 
-            print >>sys.stderr, "fork #2 failed: %d (%s)" % (e.errno, e.strerror) 
+        except OSError as e: 
+            sys.stderr.write("fork #2 failed: %d (%s)\n" % (e.errno, e.strerror))
             sys.exit(1) 
 
         # Redirect standard file descriptors.
-        si = file('/dev/null', 'r')
-        so = file('/dev/null', 'a+')
-        se = file('/dev/null', 'a+', 0)
+        si = open('/dev/null', 'r')
+        so = open('/dev/null', 'a+')
+        se = open('/dev/null', 'a+')
         os.dup2(si.fileno(), sys.stdin.fileno())
         os.dup2(so.fileno(), sys.stdout.fileno())
         os.dup2(se.fileno(), sys.stderr.fileno())
 
+    # create the runtime after forking, the event loop must not be shared
+    # with the parent process
+    runtime = create_runtime(RUNTIME)
+
+    # the host name identifies this node on all interfaces
+    NODE_ID = os.uname()[1]
+    # index of the neighbor nodes across all interfaces
+    neighbor_index = EtxNeighborIndex()
+    # scheduler of the probes of all interfaces
+    scheduler = EtxProbeScheduler(INTERVAL)
+    # recorder of all received and sent probes, the workers record the probes of
+    # their interface to TRACE.<interface> on their own
+    if TRACE is not None and not WORKERS:
+        try:
+            trace = EtxTraceWriter(TRACE, TRACE_SIZE * 1024 * 1024)
+        except (IOError, OSError) as e:
+            syslog(LOG_ERR, "Error: Unable to open trace %s: %s" % (TRACE, e))
+            sys.exit(1)
+    else:
+        trace = None
+
     # start the daemon main loop
     main() 
 
@@ -0,0 +1,60 @@
+"""
+Tests of the web server of the asyncio runtime, see etx_aio.py.
+
+"""
+
+import unittest
+
+try:
+    from etx_aio import _HttpProtocol
+except (ImportError, SyntaxError):
+    # the asyncio runtime requires Python 3
+    _HttpProtocol = None
+
+
+class _Transport:
+    """Keeps the written response.
+
+    """
+    def __init__(self):
+        self.data = b""
+        self.closed = False
+
+    def write(self, data):
+        self.data += data
+
+    def close(self):
+        self.closed = True
+
+
+class _WebServer:
+
+    def render(self, path):
+        return '"1"', "{}"
+
+
+@unittest.skipIf(_HttpProtocol is None, "asyncio is not available")
+class HttpTest(unittest.TestCase):
+
+    def request(self, data):
+        protocol = _HttpProtocol(_WebServer())
+        protocol.connection_made(_Transport())
+        protocol.data_received(data)
+        return protocol.transport
+
+    def test_get(self):
+        transport = self.request(b"GET / HTTP/1.1\r\nContent-Length: 0\r\n\r\n")
+        self.assertTrue(transport.data.startswith(b"HTTP/1.1 200 OK\r\n"))
+        self.assertFalse(transport.closed)
+
+    def test_malformed_content_length(self):
+        for length in (b"abc", b"-1", b"1.5"):
+            transport = self.request(b"GET / HTTP/1.1\r\nContent-Length: " + length +
+                                     b"\r\n\r\n")
+            self.assertTrue(transport.data.startswith(b"HTTP/1.1 400 Bad Request\r\n"),
+                            transport.data)
+            self.assertTrue(transport.closed)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,173 @@
+"""
+Tests of the collector, see etx_collect.py. The collector polls the web
+servers of fake nodes with static neighbor tables on the loopback interface,
+which run in a child process, together with a silent and an unreachable node.
+
+"""
+
+import os
+import socket
+import subprocess
+import sys
+import time
+import unittest
+
+from etx_collect import (EtxCollector, NOT_MODIFIED, OK, decode_snapshot,
+                         encode_snapshot)
+
+# number of fake nodes
+NODES = 5
+# the asyncio runtime requires Python 3
+RUNTIME = "asyncio" if sys.version_info[0] >= 3 else "twisted"
+
+
+def _free_ports(count):
+    """Returns count distinct TCP port numbers that are currently unused on
+    loopback.
+
+    """
+    socks = []
+    for i in range(count):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.bind(("127.0.0.1", 0))
+        socks.append(sock)
+    ports = [sock.getsockname()[1] for sock in socks]
+    for sock in socks:
+        sock.close()
+    return ports
+
+
+class _Interface:
+    """Minimal stand-in for etxd.Interface.
+
+    """
+    def __init__(self, if_name, data):
+        self.name = if_name
+        self.data = data
+
+
+def fake_nodes(name, count):
+    """Runs in the child process: serves the web servers of count fake nodes
+    with static neighbor tables with the given runtime and prints their ports
+    once the event loop is running.
+
+    """
+    from etx_runtime import create_runtime
+    from etx_data import EtxData
+    from etx_web import EtxWebServer
+    runtime = create_runtime(name)
+    EtxData.WINDOW = 10
+    EtxData.INTERVAL = 1
+    # the probes expire long after the test
+    now = time.time() + 3600
+    ports = _free_ports(count)
+    for i, port in enumerate(ports):
+        data = EtxData("10.1.%d.%d" % (i // 256, i % 256 + 1))
+        for j in range(count):
+            if j == i:
+                continue
+            neighbor = "10.1.%d.%d" % (j // 256, j % 256 + 1)
+            data.set_mac(neighbor, "02:00:00:00:%02x:%02x" % (j // 256, j % 256))
+            data.set_neighbor_info(neighbor, {data.ip_address: (10, 10 - j % 5)})
+            for k in range(10 - (i + j) % 4):
+                data.add_timestamp(neighbor, now - k)
+        runtime.listen_web(port, EtxWebServer({"wlan0": _Interface("wlan0", data)},
+                                              "fake-%d" % i), "127.0.0.1")
+
+    def ready():
+        sys.stdout.write("%s\n" % " ".join([str(port) for port in ports]))
+        sys.stdout.flush()
+    runtime.call_when_running(runtime.call_later, 0, ready)
+    runtime.run()
+
+
+class CollectorTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.child = subprocess.Popen([sys.executable, os.path.abspath(__file__),
+                                      "_fake", RUNTIME, str(NODES)],
+                                     stdout=subprocess.PIPE)
+        line = cls.child.stdout.readline()
+        if not line:
+            cls.child.wait()
+            raise RuntimeError("fake nodes did not start")
+        cls.nodes = [("127.0.0.1", int(port)) for port in line.split()]
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.child.terminate()
+        cls.child.wait()
+        cls.child.stdout.close()
+
+    def setUp(self):
+        # accepts connections, but never answers
+        self.silent = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.silent.bind(("127.0.0.1", 0))
+        self.silent.listen(1)
+        self.unreachable = ("127.0.0.1", _free_ports(1)[0])
+        self.collector = EtxCollector(self.nodes + [self.silent.getsockname(),
+                                                    self.unreachable], "/", 0.5)
+
+    def tearDown(self):
+        self.collector.close()
+        self.silent.close()
+
+    def test_conditional_requests(self):
+        first = self.collector.sweep()
+        for number, expected in ((1, OK), (2, NOT_MODIFIED), (3, NOT_MODIFIED)):
+            if number == 1:
+                snapshot = first
+            else:
+                snapshot = self.collector.sweep()
+            statuses = dict([(node["address"], node["status"])
+                             for node in snapshot["nodes"]])
+            for host, port in self.nodes:
+                self.assertEqual(statuses["%s:%s" % (host, port)], expected)
+            # the unchanged documents are reused
+            self.assertEqual(len(snapshot["links"]), NODES * (NODES - 1))
+            self.assertEqual(snapshot["links"], first["links"])
+
+    def test_failed_nodes(self):
+        snapshot = self.collector.sweep()
+        statuses = dict([(node["address"], node["status"]) for node in snapshot["nodes"]])
+        for address in (self.silent.getsockname(), self.unreachable):
+            status = statuses["%s:%s" % address]
+            self.assertTrue(status not in (OK, NOT_MODIFIED))
+            self.assertTrue(status)
+        self.assertEqual(len(snapshot["nodes"]), NODES + 2)
+
+    def test_snapshot_round_trip(self):
+        snapshot = self.collector.sweep()
+        start, links = decode_snapshot(encode_snapshot(snapshot))
+        self.assertEqual(start, snapshot["time"])
+        self.assertEqual(links, snapshot["links"])
+
+
+class SnapshotTest(unittest.TestCase):
+
+    def test_mixed_field_types(self):
+        # the widest type of the values of a field is used
+        snapshot = {"time": 1000.0, "links": [
+            {"number": 1, "mixed": 2, "none": None, "name": "a"},
+            {"number": 2.5, "mixed": "x", "none": None, "name": None},
+            {"number": None, "mixed": None, "none": None, "name": "c"},
+        ]}
+        start, links = decode_snapshot(encode_snapshot(snapshot))
+        self.assertEqual(start, 1000.0)
+        self.assertEqual([link["number"] for link in links], [1.0, 2.5, 0.0])
+        self.assertEqual([link["mixed"] for link in links], ["2", "x", ""])
+        self.assertEqual([link["none"] for link in links], ["", "", ""])
+        self.assertEqual([link["name"] for link in links], ["a", "", "c"])
+
+    def test_malformed_snapshot(self):
+        data = encode_snapshot({"time": 1000.0, "links": [{"name": "a"}]})
+        self.assertRaises(ValueError, decode_snapshot, data[:-1])
+        self.assertRaises(ValueError, decode_snapshot, b"XXXX" + data[4:])
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "_fake":
+        fake_nodes(sys.argv[2], int(sys.argv[3]))
+    else:
+        unittest.main()
@@ -0,0 +1,142 @@
+"""
+Tests of the damping of the published link qualities, see etx_data.py.
+
+"""
+
+import os
+import subprocess
+import sys
+import unittest
+
+from etx_data import EtxData, get_churn
+
+OWN_IP = "10.0.0.1"
+NEIGHBOR = "10.0.0.2"
+
+
+class Clock:
+    """Clock that is advanced by the test.
+
+    """
+    def __init__(self):
+        self.now = 1000.0
+
+    def time(self):
+        return self.now
+
+
+class DampingTest(unittest.TestCase):
+
+    def setUp(self):
+        self.settings = (EtxData.WINDOW, EtxData.INTERVAL, EtxData.MIN_SAMPLES,
+                         EtxData.HYSTERESIS, EtxData.HOLD_DOWN)
+        EtxData.WINDOW = 10
+        EtxData.INTERVAL = 1
+        EtxData.MIN_SAMPLES = 3
+        EtxData.HYSTERESIS = 0.2
+        EtxData.HOLD_DOWN = 5
+        self.clock = Clock()
+        self.data = EtxData(OWN_IP, clock=self.clock.time)
+
+    def tearDown(self):
+        (EtxData.WINDOW, EtxData.INTERVAL, EtxData.MIN_SAMPLES,
+         EtxData.HYSTERESIS, EtxData.HOLD_DOWN) = self.settings
+
+    def receive(self, received):
+        """Receives a probe of the neighbor that has received the given
+        number of our probes and queries the link quality a few times.
+
+        """
+        # one probe per interval
+        self.clock.now = int(self.clock.now) + 1
+        self.data.set_neighbor_info(NEIGHBOR, {OWN_IP: (received, 10)})
+        self.data.add_timestamp(NEIGHBOR, self.clock.now)
+        self.query()
+
+    def query(self):
+        for i in range(3):
+            self.clock.now += 0.1
+            self.data.remove_old_probes()
+
+    def assertCounted(self, before, **counts):
+        after = get_churn()
+        for reason in ("gated", "held_down", "suppressed", "published", "withdrawn"):
+            self.assertEqual(after[reason] - before[reason], counts.get(reason, 0),
+                             "%s: %d instead of %d" % (reason, after[reason] - before[reason],
+                                                       counts.get(reason, 0)))
+
+    def test_gated_counted_once(self):
+        before = get_churn()
+        # the first two probes are below the minimum number of samples
+        self.receive(10)
+        self.receive(10)
+        self.assertEqual(self.data.get_quality(NEIGHBOR), 0)
+        self.assertCounted(before, gated=1)
+        before = get_churn()
+        self.receive(10)
+        self.assertTrue(self.data.get_quality(NEIGHBOR) > 0)
+        self.assertCounted(before, published=1)
+
+    def test_suppressed_counted_once(self):
+        for i in range(10):
+            self.receive(10)
+        self.receive(8)
+        self.receive(8)
+        published = self.data.get_quality(NEIGHBOR)
+        self.assertEqual(published, 0.8)
+        before = get_churn()
+        # a change within the hysteresis is held across several queries
+        self.receive(9)
+        self.receive(9)
+        self.query()
+        self.assertEqual(self.data.get_quality(NEIGHBOR), published)
+        self.assertCounted(before, suppressed=1)
+        # another suppressed quality is counted again
+        before = get_churn()
+        self.receive(7)
+        self.query()
+        self.assertEqual(self.data.get_quality(NEIGHBOR), published)
+        self.assertCounted(before, suppressed=1)
+
+    def test_held_down_counted_once(self):
+        for i in range(10):
+            self.receive(10)
+        before = get_churn()
+        # the neighbor no longer receives our probes
+        self.receive(0)
+        self.assertEqual(self.data.get_quality(NEIGHBOR), 0)
+        self.assertCounted(before, withdrawn=1)
+        before = get_churn()
+        self.receive(10)
+        self.receive(10)
+        self.assertEqual(self.data.get_quality(NEIGHBOR), 0)
+        self.assertCounted(before, held_down=1)
+        # published again after the hold-down
+        before = get_churn()
+        self.clock.now += 5
+        self.receive(10)
+        self.assertTrue(self.data.get_quality(NEIGHBOR) > 0)
+        self.assertCounted(before, published=1)
+
+
+class OptionsTest(unittest.TestCase):
+
+    def run_etxd(self, *args):
+        etxd = subprocess.Popen([sys.executable, os.path.join(os.path.dirname(
+                                 os.path.abspath(__file__)), "etxd.py"), "-f"]
+                                + list(args) + ["nonexistent0"], stderr=subprocess.PIPE)
+        output = etxd.communicate()[1].decode("utf-8", "replace")
+        return etxd.returncode, output
+
+    def test_unreachable_min_samples(self):
+        # 20 samples cannot be received within a window of 10 probes
+        status, output = self.run_etxd("-w", "10", "-i", "1", "-m", "20")
+        self.assertEqual(status, 1)
+        self.assertTrue("Minimum number of samples (20)" in output, output)
+        status, output = self.run_etxd("-w", "10", "-i", "1", "-m", "10")
+        self.assertEqual(status, 1)
+        self.assertTrue("Minimum number of samples" not in output, output)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,41 @@
+"""
+Tests of the neighbor index, see etx_index.py.
+
+"""
+
+import unittest
+
+from etx_index import EtxNeighborIndex
+from etx_worker import EtxDataProxy
+
+
+class NeighborIndexTest(unittest.TestCase):
+
+    def test_addresses_with_the_same_node_id(self):
+        # two addresses of a node on the same interface, one of them expires
+        index = EtxNeighborIndex()
+        proxy = EtxDataProxy("10.0.0.9", "wlan0", index, clock=lambda: 1000.0)
+        r2 = ("10.0.0.2", "02:00:00:00:00:02", "node", 1.0, 1.0, 1.0, 1.0, 0)
+        r3 = ("10.0.0.3", "02:00:00:00:00:03", "node", 1.0, 1.0, 1.0, 1.0, 0)
+        proxy.set_table([r2, r3])
+        self.assertEqual(len(index.get_links("node")), 1)
+        proxy.set_table([r2])
+        self.assertEqual(index.get_links("node"), {"wlan0": ("10.0.0.2", "02:00:00:00:00:02")})
+        self.assertEqual(index.get_node("10.0.0.2"), "node")
+        self.assertEqual(index.get_node("10.0.0.3"), None)
+        proxy.set_table([])
+        self.assertEqual(index.get_nodes(), [])
+        self.assertEqual(index._nodes, {})
+
+    def test_update_after_removed_link(self):
+        index = EtxNeighborIndex()
+        index.update_link("wlan0", "10.0.0.2", None, "node")
+        index.update_link("wlan0", "10.0.0.3", None, "node")
+        index.remove_link("wlan0", "10.0.0.3")
+        index.update_link("wlan0", "10.0.0.2", None, "node")
+        self.assertEqual(index.get_links("node"), {"wlan0": ("10.0.0.2", None)})
+        self.assertEqual(index._nodes, {("wlan0", "10.0.0.2"): "node"})
+
+
+if __name__ == "__main__":
+    unittest.main()
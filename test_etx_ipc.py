@@ -0,0 +1,28 @@
+"""
+Tests of the response encodings of the IPC interface, see etx_ipc.py.
+
+"""
+
+import unittest
+
+from etx_ipc import FIELDS, decode_records, encode_records, encode_text
+
+
+class EncodingTest(unittest.TestCase):
+
+    def test_unencodable_records_are_left_out(self):
+        records = [("wlan0", "10.0.0.2", "02:00:00:00:00:02", "t9-105", 1.25, 2),
+                   ("wlan0", "10.0.0.3", "02:00:00:00:00:03", u"n\xf6de", 1.5, 1),
+                   ("wlan0", "10.0.0.4", "02:00:00:00:00:04", "x" * 256, 2.0, 1),
+                   ("wlan0", "10.0.0.5", "02:00:00:00:00:05", "t9-106", 3.0, 1)]
+        self.assertEqual(encode_text("MPR", records),
+                         b"wlan0|10.0.0.2|02:00:00:00:00:02|t9-105|1.25|2\n"
+                         b"wlan0|10.0.0.4|02:00:00:00:00:04|" + b"x" * 256 + b"|2.0|1\n"
+                         b"wlan0|10.0.0.5|02:00:00:00:00:05|t9-106|3.0|1\n")
+        data = encode_records(FIELDS["MPR"], records)
+        self.assertEqual(decode_records(FIELDS["MPR"], data),
+                         [records[0], records[3]])
+
+
+if __name__ == "__main__":
+    unittest.main()
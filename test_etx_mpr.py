@@ -0,0 +1,33 @@
+"""
+Tests of the selection of the multipoint relays, see etx_mpr.py.
+
+"""
+
+import unittest
+
+from etx_mpr import get_relay_links, select_mpr
+
+
+class RelayLinksTest(unittest.TestCase):
+
+    def test_links_without_probes_are_skipped(self):
+        # a minimum quality of 0 must not select links with a quality of 0
+        neighbors = {"10.0.0.1": 0.0, "10.0.0.2": 0.8, "10.0.0.3": 0.5}
+        twohop = {"10.0.0.1": {"10.0.1.1": 1.0},
+                  "10.0.0.2": {"10.0.1.1": 0.0, "10.0.1.2": 0.7},
+                  "10.0.0.3": {"10.0.1.1": 0.4}}
+        links = get_relay_links(neighbors, twohop, "10.0.0.9", 0)
+        self.assertEqual(sorted(links.keys()), ["10.0.0.2", "10.0.0.3"])
+        self.assertEqual(list(links["10.0.0.2"].keys()), ["10.0.1.2"])
+        self.assertEqual(select_mpr(links), {"10.0.0.2": 1, "10.0.0.3": 1})
+
+    def test_min_quality(self):
+        neighbors = {"10.0.0.1": 0.4, "10.0.0.2": 0.8}
+        twohop = {"10.0.0.1": {"10.0.1.1": 1.0},
+                  "10.0.0.2": {"10.0.1.1": 0.4, "10.0.1.2": 0.5}}
+        links = get_relay_links(neighbors, twohop, "10.0.0.9", 0.5)
+        self.assertEqual(links, {"10.0.0.2": {"10.0.1.2": 1 / 0.8 + 1 / 0.5}})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,158 @@
+"""
+Tests of the probe formats, see etx_probe.py.
+
+"""
+
+import pickle
+import random
+import unittest
+
+from etx_data import EtxData
+from etx_probe import (NODE_ID, WINDOWS, EtxProbeProtocol, check_node_id,
+                       decode_datagram, encode_probe)
+
+MAC = "02:00:00:00:00:01"
+OWN_IP = "10.9.9.9"
+
+
+class _Transport:
+    """Keeps the latest probe that was sent.
+
+    """
+    host = "<broadcast>"
+    port = 0
+
+    def __init__(self):
+        self.datagram = None
+
+    def getHost(self):
+        return self
+
+    def write(self, datagram, addr):
+        self.datagram = memoryview(datagram).tobytes()
+
+
+class Clock:
+    """Clock that is advanced by the test.
+
+    """
+    def __init__(self):
+        self.now = 1000.0
+
+    def time(self):
+        return self.now
+
+
+def pickle_probe(node_id, data):
+    """Returns a probe in the pickle format of older versions.
+
+    """
+    data = dict(data)
+    data[NODE_ID] = node_id
+    return pickle.dumps((MAC, data), 2)
+
+
+class NodeIdTest(unittest.TestCase):
+
+    def test_valid_node_ids(self):
+        self.assertEqual(check_node_id(None), None)
+        self.assertEqual(check_node_id(""), None)
+        self.assertEqual(check_node_id("t9-105"), "t9-105")
+        self.assertEqual(check_node_id(b"t9-105"), "t9-105")
+        self.assertEqual(check_node_id("x" * 255), "x" * 255)
+
+    def test_invalid_node_ids(self):
+        for node_id in (u"n\xf6de", "x" * 256, "a b", "a|b", "a:b", "a\nb", 42):
+            self.assertRaises(ValueError, check_node_id, node_id)
+
+    def test_probes_with_invalid_node_ids(self):
+        data = {"10.0.0.2": (10, 9)}
+        self.assertEqual(decode_datagram(encode_probe(MAC, "t9-105", data)),
+                         (MAC, "t9-105", data))
+        self.assertEqual(decode_datagram(pickle_probe("t9-105", data)),
+                         (MAC, "t9-105", data))
+        for node_id in (u"n\xf6de", "x" * 300, "a|b"):
+            self.assertRaises(ValueError, decode_datagram, pickle_probe(node_id, data))
+        self.assertRaises(ValueError, decode_datagram,
+                          encode_probe(MAC, u"n\xf6de", data))
+
+
+class BufferTest(unittest.TestCase):
+
+    def setUp(self):
+        self.settings = (EtxData.WINDOW, EtxData.INTERVAL, EtxData.MAX_NEIGHBORS,
+                         EtxData.WINDOWS, EtxProbeProtocol.BINARY)
+        EtxData.WINDOW = 10
+        EtxData.INTERVAL = 1
+        EtxData.MAX_NEIGHBORS = 40
+        EtxData.WINDOWS = ()
+        self.clock = Clock()
+
+    def tearDown(self):
+        (EtxData.WINDOW, EtxData.INTERVAL, EtxData.MAX_NEIGHBORS,
+         EtxData.WINDOWS, EtxProbeProtocol.BINARY) = self.settings
+
+    def create_protocol(self):
+        self.data = EtxData(OWN_IP, clock=self.clock.time)
+        protocol = EtxProbeProtocol("wlan0", OWN_IP, self.data, MAC, "node")
+        protocol.transport = _Transport()
+        return protocol
+
+    def receive(self, neighbor, received=10):
+        if self.data.admit_neighbor(neighbor, self.clock.now):
+            self.data.set_neighbor_info(neighbor, {OWN_IP: (received, 10)})
+            self.data.add_timestamp(neighbor, self.clock.now)
+
+    def send(self, protocol):
+        protocol.expire_probes()
+        protocol.send_probe()
+        mac, node_id, data = decode_datagram(protocol.transport.datagram)
+        self.assertEqual((mac, node_id), (MAC, "node"))
+        return data
+
+    def test_pickle_is_default(self):
+        self.assertFalse(EtxProbeProtocol.BINARY)
+        protocol = self.create_protocol()
+        self.receive("10.0.0.2")
+        protocol.send_probe()
+        self.assertEqual(pickle.loads(protocol.transport.datagram)[0], MAC)
+
+    def test_buffer_matches_probe_data(self):
+        for windows in ((), (5, 30)):
+            EtxData.WINDOWS = windows
+            EtxProbeProtocol.BINARY = True
+            random.seed(1)
+            protocol = self.create_protocol()
+            for step in range(2000):
+                self.clock.now += random.random() * 0.2
+                # most neighbors fall silent halfway
+                self.receive("10.0.%d.%d" % (random.randint(0, 1),
+                                             random.randint(1, 40 if step < 1000 else 5)),
+                             random.randint(0, 10))
+                # the link qualities are queried in between
+                if random.random() < 0.3:
+                    self.data.remove_old_probes(self.clock.now)
+                if step % 7 == 0:
+                    data = self.send(protocol)
+                    expected = self.data.get_probe_data()
+                    probe_windows = self.data.get_probe_windows(self.clock.now)
+                    if probe_windows is not None:
+                        expected[WINDOWS] = probe_windows
+                    self.assertEqual(data, expected)
+
+    def test_silent_neighbors_expire(self):
+        EtxProbeProtocol.BINARY = True
+        protocol = self.create_protocol()
+        self.receive("10.0.0.2")
+        self.receive("10.0.0.3")
+        self.assertEqual(sorted(self.send(protocol)), ["10.0.0.2", "10.0.0.3"])
+        # only the probe protocol runs, nobody queries the link qualities
+        for i in range(EtxData.WINDOW + 1):
+            self.clock.now += 1
+            self.receive("10.0.0.3")
+            data = self.send(protocol)
+        self.assertEqual(list(data), ["10.0.0.3"])
+
+
+if __name__ == "__main__":
+    unittest.main()
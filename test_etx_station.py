@@ -0,0 +1,25 @@
+"""
+Tests of the sources of the station dumps, see etx_station.py.
+
+"""
+
+import unittest
+
+from etx_station import FileSource, IwSource, create_source
+
+
+class SourceTest(unittest.TestCase):
+
+    def test_interface_name_in_path(self):
+        self.assertTrue(isinstance(create_source("iw", "wlan0"), IwSource))
+        for spec, path in (("/tmp/dump.%s", "/tmp/dump.wlan0"),
+                           ("/tmp/dump", "/tmp/dump"),
+                           ("/tmp/100%/dump.%s", "/tmp/100%/dump.wlan0"),
+                           ("/tmp/%d/%s.%s", "/tmp/%d/wlan0.wlan0")):
+            source = create_source(spec, "wlan0")
+            self.assertTrue(isinstance(source, FileSource))
+            self.assertEqual(source.path, path)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,137 @@
+"""
+Tests of the probe traces and their replay, see etx_trace.py and
+etx_replay.py.
+
+"""
+
+import os
+import random
+import shutil
+import tempfile
+import unittest
+
+from etx_data import EtxData
+from etx_probe import EtxProbeProtocol, encode_probe
+from etx_replay import VirtualClock, replay
+from etx_trace import SETTINGS, EtxTraceReader, EtxTraceWriter
+
+OWN_IP = "10.255.255.254"
+MAC = "02:00:00:00:00:01"
+
+
+class _Transport:
+    """Discards the sent probes.
+
+    """
+    host = "<broadcast>"
+    port = 0
+
+    def getHost(self):
+        return self
+
+    def write(self, datagram, addr):
+        pass
+
+
+def record_trace(path, num_neighbors, duration):
+    """Records a synthetic trace of neighbors that lose probes at random, a
+    third of them falls silent every other 20 seconds.
+
+    """
+    random.seed(0)
+    trace = EtxTraceWriter(path, max_size=1 << 30)
+    clock = VirtualClock()
+    clock.now = 1.0e9
+    data = EtxData(OWN_IP, clock=clock.time)
+    protocol = EtxProbeProtocol("wlan0", OWN_IP, data, MAC, "node")
+    protocol.transport = _Transport()
+    protocol.trace = trace
+    trace.add_interface(clock.now, "wlan0", OWN_IP, MAC, "node")
+    neighbors = ["10.0.0.%d" % (i + 1) for i in range(num_neighbors)]
+    for second in range(duration):
+        silent = (second // 20) % 2 and neighbors[::3] or []
+        # the probes arrive in the order of their timestamps
+        arrivals = sorted([(random.random() * 0.4, neighbor) for neighbor in neighbors])
+        for phase, neighbor in arrivals:
+            clock.now = 1.0e9 + second + phase
+            if neighbor not in silent and random.random() >= 0.3:
+                probe = encode_probe(MAC, None, {OWN_IP: (random.randint(5, 10), 10)})
+                protocol.datagramReceived(probe, (neighbor, 0))
+        clock.now = 1.0e9 + second + 0.5
+        protocol.send_probe()
+        clock.now = 1.0e9 + second + 0.75
+        protocol.expire_probes()
+    trace.close()
+
+
+class TraceTest(unittest.TestCase):
+
+    def setUp(self):
+        self.settings = dict([(name, getattr(EtxData, name))
+                              for name in SETTINGS + ("WINDOW", "INTERVAL", "WINDOWS")])
+        self.binary = EtxProbeProtocol.BINARY
+        EtxData.WINDOW = 10
+        EtxData.INTERVAL = 1
+        EtxData.WINDOWS = ()
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, "trace")
+
+    def tearDown(self):
+        for name, value in self.settings.items():
+            setattr(EtxData, name, value)
+        EtxProbeProtocol.BINARY = self.binary
+        shutil.rmtree(self.directory)
+
+    def test_settings_are_recorded(self):
+        EtxData.MAX_NEIGHBORS = 5
+        EtxData.MIN_SAMPLES = 3
+        EtxData.HYSTERESIS = 0.1
+        EtxProbeProtocol.BINARY = True
+        EtxTraceWriter(self.path).close()
+        reader = EtxTraceReader(self.path)
+        self.assertEqual(reader.settings["MAX_NEIGHBORS"], 5)
+        self.assertEqual(reader.settings["MIN_SAMPLES"], 3)
+        self.assertAlmostEqual(reader.settings["HYSTERESIS"], 0.1)
+        self.assertTrue(reader.binary)
+        self.assertEqual(list(reader), [])
+        reader.close()
+
+    def test_replay_with_recorded_settings(self):
+        for binary in (False, True):
+            EtxData.MAX_NEIGHBORS = 5
+            EtxData.MIN_SAMPLES = 3
+            EtxProbeProtocol.BINARY = binary
+            record_trace(self.path, 12, 120)
+            # the replay has to restore the settings of the recorded daemon
+            EtxData.MAX_NEIGHBORS = 512
+            EtxData.MIN_SAMPLES = 0
+            EtxProbeProtocol.BINARY = not binary
+            stats = replay([self.path])
+            self.assertEqual(stats["sent"], 120)
+            self.assertEqual(stats["mismatches"], 0)
+            self.assertEqual(EtxData.MAX_NEIGHBORS, 5)
+            self.assertEqual(EtxProbeProtocol.BINARY, binary)
+
+    def test_large_records_are_streamed(self):
+        trace = EtxTraceWriter(self.path, max_size=1 << 30)
+        payloads = [os.urandom(length) for length in
+                    (65535, 1, 0, 65535, 65535, 30000, 65535, 7, 65535)]
+        for i, payload in enumerate(payloads):
+            trace.record_payload(EtxTraceWriter.RECEIVED, 1000.0 + i, "wlan0",
+                                 "10.0.0.%d" % (i + 1), payload)
+        trace.close()
+        # a truncated record at the end is ignored
+        trace_file = open(self.path, "ab")
+        trace_file.write(b"\x01\x00\x00")
+        trace_file.close()
+        reader = EtxTraceReader(self.path)
+        records = list(reader)
+        reader.close()
+        self.assertEqual([record[4] for record in records], payloads)
+        self.assertEqual([record[3] for record in records],
+                         ["10.0.0.%d" % (i + 1) for i in range(len(payloads))])
+        self.assertEqual(records[-1][:3], (EtxTraceWriter.RECEIVED, 1008.0, "wlan0"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,67 @@
+"""
+Tests of the link tables and statistics of the workers, see etx_worker.py.
+
+"""
+
+import unittest
+
+from etx_data import EtxData
+from etx_worker import (EtxDataProxy, EtxTableProtocol, decode_table, encode_table,
+                        sum_worker_stats)
+
+WORKER = ("127.0.0.1", 40000)
+RECORD = ("10.0.0.2", "02:00:00:00:00:02", "t9-105", 0.9, 0.8, 0.72, 1.39, 0)
+
+
+class _Worker:
+    address = WORKER
+
+
+class _Interface:
+    """Minimal stand-in for etxd.Interface in the worker mode.
+
+    """
+    def __init__(self, if_name):
+        self.name = if_name
+        self.data = EtxDataProxy("10.0.0.1", if_name)
+        self.worker = _Worker()
+
+
+class TableTest(unittest.TestCase):
+
+    def setUp(self):
+        self.windows = EtxData.WINDOWS
+        EtxData.WINDOWS = ()
+
+    def tearDown(self):
+        EtxData.WINDOWS = self.windows
+
+    def test_round_trip_with_stats(self):
+        stats = {"churn.gated": 3, "lag.p99": 0.25}
+        if_name, records, decoded = decode_table(encode_table("wlan0", [RECORD], stats))
+        self.assertEqual(if_name, "wlan0")
+        self.assertEqual(len(records), 1)
+        self.assertEqual(records[0][:3], RECORD[:3])
+        self.assertEqual(decoded, stats)
+        self.assertEqual(decode_table(encode_table("wlan0", []))[1:], ([], {}))
+        self.assertRaises(ValueError, decode_table, encode_table("wlan0", [RECORD])[:7])
+
+    def test_stats_of_current_worker(self):
+        interfaces = {"wlan0": _Interface("wlan0"), "wlan1": _Interface("wlan1")}
+        protocol = EtxTableProtocol(interfaces)
+        protocol.datagramReceived(encode_table("wlan0", [RECORD], {"churn.gated": 2,
+                                                                   "lag.p99": 0.5}), WORKER)
+        protocol.datagramReceived(encode_table("wlan1", [RECORD], {"churn.gated": 3,
+                                                                   "schedule.moves": 1}), WORKER)
+        # tables from other addresses are ignored
+        protocol.datagramReceived(encode_table("wlan1", [], {"churn.gated": 100}),
+                                  ("127.0.0.1", 40001))
+        self.assertEqual(interfaces["wlan0"].data.stats, {"churn.gated": 2, "lag.p99": 0.5})
+        self.assertEqual(list(interfaces["wlan1"].data.get_neighbors()), ["10.0.0.2"])
+        self.assertEqual(sum_worker_stats(interfaces, "churn", {"gated": 0, "published": 0}),
+                         {"gated": 5, "published": 0})
+        self.assertEqual(sum_worker_stats(interfaces, "schedule", {}), {"moves": 1})
+
+
+if __name__ == "__main__":
+    unittest.main()